@@ -114,6 +114,15 @@ class ApplyPage(ttk.Frame):
             style='Select.TButton'  # 使用绿色按钮样式
         )
         self.output_btn.pack(side=tk.LEFT)
+        
+        # 填充模式：按相对位置为输出区域的每个单元格生成公式
+        self.fill_var = tk.BooleanVar(value=False)
+        self.fill_check = ttk.Checkbutton(
+            range_frame,
+            text="按行/列相对填充",
+            variable=self.fill_var
+        )
+        self.fill_check.pack(anchor=tk.W, pady=(5,0))
     
     def bind_events(self, callbacks):
         """绑定事件回调"""
@@ -149,22 +158,13 @@ class ApplyPage(ttk.Frame):
             self.after(100)
             
             if 'on_range_selected' in self.callbacks:
-                if self.callbacks['on_range_selected'](mode):
-                    # 选择成功后恢复窗口
-                    active_window.deiconify()
-                    active_window.lift()
-                    
-                    # 更新状态栏
-                    if 'on_status_update' in self.callbacks:
-                        area_type = "输入" if mode == 'input' else "输出"
-                        self.callbacks['on_status_update'](f"已选择{area_type}区域")
-                else:
-                    # 选择失败也要恢复窗口
-                    active_window.deiconify()
-                    active_window.lift()
-                    
-                    if 'on_status_update' in self.callbacks:
-                        self.callbacks['on_status_update']("选择区域失败")
+                # 选区在工作线程中读取，完成后再恢复窗口
+                self.callbacks['on_range_selected'](
+                    mode,
+                    on_done=lambda success: self.finish_select(mode, active_window, success)
+                )
+            else:
+                self.finish_select(mode, active_window, False)
                     
         except Exception as e:
             print(f"选择区域失败: {str(e)}")
@@ -172,6 +172,23 @@ class ApplyPage(ttk.Frame):
             active_window.deiconify()
             active_window.lift()
     
+    def finish_select(self, mode, window, success):
+        """选择区域完成后恢复窗口并更新状态栏
+        Args:
+            mode: 选择模式('input'/'output')
+            window: 选择前最小化的窗口
+            success: 是否选择成功
+        """
+        window.deiconify()
+        window.lift()
+        
+        if 'on_status_update' in self.callbacks:
+            if success:
+                area_type = "输入" if mode == 'input' else "输出"
+                self.callbacks['on_status_update'](f"已选择{area_type}区域")
+            else:
+                self.callbacks['on_status_update']("选择区域失败")
+    
     def update_range_display(self):
         """更新区域显示"""
         if self.input_range:
@@ -179,21 +196,24 @@ class ApplyPage(ttk.Frame):
         if self.output_range:
             self.output_var.set(self.output_range.Address)
     
-    def update_selection(self, range_obj, mode='input'):
+    def update_selection(self, range_obj, mode='input', address=None):
         """更新选择区域
         Args:
             range_obj: 选择的区域对象
             mode: 选择模式('input'/'output')
+            address: 区域地址，COM对象只能在工作线程中访问，由调用方预先读取
         """
         try:
+            if address is None:
+                address = range_obj.Address
             if mode == 'input':
                 self.input_range = range_obj
-                self.input_var.set(range_obj.Address)
+                self.input_var.set(address)
                 # 启用输出区域选择按钮，但不禁用输入区域选择
                 self.output_btn['state'] = 'normal'
             else:
                 self.output_range = range_obj
-                self.output_var.set(range_obj.Address)
+                self.output_var.set(address)
             
             # 如果已选择输入区域，启用应用按钮
             if self.input_range:
@@ -222,7 +242,8 @@ class ApplyPage(ttk.Frame):
             self.callbacks['on_apply'](
                 self.current_formula,
                 self.input_range,
-                self.output_range
+                self.output_range,
+                'r1c1' if self.fill_var.get() else None
             )
     
     def update_formula_info(self, formula: Dict):
@@ -1,6 +1,11 @@
 import tkinter as tk
 from tkinter import ttk
 from typing import List, Dict
+from .tree_reconciler import TreeReconciler, tree_node
+from .search_worker import SearchWorker
+
+# 未展开的分类下的占位行，展开时替换为公式
+PLACEHOLDER_TEXT = '加载中...'
 
 class FormulaPage(ttk.Frame):
     """公式列表页面"""
@@ -14,6 +19,25 @@ class FormulaPage(ttk.Frame):
         # 初始化事件回调
         self.callbacks = {}
         
+        # 上一次的搜索词和结果，追加输入时在结果中继续筛选
+        self.last_query = ''
+        self.last_results = None
+        # 列表显示的是全部公式(而不是搜索结果)
+        self.showing_all = False
+        
+        # 后台搜索，界面线程只提交请求并定时取回结果
+        self.search_worker = SearchWorker(self.run_search)
+        self.pending_query = None
+        self.poll_after_id = None
+        
+        # 已生成公式行的分类，其余分类只有占位行
+        self.loaded_categories = set()
+        
+        # 分页显示的搜索结果
+        self.search_results = []
+        self.search_shown = 0
+        self.load_more_item = None
+        
         # 创建界面组件
         self.create_widgets()
         
@@ -184,12 +208,27 @@ class FormulaPage(ttk.Frame):
             'even_row',
             background='#f8f9fa'
         )
+        self.formula_tree.tag_configure(
+            'placeholder',
+            foreground='#9e9e9e'
+        )
+        self.formula_tree.tag_configure(
+            'load_more',
+            foreground='#1976d2'
+        )
         
         # 绑定事件
         self.search_entry.bind('<KeyRelease>', self.on_search)
         self.search_var.trace('w', self.on_search_changed)
         self.formula_tree.bind('<Double-1>', self.on_formula_double_click)
         self.formula_tree.bind('<<TreeviewSelect>>', self.on_formula_select)
+        self.formula_tree.bind('<<TreeviewOpen>>', self.on_tree_open)
+        
+        # 按公式保持固定的项目ID，只更新有变化的行
+        # formula.log_tree_updates 打开时以INFO级别记录每次更新的节点数和耗时
+        self.reconciler = TreeReconciler(
+            self.formula_tree, log_stats=self.config.get('formula.log_tree_updates', False)
+        )
 
     def bind_events(self, callbacks):
         """绑定事件回调"""
@@ -209,7 +248,7 @@ class FormulaPage(ttk.Frame):
             self.after_cancel(self.search_after_id)
         
         # 设置新的延迟搜索
-        delay = self.config.get('formula.search_delay', 500)
+        delay = self.config.get('formula.search_delay', 30)
         self.search_after_id = self.after(delay, self.do_search)
 
     def do_search(self):
@@ -217,69 +256,126 @@ class FormulaPage(ttk.Frame):
         try:
             search_text = self.search_var.get().strip().lower()
             
-            # 清空当前显示
-            for item in self.formula_tree.get_children():
-                self.formula_tree.delete(item)
+            # 搜索词没有变化(例如只移动了光标)
+            if self.pending_query is None:
+                if search_text == self.last_query and self.last_results is not None:
+                    return
+            elif search_text == self.pending_query:
+                return
             
             if not search_text:
-                # 如果搜索框为空，显示所有公式
-                self.refresh_formula_list()
+                # 如果搜索框为空，显示所有公式；已经显示时不重建，以免收起用户展开的分类
+                if not self.showing_all:
+                    self.refresh_formula_list()
                 return
             
-            # 搜索公式
-            categories = self.formula_manager.get_categories()
-            row_count = 0
-            for category in categories:
-                category_items = []
-                formulas = self.formula_manager.get_formulas(category)
-                
-                for formula in formulas:
-                    # 处理不同的公式数据格式
-                    if isinstance(formula, dict):
-                        name = formula.get('name', '').lower()
-                        description = formula.get('description', '').lower()
-                    else:
-                        name = formula.lower()
-                        description = self.formula_manager.get_formula_description(formula).lower()
-                    
-                    # 如果公式名称或描述包含搜索文本
-                    if search_text in name or search_text in description:
-                        category_items.append(formula)
-                
-                # 如果该分类下有匹配的公式
-                if category_items:
-                    # 添加分类节点
-                    category_id = self.formula_tree.insert(
-                        '', 'end',
-                        text=category,
-                        tags=('category',)
-                    )
-                    
-                    # 添加匹配的公式
-                    for formula in category_items:
-                        row_count += 1
-                        row_tags = ('formula', 'odd_row' if row_count % 2 else 'even_row')
-                        
-                        if isinstance(formula, dict):
-                            name = formula.get('name', '')
-                            description = formula.get('description', '')
-                        else:
-                            name = formula
-                            description = self.formula_manager.get_formula_description(formula)
-                        
-                        self.formula_tree.insert(
-                            category_id, 'end',
-                            text=name,
-                            values=(description,),
-                            tags=row_tags
-                        )
-                    
-                    # 展开分类
-                    self.formula_tree.item(category_id, open=True)
+            # 在上次的搜索词后追加输入时，结果只会减少，只需在上次的结果中筛选
+            candidates = None
+            if self.last_results is not None and self.last_query and search_text.startswith(self.last_query):
+                candidates = [formula['name'] for formula in self.last_results]
+            
+            # 交给后台线程搜索，之前未完成的搜索作废
+            self.pending_query = search_text
+            self.showing_all = False
+            self.search_worker.submit(search_text, candidates)
+            self.schedule_poll()
             
         except Exception as e:
             print(f"搜索失败: {str(e)}")
 
+    def run_search(self, search_text: str, candidates=None) -> List[Dict]:
+        """在后台线程中执行搜索，不能访问界面组件
+        Args:
+            search_text: 搜索词
+            candidates: 只在这些公式名称中搜索（可选）
+        """
+        # 通过全文索引搜索，结果已按相关度排序
+        results = self.formula_manager.search_formulas(search_text, candidates)
+        if candidates is not None and not results:
+            # 上次的结果中没有精确匹配时，回到全部公式中模糊匹配
+            results = self.formula_manager.search_formulas(search_text)
+        return results
+
+    def schedule_poll(self):
+        """定时取回后台搜索的结果"""
+        if self.poll_after_id is None:
+            interval = self.config.get('formula.search_poll_interval', 15)
+            self.poll_after_id = self.after(interval, self.poll_search)
+
+    def poll_search(self):
+        """取回最新一次搜索的结果并显示"""
+        self.poll_after_id = None
+        try:
+            result = self.search_worker.poll()
+            if result is None:
+                if self.search_worker.busy():
+                    self.schedule_poll()
+                return
+            
+            search_text, results = result
+            self.pending_query = None
+            self.last_query = search_text
+            self.last_results = results
+            self.show_search_results(results)
+            
+        except Exception as e:
+            print(f"显示搜索结果失败: {str(e)}")
+
+    def cancel_search(self):
+        """作废未完成的搜索"""
+        self.search_worker.cancel()
+        self.pending_query = None
+        if self.poll_after_id is not None:
+            self.after_cancel(self.poll_after_id)
+            self.poll_after_id = None
+
+    def show_search_results(self, results: List[Dict]):
+        """显示搜索结果，每次只生成一页
+        Args:
+            results: 按相关度排序的公式列表，分类按其中最相关的公式排序
+        """
+        self.search_results = results
+        self.search_shown = 0
+        self.show_more_results()
+
+    def show_more_results(self):
+        """显示下一页搜索结果"""
+        page_size = self.config.get('formula.page_size', 200)
+        shown_before = self.search_shown
+        self.search_shown = min(self.search_shown + page_size, len(self.search_results))
+        
+        # 按分类分组，分类按其中最相关的公式排序
+        groups = {}
+        for formula in self.search_results[:self.search_shown]:
+            groups.setdefault(formula['category'], []).append(formula)
+        
+        nodes = [
+            self.category_node(category, self.formula_nodes(category, formulas), open=True)
+            for category, formulas in groups.items()
+        ]
+        
+        # 还有未显示的结果
+        remaining = len(self.search_results) - self.search_shown
+        if remaining > 0:
+            nodes.append(tree_node(
+                ('load_more',),
+                f"加载更多 (还有{remaining}个)",
+                tags=('load_more',)
+            ))
+        
+        self.reconciler.reconcile(nodes)
+        self.load_more_item = self.reconciler.item_id(('load_more',)) if remaining > 0 else None
+        
+        # "加载更多"行的ID不变，保持选中时再次点击不会触发<<TreeviewSelect>>；
+        # 取消选中，并把焦点移到第一个新加载的公式(不选中，以免进入应用页面)
+        if shown_before > 0:
+            self.formula_tree.selection_remove(self.formula_tree.selection())
+            first = self.search_results[shown_before]
+            item = self.reconciler.item_id(('formula', first['category'], first['name']))
+            if item:
+                self.formula_tree.focus(item)
+                self.formula_tree.see(item)
+
     def on_formula_selected(self, event):
         """公式选择事件处理"""
         try:
@@ -290,9 +386,15 @@ class FormulaPage(ttk.Frame):
             
             # 获取选中项的信息
             item = selection[0]
+            item_tags = self.formula_tree.item(item)['tags']
             
-            # 如果点击的是公式（有父节点）
-            if self.formula_tree.parent(item):
+            # 点击"加载更多"时显示下一页
+            if 'load_more' in item_tags:
+                self.show_more_results()
+                return
+            
+            # 如果点击的是公式(不是分类或占位行)
+            if 'formula' in item_tags:
                 formula_name = self.formula_tree.item(item)['text']
                 if 'on_formula_selected' in self.callbacks:
                     self.callbacks['on_formula_selected'](formula_name)
@@ -364,38 +466,11 @@ class FormulaPage(ttk.Frame):
             formulas: 公式列表
         """
         try:
-            # 清空现有项目
-            self.formula_tree.delete(*self.formula_tree.get_children())
-            
-            if not formulas:
-                return
-            
-            # 按分类组织公式
-            categories = {}
-            for formula in formulas:
-                category = formula['category']
-                if category not in categories:
-                    categories[category] = []
-                categories[category].append(formula)
+            # 未完成的搜索结果不再显示
+            self.cancel_search()
             
-            # 添加到树形视图
-            for category, formula_list in categories.items():
-                category_id = self.formula_tree.insert(
-                    '', 'end',
-                    text=category,
-                    tags=('category',)
-                )
-                
-                for formula in formula_list:
-                    self.formula_tree.insert(
-                        category_id, 'end',
-                        text=formula['name'],
-                        values=(formula['description'],),
-                        tags=('formula',)
-                    )
-                    
-                # 展开分类
-                self.formula_tree.item(category_id, open=True)
+            # 与搜索结果相同，分页显示
+            self.show_search_results(formulas or [])
             
         except Exception as e:
             print(f"更新公式列表失败: {str(e)}")
@@ -410,61 +485,159 @@ class FormulaPage(ttk.Frame):
         """隐藏页面"""
         self.pack_forget()
 
+    def close(self):
+        """停止后台搜索"""
+        self.cancel_search()
+        self.search_worker.close()
+
     def refresh_formula_list(self):
-        """刷新公式列表"""
+        """刷新公式列表
+        
+        未展开的分类只有一个占位行，分类下的公式在展开时才生成。
+        """
         try:
-            # 清空现有项目
-            for item in self.formula_tree.get_children():
-                self.formula_tree.delete(item)
-            
-            # 获取所有分类
-            categories = self.formula_manager.get_categories()
-            if not categories:
-                print("没有找到公式分类")
-                return
+            # 公式可能已经修改，上次的搜索结果作废
+            self.cancel_search()
+            self.last_query = ''
+            self.last_results = None
+            self.search_results = []
+            self.search_shown = 0
+            self.load_more_item = None
             
-            # 添加分类和公式
-            row_count = 0
-            for category in categories:
-                # 添加分类
-                category_id = self.formula_tree.insert(
-                    '', 'end',
-                    text=category,
-                    tags=('category',)
-                )
-                
-                # 获取该分类下的公式
-                formulas = self.formula_manager.get_formulas(category)
-                if not formulas:
-                    continue
-                
-                # 添加公式
-                for formula in formulas:
-                    row_count += 1
-                    row_tags = ('formula', 'odd_row' if row_count % 2 else 'even_row')
-                    
-                    # 处理不同的公式数据格式
-                    if isinstance(formula, dict):
-                        name = formula.get('name', '')
-                        description = formula.get('description', '')
-                    else:
-                        name = formula
-                        description = self.formula_manager.get_formula_description(formula)
-                    
-                    self.formula_tree.insert(
-                        category_id, 'end',
-                        text=name,
-                        values=(description,),
-                        tags=row_tags
-                    )
-                
-                # 根据配置决定是否自动展开
-                if self.config.get('formula.auto_expand', True):
-                    self.formula_tree.item(category_id, open=True)
+            self.show_categories(reset=True)
+            self.showing_all = True
                 
         except Exception as e:
             print(f"刷新公式列表失败: {str(e)}")
 
+    def show_categories(self, reset: bool = False):
+        """按分类显示全部公式
+        Args:
+            reset: 是否按配置重新自动展开靠前的分类，否则保持各分类的展开状态
+        """
+        # 获取所有分类
+        categories = self.formula_manager.get_categories()
+        if not categories:
+            print("没有找到公式分类")
+        
+        # 根据配置自动展开靠前的分类，展开的公式总数不超过一页
+        budget = self.config.get('formula.page_size', 200)
+        if not reset or not self.config.get('formula.auto_expand', True):
+            budget = 0
+        
+        self.loaded_categories &= set(categories)
+        nodes = []
+        for category in categories:
+            expand = budget > 0
+            if expand:
+                self.loaded_categories.add(category)
+            
+            if category in self.loaded_categories:
+                children = self.formula_nodes(category, self.formula_manager.get_formulas(category))
+                budget -= len(children)
+            else:
+                children = [self.placeholder_node(category)]
+            
+            nodes.append(self.category_node(category, children, open=expand if reset else None))
+        
+        self.reconciler.reconcile(nodes)
+
+    def category_node(self, category: str, children: List[Dict], open=None) -> Dict:
+        """分类节点"""
+        return tree_node(
+            ('category', category),
+            category,
+            tags=('category',),
+            children=children,
+            open=open
+        )
+
+    def placeholder_node(self, category: str) -> Dict:
+        """未展开分类下的占位行"""
+        return tree_node(
+            ('placeholder', category),
+            PLACEHOLDER_TEXT,
+            tags=('placeholder',)
+        )
+
+    def formula_nodes(self, category: str, formulas: List) -> List[Dict]:
+        """分类下的公式行
+        Args:
+            category: 分类名称
+            formulas: 公式名称或公式字典的列表
+        """
+        nodes = []
+        names = set()
+        for formula in formulas:
+            # 处理不同的公式数据格式
+            if isinstance(formula, dict):
+                name = formula.get('name', '')
+                description = formula.get('description', '')
+            else:
+                name = formula
+                description = self.formula_manager.get_formula_description(formula)
+            
+            # 同名公式只显示第一个
+            if name in names:
+                continue
+            names.add(name)
+            
+            row = len(nodes) + 1
+            nodes.append(tree_node(
+                ('formula', category, name),
+                name,
+                values=(description,),
+                tags=('formula', 'odd_row' if row % 2 else 'even_row')
+            ))
+        return nodes
+
+    def populate_category(self, category: str) -> int:
+        """生成分类下的公式行
+        Returns:
+            int: 生成的行数，已生成过时为0
+        """
+        if category in self.loaded_categories:
+            return 0
+        self.loaded_categories.add(category)
+        
+        # 替换占位行
+        nodes = self.formula_nodes(category, self.formula_manager.get_formulas(category))
+        self.reconciler.reconcile(nodes, parent_key=('category', category))
+        return len(nodes)
+
+    def on_tree_open(self, event=None):
+        """展开分类时生成其中的公式"""
+        item = self.formula_tree.focus()
+        key = self.reconciler.key_of(item) if item else None
+        if not key or key[0] != 'category':
+            return
+        
+        # 只有占位行的分类才需要生成，搜索结果中的分类已有匹配的公式
+        children = self.formula_tree.get_children(item)
+        if len(children) == 1 and self.reconciler.key_of(children[0]) == ('placeholder', key[1]):
+            self.populate_category(key[1])
+
+    def apply_formula_changes(self, changes: Dict[str, List[str]]):
+        """公式库重新载入后更新列表，只有变化的行会被修改
+        Args:
+            changes: FormulaManager.check_for_changes的结果
+        """
+        try:
+            # 正在搜索时重新搜索
+            if self.search_var.get().strip():
+                self.cancel_search()
+                self.last_query = ''
+                self.last_results = None
+                self.do_search()
+                return
+            
+            # 保持各分类的展开状态
+            self.show_categories()
+            
+        except Exception as e:
+            print(f"更新公式列表失败: {str(e)}")
+            self.refresh_formula_list()
+
     def on_search_changed(self, *args):
         """搜索框内容变化时的处理"""
         # 显示/隐藏清除按钮
@@ -514,6 +687,11 @@ class FormulaPage(ttk.Frame):
             
             item_tags = self.formula_tree.item(item)['tags']
             
+            # 双击"加载更多"时显示下一页
+            if 'load_more' in item_tags:
+                self.show_more_results()
+                return
+            
             # 如果双击的是公式而不是分类
             if 'formula' in item_tags:
                 formula_name = self.formula_tree.item(item)['text']
@@ -1,19 +1,26 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 from utils.formula_manager import FormulaManager
+from utils.sqlite_formula_manager import SqliteFormulaManager
 from utils.excel_manager import ExcelManager
+from utils.xlsx_backend import XlsxManager
 from .window_manager import WindowManager
 from .status_manager import StatusManager
 from .toolbar_manager import ToolbarManager
 from utils.history_manager import HistoryManager
+from utils.com_worker import ComWorker
+from utils.com_profiler import ComStats
 from .formula_page import FormulaPage
 from .apply_page import ApplyPage
 import os
 import sys
+import time
 import logging
+import threading
+from collections import deque
 
 class MainWindow(WindowManager):
-    def __init__(self, root, config):
+    def __init__(self, root, config, profile_com=False):
         super().__init__(root, config)
         
         # 设置窗口属性
@@ -22,15 +29,35 @@ class MainWindow(WindowManager):
         # 添加置顶状态变量
         self.is_topmost = tk.BooleanVar(value=False)
         
+        # 记录启动各阶段耗时
+        start = time.perf_counter()
+        
+        # Excel操作都在COM工作线程中执行，界面线程只提交操作并在完成后回调
+        self.com_worker = ComWorker()
+        self.excel_jobs = deque()
+        self.excel_poll_id = None
+        self.excel_progress = None
+        self.excel_progress_text = ''
+        self.cancel_event = threading.Event()
+        self.excel_connected = False
+        self.status_future = None
+        
+        # 按成员统计COM调用(命令行 --profile-com 或配置 excel.profile_com)
+        self.com_stats = None
+        if profile_com or self.config.get('excel.profile_com', False):
+            self.com_stats = ComStats()
+        
         # 初始化管理器
-        self.excel_manager = ExcelManager()
-        self.formula_manager = FormulaManager()
-        self.history_manager = HistoryManager()
+        self.excel_manager = self.create_excel_manager()
+        self.formula_manager = self.create_formula_manager()
+        formula_time = time.perf_counter()
+        self.history_manager = HistoryManager(self.config)
         self.toolbar_manager = ToolbarManager(root)  # 先创建工具栏
         self.status_manager = StatusManager(root)    # 再创建状态栏
         
-        # 初始化页面
+        # 初始化页面(FormulaPage创建时已生成公式列表)
         self.init_pages()
+        pages_time = time.perf_counter()
         
         # 绑定工具栏命令
         self.toolbar_manager.bind_commands({
@@ -45,12 +72,177 @@ class MainWindow(WindowManager):
         # 绑定事件
         self.bind_events()
         
-        # 显示公式列表页面并刷新
+        # 显示公式列表页面
         self.show_formula_page()
-        self.formula_page.refresh_formula_list()
         
         # 创建置顶按钮
         self.create_pin_button()
+        
+        # 统计COM调用时显示调试菜单
+        if self.com_stats:
+            self.create_debug_menu()
+        
+        # 定时检查formulas.json是否被其他人修改
+        self.reload_after_id = None
+        self.schedule_formula_reload()
+        
+        end = time.perf_counter()
+        logging.info(
+            "启动耗时: 公式库 %.1f ms(%s), 页面 %.1f ms, 其他 %.1f ms, 合计 %.1f ms",
+            (formula_time - start) * 1000,
+            '缓存' if getattr(self.formula_manager, 'cache_hit', False) else '解析',
+            (pages_time - formula_time) * 1000,
+            (end - pages_time) * 1000,
+            (end - start) * 1000
+        )
+    
+    def create_excel_manager(self):
+        """根据配置创建工作簿后端"""
+        # 'xlsx' 后端直接读写文件，不需要安装Excel
+        if self.config.get('excel.backend', 'com') == 'xlsx':
+            return XlsxManager()
+        return ExcelManager(com_stats=self.com_stats)
+    
+    def create_formula_manager(self):
+        """根据配置创建公式管理器"""
+        # 'sqlite' 存储适合很大的共享公式库，按需读取
+        if self.config.get('formula.store', 'json') == 'sqlite':
+            return SqliteFormulaManager(self.config.get('formula.database'))
+        return FormulaManager()
+    
+    def schedule_formula_reload(self):
+        """安排下一次检查公式库文件"""
+        interval = self.config.get('formula.reload_interval', 2000)
+        if interval and interval > 0:
+            self.reload_after_id = self.root.after(interval, self.check_formula_file)
+    
+    def check_formula_file(self):
+        """公式库文件被修改时重新载入，只更新有变化的公式"""
+        try:
+            changes = self.formula_manager.check_for_changes()
+            if changes:
+                self.formula_page.apply_formula_changes(changes)
+                self.status_manager.update_status(
+                    f"公式库已更新: 新增{len(changes['added'])}个, "
+                    f"删除{len(changes['removed'])}个, 修改{len(changes['changed'])}个"
+                )
+                logging.info(
+                    "重新载入公式库: 新增 %d, 删除 %d, 修改 %d",
+                    len(changes['added']), len(changes['removed']), len(changes['changed'])
+                )
+                if changes.get('conflicts'):
+                    # 双方都修改的公式保留本地版本，保存时会覆盖文件中的版本
+                    conflicts = ', '.join(changes['conflicts'])
+                    logging.warning(f"公式库被外部修改，保留本地修改: {conflicts}")
+                    self.status_manager.update_status(f"公式库修改冲突，已保留本地修改: {conflicts}")
+        except Exception as e:
+            logging.error(f"检查公式库失败: {str(e)}")
+        finally:
+            self.schedule_formula_reload()
+    
+    def run_excel(self, func, *args, status=None, on_done=None, on_error=None, cancellable=False):
+        """在COM工作线程中执行Excel操作
+        Args:
+            func: 操作函数，在工作线程中执行
+            *args: 函数参数
+            status: 执行期间状态栏显示的文字，为None时不显示
+            on_done: 完成后在界面线程中调用，参数为返回值
+            on_error: 出错后在界面线程中调用，参数为异常
+            cancellable: 是否显示取消按钮，操作需要检查cancel_event
+        Returns:
+            Future
+        """
+        future = self.com_worker.submit(func, *args)
+        self.excel_jobs.append({
+            'future': future,
+            'status': status,
+            'on_done': on_done,
+            'on_error': on_error,
+            'cancellable': cancellable,
+            'start': time.perf_counter()
+        })
+        if status:
+            self.excel_progress = None
+            self.excel_progress_text = ''
+            self.status_manager.update_status(f"{status}...", 0)
+        self.schedule_excel_poll()
+        return future
+    
+    def schedule_excel_poll(self):
+        """安排检查Excel操作是否完成"""
+        if self.excel_poll_id is None:
+            interval = self.config.get('excel.poll_interval', 50)
+            self.excel_poll_id = self.root.after(interval, self.poll_excel_jobs)
+    
+    def poll_excel_jobs(self):
+        """处理已完成的Excel操作，显示正在执行的操作的进度"""
+        self.excel_poll_id = None
+        
+        # 工作线程按提交顺序执行，完成的顺序也相同
+        while self.excel_jobs and self.excel_jobs[0]['future'].done():
+            job = self.excel_jobs.popleft()
+            elapsed = (time.perf_counter() - job['start']) * 1000
+            try:
+                result = job['future'].result()
+            except Exception as e:
+                logging.error(f"Excel操作失败: {str(e)}")
+                if job['on_error']:
+                    job['on_error'](e)
+                elif job['status']:
+                    self.status_manager.update_status(f"{job['status']}失败", 0)
+                continue
+            
+            if job['status']:
+                logging.info(f"{job['status']}: 耗时 {elapsed:.0f} ms")
+                self.status_manager.update_status(f"{job['status']}完成", 100)
+            if job['on_done']:
+                try:
+                    job['on_done'](result)
+                except Exception as e:
+                    print(f"处理Excel操作结果失败: {str(e)}")
+        
+        if not self.excel_jobs or not self.excel_jobs[0]['cancellable']:
+            self.status_manager.hide_cancel()
+        if not self.excel_jobs:
+            return
+        
+        # 正在执行的操作
+        job = next((job for job in self.excel_jobs if job['status']), None)
+        if job:
+            elapsed = time.perf_counter() - job['start']
+            waiting = sum(1 for other in self.excel_jobs if other['status']) - 1
+            text = f"{job['status']}... {elapsed:.1f}秒"
+            if self.excel_progress_text:
+                text += f" {self.excel_progress_text}"
+            if waiting:
+                text += f" (还有{waiting}个操作等待)"
+            if self.cancel_event.is_set():
+                text += " 正在取消..."
+            self.status_manager.update_status(text, self.excel_progress)
+        if self.excel_jobs[0]['cancellable'] and self.excel_jobs[0]['future'].running():
+            self.status_manager.show_cancel(self.cancel_excel)
+        self.schedule_excel_poll()
+    
+    def report_progress(self, percent: int, text: str = ''):
+        """在工作线程中报告当前操作的进度，由界面线程定时显示
+        Args:
+            percent: 进度(0-100)
+            text: 附加说明，例如处理速度
+        """
+        self.excel_progress = percent
+        self.excel_progress_text = text
+    
+    def cancel_excel(self):
+        """取消正在执行的可取消操作"""
+        if any(job['cancellable'] for job in self.excel_jobs):
+            self.cancel_event.set()
+    
+    def excel_busy(self) -> bool:
+        """是否有修改Excel的操作尚未完成"""
+        if any(job['status'] for job in self.excel_jobs):
+            self.status_manager.update_status("Excel正在处理，请稍候")
+            return True
+        return False
     
     def init_pages(self):
         """初始化页面"""
@@ -109,6 +301,7 @@ class MainWindow(WindowManager):
         self.root.bind('<Control-Shift-Z>', lambda e: self.reset())
         self.root.bind('<Control-o>', lambda e: self.open_excel_file())
         self.root.bind('<Control-r>', lambda e: self.refresh_workbooks())
+        self.root.bind('<Escape>', lambda e: self.cancel_excel())
     
     def create_tooltips(self):
         """创建工具提示"""
@@ -129,7 +322,7 @@ class MainWindow(WindowManager):
         """打开Excel文件"""
         try:
             # 如果已经连接，询问是否关闭当前文件
-            if self.excel_manager.is_connected():
+            if self.excel_connected:
                 if messagebox.askyesno(
                     "提示", 
                     "是否关闭当前打开的Excel文件？\n"
@@ -137,7 +330,8 @@ class MainWindow(WindowManager):
                     "选择“否”保持当前文件打开。",
                     parent=self.root
                 ):
-                    self.excel_manager.disconnect()
+                    self.run_excel(self.excel_manager.disconnect)
+                    self.excel_connected = False
                     # 更新工具栏状态
                     self.toolbar_manager.update_excel_status(False)
                     self.toolbar_manager.update_workbook_list({})
@@ -155,35 +349,46 @@ class MainWindow(WindowManager):
                 # 更新最近文件列表
                 self.update_recent_files(file_path)
                 
-                # 打开Excel文件
-                if self.excel_manager.open_file(file_path):
-                    # 刷新工作簿列表
-                    workbooks = self.excel_manager.refresh_workbooks()
-                    if workbooks:
-                        self.toolbar_manager.update_workbook_list(workbooks)
-                        self.toolbar_manager.update_excel_status(True)
-                        self.status_manager.update_status(f"已打开: {os.path.basename(file_path)}")
-                        
-                        # 显示提示对话框
-                        messagebox.showinfo(
-                            "提示",
-                            "Excel文件已打开，请从左侧列表选择要使用的公式。\n"
-                            "双击公式可以直接应用。",
-                            parent=self.root
-                        )
-                    else:
-                        self.status_manager.update_status("打开Excel文件失败")
-                else:
-                    self.status_manager.update_status("打开Excel文件失败")
+                # 在工作线程中打开Excel文件并刷新工作簿列表
+                self.run_excel(
+                    self.open_workbooks, file_path,
+                    status=f"正在打开 {os.path.basename(file_path)}",
+                    on_done=lambda workbooks: self.on_file_opened(file_path, workbooks),
+                    on_error=lambda e: self.status_manager.update_status("打开Excel文件失败")
+                )
             
         except Exception as e:
             print(f"打开文件失败: {str(e)}")
             self.status_manager.update_status("打开文件失败")
 
+    def open_workbooks(self, file_path):
+        """打开文件并返回工作簿列表(在工作线程中执行)"""
+        if not self.excel_manager.open_file(file_path):
+            return {}
+        return dict(self.excel_manager.refresh_workbooks())
+
+    def on_file_opened(self, file_path, workbooks):
+        """文件打开完成"""
+        if workbooks:
+            self.excel_connected = True
+            self.toolbar_manager.update_workbook_list(workbooks)
+            self.toolbar_manager.update_excel_status(True)
+            self.status_manager.update_status(f"已打开: {os.path.basename(file_path)}")
+            
+            # 显示提示对话框
+            messagebox.showinfo(
+                "提示",
+                "Excel文件已打开，请从左侧列表选择要使用的公式。\n"
+                "双击公式可以直接应用。",
+                parent=self.root
+            )
+        else:
+            self.status_manager.update_status("打开Excel文件失败")
+
     def refresh_workbooks(self):
         """刷新工作簿列表"""
         try:
-            if not self.excel_manager.is_connected():
+            if not self.excel_connected:
                 messagebox.showwarning(
                     "提示",
                     "请先打开Excel文件",
@@ -191,51 +396,61 @@ class MainWindow(WindowManager):
                 )
                 return
             
-            workbooks = self.excel_manager.refresh_workbooks()
-            if workbooks:
-                self.toolbar_manager.update_workbook_list(workbooks)
-                self.status_manager.update_status("工作簿列表已刷新")
-                
-                # 如果在应用公式页面，清除之前的选择
-                if self.current_page == self.apply_page:
-                    self.apply_page.clear_selection()
-            else:
-                self.status_manager.update_status("没有找到工作簿")
+            self.run_excel(
+                lambda: dict(self.excel_manager.refresh_workbooks()),
+                status="正在刷新工作簿",
+                on_done=self.on_workbooks_refreshed,
+                on_error=lambda e: self.status_manager.update_status("刷新工作簿失败")
+            )
             
         except Exception as e:
             print(f"刷新工作簿失败: {str(e)}")
             self.status_manager.update_status("刷新工作簿失败")
 
+    def on_workbooks_refreshed(self, workbooks):
+        """工作簿列表刷新完成"""
+        if workbooks:
+            self.toolbar_manager.update_workbook_list(workbooks)
+            self.status_manager.update_status("工作簿列表已刷新")
+            
+            # 如果在应用公式页面，清除之前的选择
+            if self.current_page == self.apply_page:
+                self.apply_page.clear_selection()
+        else:
+            self.status_manager.update_status("没有找到工作簿")
+
     def on_workbook_selected(self, event):
         """工作簿选择事件处理"""
         try:
             workbook_name = self.toolbar_manager.workbook_var.get()
             if workbook_name:
-                # 获取工作簿对象
-                workbook = self.excel_manager.get_workbook(workbook_name)
-                if workbook:
-                    # 激活工作簿
-                    workbook.Activate()
-                    self.excel_manager.active_workbook = workbook
-                    self.excel_manager.active_sheet = workbook.ActiveSheet
-                    
-                    # 更新状态
-                    self.status_manager.update_status(f"当前工作簿: {workbook_name}")
-                    
-                    # 如果在应用公式页面，清除之前的选择
-                    if self.current_page == self.apply_page:
-                        self.apply_page.clear_selection()
-                else:
-                    self.status_manager.update_status("切换工作簿失败")
+                # 在工作线程中激活工作簿
+                self.run_excel(
+                    self.excel_manager.activate_workbook, workbook_name,
+                    on_done=lambda success: self.on_workbook_activated(workbook_name, success),
+                    on_error=lambda e: self.status_manager.update_status("切换工作簿失败")
+                )
         
         except Exception as e:
             print(f"切换工作簿失败: {str(e)}")
             self.status_manager.update_status("切换工作簿失败")
 
+    def on_workbook_activated(self, workbook_name, success):
+        """工作簿激活完成"""
+        if success:
+            # 更新状态
+            self.status_manager.update_status(f"当前工作簿: {workbook_name}")
+            
+            # 如果在应用公式页面，清除之前的选择
+            if self.current_page == self.apply_page:
+                self.apply_page.clear_selection()
+        else:
+            self.status_manager.update_status("切换工作簿失败")
+
     def on_formula_selected(self, formula_name):
         """公式选择事件处理"""
         try:
-            if not self.excel_manager.is_connected():
+            if not self.excel_connected:
                 messagebox.showwarning(
                     "提示",
                     "请先打开Excel文件",
@@ -253,7 +468,7 @@ class MainWindow(WindowManager):
             print(f"选择公式失败: {str(e)}")
             self.status_manager.update_status("选择公式失败")
 
-    def apply_formula(self, formula_name, input_range, output_range=None):
+    def apply_formula(self, formula_name, input_range, output_range=None, fill=None):
         """应用公式"""
         try:
             if not input_range:
@@ -264,55 +479,127 @@ class MainWindow(WindowManager):
                 )
                 return
             
-            # 保存当前状态
-            self.save_state()
+            if self.excel_busy():
+                return
+            
+            self.cancel_event.clear()
+            self.run_excel(
+                self.write_formula, formula_name, input_range, output_range, fill,
+                status="正在应用公式",
+                on_done=self.on_formula_applied,
+                on_error=self.on_apply_error,
+                cancellable=True
+            )
+            
+        except Exception as e:
+            self.on_apply_error(e)
+
+    def write_formula(self, formula_name, input_range, output_range=None, fill=None):
+        """写入公式并保存前后状态(在工作线程中执行)
+        
+        单元格数超过excel.chunk_threshold时按行分块写入，报告进度并可以取消；
+        取消或失败时用操作前的快照恢复目标区域。
+        Returns:
+            (是否成功, 操作前状态, 操作后状态, 是否已取消)
+        """
+        # 批量操作期间暂停Excel刷新和计算
+        with self.excel_manager.bulk_operation():
+            # 只保存将被覆盖的区域及四周excel.snapshot_margin行/列，快照记录区域所在的工作表
+            target_range = output_range or input_range
+            address = target_range.Address
+            sheet = target_range.Worksheet
+            margin = self.config.get('excel.snapshot_margin', 1)
+            before = self.excel_manager.get_current_state(address, margin, sheet=sheet)
             
             # 应用公式
+            chunked = target_range.Count >= self.config.get('excel.chunk_threshold', 100000)
             success = self.formula_manager.apply_formula(
                 formula_name,
                 input_range,
-                output_range
+                output_range,
+                fill,
+                chunked=chunked,
+                progress=self.report_apply_progress,
+                cancelled=self.cancel_event.is_set
             )
-            
+            after = None
             if success:
-                self.status_manager.update_status("公式应用成功")
-                # 清除选择
-                self.apply_page.clear_selection()
-            else:
-                self.status_manager.update_status("公式应用失败")
-                messagebox.showerror(
-                    "错误",
-                    "公式应用失败，请检查选择区域是否正确",
-                    parent=self.root
-                )
-            
-        except Exception as e:
-            print(f"应用公式失败: {str(e)}")
-            self.status_manager.update_status("应用公式失败")
+                self.excel_manager.mark_touched(target_range)
+                after = self.excel_manager.get_current_state(address, margin, sheet=sheet)
+            elif chunked and before:
+                # 已写入一部分，恢复原内容
+                self.excel_manager.restore_state(before)
+        
+        cancelled = not success and self.cancel_event.is_set()
+        if chunked:
+            logging.info(f"分块应用公式: {address}, {'已取消' if cancelled else '完成' if success else '失败'}")
+        return success, before, after, cancelled
+
+    def report_apply_progress(self, done, total, elapsed):
+        """分块写入的进度(在工作线程中调用)"""
+        rate = done / elapsed if elapsed > 0 else 0
+        self.report_progress(int(done * 100 / total) if total else 100, f"{rate:,.0f} 单元格/秒")
+
+    def on_formula_applied(self, result):
+        """公式写入完成"""
+        success, before, after, cancelled = result
+        if cancelled:
+            self.status_manager.update_status("已取消应用公式，目标区域已恢复", 0)
+        elif success:
+            self.save_command(before, after)
+            self.status_manager.update_status("公式应用成功")
+            # 清除选择
+            self.apply_page.clear_selection()
+        else:
+            self.status_manager.update_status("公式应用失败")
             messagebox.showerror(
                 "错误",
-                f"应用公式失败: {str(e)}",
+                "公式应用失败，请检查选择区域是否正确",
                 parent=self.root
             )
 
-    def on_range_selected(self, mode, value=None):
-        """区域选择事件处理
+    def on_apply_error(self, e):
+        """公式写入出错"""
+        print(f"应用公式失败: {str(e)}")
+        self.status_manager.update_status("应用公式失败")
+        messagebox.showerror(
+            "错误",
+            f"应用公式失败: {str(e)}",
+            parent=self.root
+        )
+
+    def on_range_selected(self, mode, value=None, on_done=None):
+        """区域选择事件处理，选区在工作线程中读取，不阻塞界面
         Args:
             mode: 选择模式('input'/'output')
             value: 预设值
+            on_done: 完成后在界面线程中调用，参数为是否成功
         """
-        try:
-            selected_range = self.excel_manager.select_range(mode, value)
-            if selected_range:
+        def done(selected):
+            if selected:
                 # 传入选择模式，以便正确更新UI状态
-                self.apply_page.update_selection(selected_range, mode)
-                return True
-            return False
-            
-        except Exception as e:
+                range_obj, address = selected
+                self.apply_page.update_selection(range_obj, mode, address)
+            if on_done:
+                on_done(bool(selected))
+
+        def error(e):
             print(f"选择区域失败: {str(e)}")
             self.status_manager.update_status("选择区域失败")
-            return False
+            if on_done:
+                on_done(False)
+
+        try:
+            self.run_excel(self.get_selected_range, mode, value, on_done=done, on_error=error)
+        except Exception as e:
+            error(e)
+
+    def get_selected_range(self, mode, value=None):
+        """获取选择的区域及其地址(在工作线程中执行)"""
+        range_obj = self.excel_manager.select_range(mode, value)
+        if range_obj is None:
+            return None
+        return range_obj, range_obj.Address
 
     def show_formula_page(self):
         """显示公式列表页面"""
@@ -338,8 +625,12 @@ class MainWindow(WindowManager):
     def check_excel_status(self):
         """检查Excel状态"""
         try:
-            is_connected = self.excel_manager.is_connected()
-            self.toolbar_manager.update_excel_status(is_connected)
+            # 上一次检查还没有完成时跳过
+            if self.status_future is None or self.status_future.done():
+                self.status_future = self.run_excel(
+                    self.excel_manager.is_connected,
+                    on_done=self.on_excel_status
+                )
             
             # 每5秒检查一次
             self.root.after(5000, self.check_excel_status)
@@ -347,6 +638,11 @@ class MainWindow(WindowManager):
         except Exception as e:
             print(f"检查Excel状态失败: {str(e)}")
 
+    def on_excel_status(self, is_connected):
+        """Excel状态检查完成"""
+        self.excel_connected = is_connected
+        self.toolbar_manager.update_excel_status(is_connected)
+
     def create_tooltip(self, widget, text):
         """创建工具提示"""
         def enter(event):
@@ -381,24 +677,67 @@ class MainWindow(WindowManager):
         widget.bind('<Enter>', enter)
         widget.bind('<Leave>', leave)
 
-    def save_state(self):
-        """保存当前状态"""
+    def save_command(self, before, after):
+        """记录一次操作
+        Args:
+            before: 操作前被覆盖区域的状态
+            after: 操作后该区域的状态
+        """
         try:
-            state = self.excel_manager.get_current_state()
-            self.history_manager.save_state(state)
+            if before and after:
+                self.history_manager.save_command(before, after)
             self.update_history_buttons()
             
         except Exception as e:
             print(f"保存状态失败: {str(e)}")
 
+    def restore_states(self, states):
+        """依次恢复状态(在工作线程中执行)
+        Returns:
+            bool: 是否全部恢复成功
+        """
+        with self.excel_manager.bulk_operation():
+            for state in states:
+                if not self.excel_manager.restore_state(state):
+                    return False
+        return True
+
+    def on_history_restored(self, success, action, commit):
+        """撤销/重做/重置写回完成后更新历史记录
+        Args:
+            success: 是否全部写回成功
+            action: 操作名称
+            commit: 修改历史记录的方法，只在写回成功后调用
+        """
+        if success:
+            commit()
+            self.status_manager.update_status(f"已{action}")
+        else:
+            self.status_manager.update_status(f"{action}失败")
+        self.update_history_buttons()
+
+    def restore_history(self, states, action, commit):
+        """在工作线程中写回历史状态，成功后才修改历史记录
+        Args:
+            states: 需要依次写回的状态
+            action: 操作名称
+            commit: 修改历史记录的方法
+        """
+        self.run_excel(
+            self.restore_states, states,
+            status=f"正在{action}",
+            on_done=lambda success: self.on_history_restored(success, action, commit),
+            on_error=lambda e: self.on_history_restored(False, action, commit)
+        )
+
     def undo(self):
         """撤销操作"""
         try:
+            if self.excel_busy():
+                return
             if self.history_manager.can_undo():
-                state = self.history_manager.undo()
-                self.excel_manager.restore_state(state)
-                self.update_history_buttons()
-                self.status_manager.update_status("已撤销")
+                state = self.history_manager.peek_undo()
+                self.restore_history([state], "撤销", self.history_manager.undo)
                 
         except Exception as e:
             print(f"撤销操作失败: {str(e)}")
@@ -407,11 +746,11 @@ class MainWindow(WindowManager):
     def redo(self):
         """重做操作"""
         try:
+            if self.excel_busy():
+                return
             if self.history_manager.can_redo():
-                state = self.history_manager.redo()
-                self.excel_manager.restore_state(state)
-                self.update_history_buttons()
-                self.status_manager.update_status("已重做")
+                state = self.history_manager.peek_redo()
+                self.restore_history([state], "重做", self.history_manager.redo)
                 
         except Exception as e:
             print(f"重做操作失败: {str(e)}")
@@ -420,11 +759,12 @@ class MainWindow(WindowManager):
     def reset(self):
         """重置状态"""
         try:
+            if self.excel_busy():
+                return
             if self.history_manager.can_reset():
-                state = self.history_manager.reset()
-                self.excel_manager.restore_state(state)
-                self.update_history_buttons()
-                self.status_manager.update_status("已重置")
+                # 从新到旧依次撤销
+                states = self.history_manager.peek_reset()
+                self.restore_history(states, "重置", self.history_manager.reset)
                 
         except Exception as e:
             print(f"重置状态失败: {str(e)}")
@@ -437,6 +777,10 @@ class MainWindow(WindowManager):
             'redo': self.history_manager.can_redo(),
             'reset': self.history_manager.can_reset()
         })
+        self.status_manager.update_history_usage(
+            self.history_manager.memory_usage(),
+            len(self.history_manager.history)
+        )
 
     def save_config(self):
         """保存配置"""
@@ -457,21 +801,36 @@ class MainWindow(WindowManager):
             # 保存配置
             self.save_config()
             
+            # 停止检查公式库，写入尚未保存的公式修改
+            if self.reload_after_id:
+                self.root.after_cancel(self.reload_after_id)
+                self.reload_after_id = None
+            self.formula_manager.flush()
+            self.formula_page.close()
+            
             # 询问是否保存Excel文件
-            if self.excel_manager.is_connected():
-                if messagebox.askyesno(
-                    "提示", 
-                    "是否保存Excel文件的更改？",
-                    parent=self.root
-                ):
-                    for wb in self.excel_manager.workbooks.values():
-                        try:
-                            wb.Save()
-                        except:
-                            pass
+            save = self.excel_connected and messagebox.askyesno(
+                "提示", 
+                "是否保存Excel文件的更改？",
+                parent=self.root
+            )
+            
+            # 等待未完成的操作，保存并断开Excel连接，然后停止工作线程
+            if self.excel_poll_id:
+                self.root.after_cancel(self.excel_poll_id)
+                self.excel_poll_id = None
+            try:
+                self.com_worker.call(self.close_excel, save, timeout=self.config.get('excel.close_timeout', 30))
+            except Exception as e:
+                print(f"断开Excel连接失败: {str(e)}")
+            self.com_worker.shutdown(wait=False)
+            
+            # 输出COM调用统计
+            if self.com_stats:
+                logging.info("COM调用统计:\n" + self.com_stats.summary())
             
-            # 断开Excel连接
-            self.excel_manager.disconnect()
+            # 删除历史记录的磁盘存储
+            self.history_manager.close()
             
             # 销毁窗口
             self.root.destroy()
@@ -480,6 +839,16 @@ class MainWindow(WindowManager):
             print(f"关闭窗口失败: {str(e)}")
             self.root.destroy()
 
+    def close_excel(self, save=False):
+        """保存工作簿并断开连接(在工作线程中执行)"""
+        if save:
+            for wb in self.excel_manager.workbooks.values():
+                try:
+                    wb.Save()
+                except:
+                    pass
+        self.excel_manager.disconnect()
+
     def create_pin_button(self):
         """创建置顶按钮"""
         # 创建不同状态的图标
@@ -650,6 +1019,28 @@ class MainWindow(WindowManager):
         file_menu.add_separator()
         file_menu.add_command(label="退出", command=self.on_closing)
 
+    def create_debug_menu(self):
+        """创建调试菜单"""
+        menubar = tk.Menu(self.root)
+        self.root.config(menu=menubar)
+        
+        debug_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="调试", menu=debug_menu)
+        debug_menu.add_command(label="COM调用统计", command=self.show_com_stats)
+        debug_menu.add_command(label="清零COM调用统计", command=self.com_stats.reset)
+
+    def show_com_stats(self):
+        """显示COM调用统计并写入日志"""
+        summary = self.com_stats.summary()
+        logging.info("COM调用统计:\n" + summary)
+        
+        window = tk.Toplevel(self.root)
+        window.title("COM调用统计")
+        text = tk.Text(window, font=('Consolas', 9), wrap=tk.NONE, width=140, height=30)
+        text.insert('1.0', summary)
+        text.config(state='disabled')
+        text.pack(fill=tk.BOTH, expand=True)
+
     def show_error(self, title, message, error=None):
         """显示错误对话框"""
         if error:
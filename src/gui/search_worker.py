@@ -0,0 +1,112 @@
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+class SearchWorker:
+    """后台搜索线程
+
+    界面线程只提交搜索请求，搜索在后台线程中执行。每次提交都会增加代号，
+    尚未开始的旧请求被新请求替换，已完成但代号过期的结果直接丢弃，
+    界面线程用poll取回最新一次搜索的结果。
+    """
+
+    def __init__(self, search: Callable[[str, Optional[List[str]]], List[Dict]]):
+        """初始化
+        Args:
+            search: 搜索函数，参数为搜索词和候选公式名称，返回搜索结果
+        """
+        self.search = search
+        self.generation = 0
+        self.pending = None
+        self.results = queue.Queue()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._running = None
+        self._thread = threading.Thread(target=self._run, name='formula-search', daemon=True)
+        self._thread.start()
+
+    def submit(self, query: str, candidates: Optional[List[str]] = None) -> int:
+        """提交搜索请求，之前的请求作废
+        Args:
+            query: 搜索词
+            candidates: 只在这些公式名称中搜索（可选）
+        Returns:
+            int: 请求的代号
+        """
+        with self._condition:
+            self.generation += 1
+            self.pending = (self.generation, query, candidates)
+            self._condition.notify()
+            return self.generation
+
+    def cancel(self):
+        """作废所有未完成的请求"""
+        with self._condition:
+            self.generation += 1
+            self.pending = None
+
+    def is_current(self, generation: int) -> bool:
+        """是否为最新的请求"""
+        return generation == self.generation
+
+    def poll(self) -> Optional[Tuple[str, List[Dict]]]:
+        """取回最新请求的结果
+        Returns:
+            (搜索词, 结果)，最新的请求尚未完成时为None
+        """
+        latest = None
+        while True:
+            try:
+                generation, query, results = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if self.is_current(generation):
+                latest = (query, results)
+        return latest
+
+    def busy(self) -> bool:
+        """是否有尚未取回结果的请求
+
+        poll之后、busy之前后台线程可能刚放入结果，
+        队列不为空时也返回True，保证界面线程再取一次。
+        """
+        with self._condition:
+            return (self.pending is not None or self._running == self.generation
+                    or not self.results.empty())
+
+    def close(self):
+        """停止后台线程"""
+        with self._condition:
+            self._closed = True
+            self.pending = None
+            self._condition.notify()
+
+    def _run(self):
+        """后台线程: 每次只执行最新的请求"""
+        while True:
+            with self._condition:
+                while self.pending is None and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                generation, query, candidates = self.pending
+                self.pending = None
+                self._running = generation
+
+            try:
+                start = time.perf_counter()
+                results = self.search(query, candidates)
+                elapsed = (time.perf_counter() - start) * 1000
+            except Exception as e:
+                print(f"搜索失败: {str(e)}")
+                results, elapsed = [], 0
+
+            with self._condition:
+                self._running = None
+                if not self.is_current(generation):
+                    logging.debug(f"丢弃过期的搜索结果: {query}")
+                    continue
+                self.results.put((generation, query, results))
+            logging.debug(f"后台搜索: {query}, {len(results)} 个结果, 耗时 {elapsed:.1f} ms")
@@ -23,6 +23,14 @@ class StatusManager:
         )
         self.progress.pack(side=tk.RIGHT, padx=5)
         
+        # 取消按钮，只在可取消的操作进行时显示
+        self.cancel_btn = ttk.Button(self.statusbar, text="取消", width=6)
+        self.cancel_command = None
+        
+        # 历史记录内存占用
+        self.history_label = ttk.Label(self.statusbar, text="")
+        self.history_label.pack(side=tk.RIGHT, padx=5)
+        
     def update_status(self, text: str, progress: int = None):
         """更新状态
         Args:
@@ -31,4 +39,33 @@ class StatusManager:
         """
         self.status_label.config(text=text)
         if progress is not None:
-            self.progress_var.set(progress) 
\ No newline at end of file
+            self.progress_var.set(progress)
+
+    def show_cancel(self, command):
+        """显示取消按钮
+        Args:
+            command: 点击时调用的函数
+        """
+        if self.cancel_command is command:
+            return
+        self.cancel_command = command
+        self.cancel_btn.config(command=command, state='normal')
+        self.cancel_btn.pack(side=tk.RIGHT, padx=5, before=self.progress)
+
+    def hide_cancel(self):
+        """隐藏取消按钮"""
+        if self.cancel_command is not None:
+            self.cancel_command = None
+            self.cancel_btn.pack_forget()
+
+    def update_history_usage(self, size: int, count: int):
+        """更新历史记录占用
+        Args:
+            size: 占用字节数
+            count: 历史记录条数
+        """
+        if size >= 1024 * 1024:
+            text = f"{size / (1024 * 1024):.1f} MB"
+        else:
+            text = f"{size / 1024:.1f} KB"
+        self.history_label.config(text=f"历史: {count}条 / {text}")
@@ -0,0 +1,148 @@
+import logging
+import time
+from typing import Dict, Hashable, List, Optional
+
+# 超过这个数量的已分离节点会被删除
+DEFAULT_MAX_DETACHED = 5000
+
+def tree_node(key: Hashable, text: str, values=(), tags=(), children: Optional[List[Dict]] = None,
+              open: Optional[bool] = None) -> Dict:
+    """生成树节点描述
+    Args:
+        key: 节点的唯一标识，同一个key始终对应同一个Treeview项目
+        text: 显示文本
+        values: 列的值
+        tags: 标签
+        children: 子节点列表，None表示保持现有子节点不变
+        open: 是否展开，None表示保持现状
+    """
+    return {
+        'key': key,
+        'text': text,
+        'values': tuple(values),
+        'tags': tuple(tags),
+        'children': children,
+        'open': open
+    }
+
+class TreeReconciler:
+    """Treeview差量更新
+
+    每个节点按key对应固定的项目ID，更新时与上一次的内容比较，
+    只对新增的节点调用insert、对内容变化的节点调用item，
+    每个父节点的子节点顺序用一次set_children调整。
+    不再需要的节点先分离保留，之后再出现时直接重新挂上。
+    """
+
+    def __init__(self, tree, max_detached: int = DEFAULT_MAX_DETACHED, log_stats: bool = False):
+        """初始化
+        Args:
+            tree: Treeview
+            max_detached: 保留的已分离节点数上限
+            log_stats: 是否以INFO级别记录每次更新的统计，否则为DEBUG级别
+        """
+        self.tree = tree
+        self.max_detached = max_detached
+        self.log_level = logging.INFO if log_stats else logging.DEBUG
+        self.ids = {}
+        self.keys = {}
+        self.state = {}
+        self.detached = set()
+
+    def item_id(self, key: Hashable) -> Optional[str]:
+        """key对应的项目ID"""
+        return self.ids.get(key)
+
+    def key_of(self, item: str) -> Optional[Hashable]:
+        """项目ID对应的key"""
+        return self.keys.get(item)
+
+    def reconcile(self, nodes: List[Dict], parent_key: Optional[Hashable] = None) -> Dict[str, int]:
+        """把父节点下的内容更新为nodes
+        Args:
+            nodes: tree_node生成的节点列表
+            parent_key: 父节点的key，None表示根节点
+        Returns:
+            Dict: 各类操作的次数
+        """
+        start = time.perf_counter()
+        stats = {'nodes': 0, 'inserted': 0, 'updated': 0, 'reordered': 0, 'deleted': 0}
+
+        parent = '' if parent_key is None else self.ids[parent_key]
+        self._apply(parent, nodes, stats)
+        stats['deleted'] = self.prune()
+
+        elapsed = (time.perf_counter() - start) * 1000
+        logging.log(
+            self.log_level,
+            f"更新公式树: {stats['nodes']} 个节点, 新增 {stats['inserted']}, 修改 {stats['updated']}, "
+            f"调整顺序 {stats['reordered']}, 删除 {stats['deleted']}, 耗时 {elapsed:.1f} ms"
+        )
+        return stats
+
+    def _apply(self, parent: str, nodes: List[Dict], stats: Dict[str, int]):
+        """更新一个父节点下的子节点"""
+        desired = []
+        for node in nodes:
+            stats['nodes'] += 1
+            key = node['key']
+            content = (node['text'], node['values'], node['tags'])
+            item = self.ids.get(key)
+
+            if item is None or not self.tree.exists(item):
+                options = {}
+                if node['open'] is not None:
+                    options['open'] = node['open']
+                item = self.tree.insert(
+                    parent, 'end',
+                    text=node['text'], values=node['values'], tags=node['tags'],
+                    **options
+                )
+                self.ids[key] = item
+                self.keys[item] = key
+                self.state[item] = content
+                stats['inserted'] += 1
+            else:
+                if self.state.get(item) != content:
+                    self.tree.item(item, text=node['text'], values=node['values'], tags=node['tags'])
+                    self.state[item] = content
+                    stats['updated'] += 1
+                if node['open'] is not None and bool(self.tree.item(item, 'open')) != node['open']:
+                    self.tree.item(item, open=node['open'])
+
+            if node['children'] is not None:
+                self._apply(item, node['children'], stats)
+            desired.append(item)
+
+        # 一次调整顺序，不在列表中的子节点被分离
+        current = self.tree.get_children(parent)
+        if tuple(current) != tuple(desired):
+            self.tree.set_children(parent, *desired)
+            stats['reordered'] += 1
+            self.detached.update(set(current) - set(desired))
+        self.detached.difference_update(desired)
+
+    def prune(self) -> int:
+        """已分离的节点太多时删除
+        Returns:
+            int: 删除的节点数
+        """
+        if len(self.detached) <= self.max_detached:
+            return 0
+        return self.clear_detached()
+
+    def clear_detached(self) -> int:
+        """删除全部已分离的节点"""
+        items = [item for item in self.detached if self.tree.exists(item)]
+        if items:
+            self.tree.delete(*items)
+        count = 0
+        for item in list(self.keys):
+            if not self.tree.exists(item):
+                key = self.keys.pop(item)
+                self.state.pop(item, None)
+                if self.ids.get(key) == item:
+                    del self.ids[key]
+                count += 1
+        self.detached.clear()
+        return count
@@ -7,11 +7,16 @@ from utils.config_manager import ConfigManager
 import logging
 from logging.handlers import RotatingFileHandler
 import argparse
+import time
 
 VERSION = '1.0.0'
 
-def check_dependencies():
+def check_dependencies(config):
     """检查依赖项"""
+    # xlsx后端不依赖Excel
+    if config.get('excel.backend', 'com') == 'xlsx':
+        return True
+    
     try:
         import win32com.client
         return True
@@ -190,6 +195,12 @@ def parse_args():
         help='启用调试模式'
     )
     
+    parser.add_argument(
+        '--profile-com',
+        action='store_true',
+        help='统计Excel COM调用的次数、传输字节数和耗时'
+    )
+    
     parser.add_argument(
         '--log-level',
         choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
@@ -214,11 +225,8 @@ def main():
             
         setup_exception_handler()
         logging.info("程序启动")
+        start = time.perf_counter()
         
-        # 检查依赖项
-        if not check_dependencies():
-            return
-            
         # 设置运行环境
         if not setup_environment():
             messagebox.showerror("错误", "初始化环境失败")
@@ -226,6 +234,11 @@ def main():
             
         # 加载配置
         config = ConfigManager(args.config)
+        config_time = time.perf_counter()
+        
+        # 检查依赖项
+        if not check_dependencies(config):
+            return
         
         # 创建主窗口
         root = tk.Tk()
@@ -257,7 +270,14 @@ def main():
         setup_style(config)
         
         # 创建主应用
-        app = MainWindow(root, config)
+        window_time = time.perf_counter()
+        app = MainWindow(root, config, profile_com=args.profile_com)
+        logging.info(
+            "启动完成: 配置 %.1f ms, 窗口 %.1f ms, 主界面 %.1f ms",
+            (config_time - start) * 1000,
+            (window_time - config_time) * 1000,
+            (time.perf_counter() - window_time) * 1000
+        )
         
         # 启动主循环
         root.mainloop()
@@ -1,12 +1,18 @@
 # 空文件，用于标记包 
 from .formula_manager import FormulaManager
+from .sqlite_formula_manager import SqliteFormulaManager
 from .excel_manager import ExcelManager
+from .workbook_backend import WorkbookBackend
+from .xlsx_backend import XlsxManager
 from .history_manager import HistoryManager
 from .config_manager import ConfigManager
 
 __all__ = [
     'FormulaManager',
+    'SqliteFormulaManager',
     'ExcelManager',
+    'WorkbookBackend',
+    'XlsxManager',
     'HistoryManager',
     'ConfigManager'
 ] 
\ No newline at end of file
@@ -0,0 +1,202 @@
+import datetime
+import inspect
+import threading
+import time
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+try:
+    import pywintypes
+except ImportError:
+    # 非Windows环境下没有pywin32
+    pywintypes = None
+
+# 不需要包装的返回值类型，其余对象视为COM对象继续包装
+# (日期单元格的Value为pywintypes.TimeType，货币类型为Decimal)
+PLAIN_TYPES = (
+    str, bytes, int, float, bool, complex, type(None), tuple, list, dict,
+    datetime.date, datetime.time, datetime.timedelta, Decimal
+)
+if pywintypes is not None:
+    PLAIN_TYPES += (pywintypes.TimeType,)
+
+# 延迟直方图的桶上限(毫秒)，最后一个桶收集更慢的调用
+HISTOGRAM_BOUNDS = (0.1, 1, 10, 100, 1000)
+
+# VARIANT的大小，估算跨进程传输的字节数
+VARIANT_SIZE = 16
+
+def payload_size(value: Any) -> int:
+    """估算一个值在COM调用中传输的字节数(VARIANT，字符串按UTF-16)"""
+    if isinstance(value, ComProxy):
+        return VARIANT_SIZE
+    if isinstance(value, str):
+        return VARIANT_SIZE + 2 * len(value)
+    if isinstance(value, (tuple, list)):
+        return VARIANT_SIZE + sum(payload_size(item) for item in value)
+    return VARIANT_SIZE
+
+class ComStats:
+    """按成员路径统计COM调用次数、传输字节数和耗时"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.members = {}
+
+    def record(self, path: str, elapsed: float, size: int = 0):
+        """记录一次调用
+        Args:
+            path: 成员路径，例如 UsedRange.Value
+            elapsed: 耗时(秒)
+            size: 传输的字节数
+        """
+        milliseconds = elapsed * 1000
+        bucket = next(
+            (i for i, bound in enumerate(HISTOGRAM_BOUNDS) if milliseconds < bound),
+            len(HISTOGRAM_BOUNDS)
+        )
+        with self._lock:
+            stats = self.members.get(path)
+            if stats is None:
+                stats = self.members[path] = {
+                    'count': 0,
+                    'bytes': 0,
+                    'time': 0.0,
+                    'max': 0.0,
+                    'histogram': [0] * (len(HISTOGRAM_BOUNDS) + 1)
+                }
+            stats['count'] += 1
+            stats['bytes'] += size
+            stats['time'] += elapsed
+            stats['max'] = max(stats['max'], elapsed)
+            stats['histogram'][bucket] += 1
+
+    def reset(self):
+        """清空统计"""
+        with self._lock:
+            self.members.clear()
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """统计数据的副本"""
+        with self._lock:
+            return {
+                path: dict(stats, histogram=list(stats['histogram']))
+                for path, stats in self.members.items()
+            }
+
+    def summary(self, limit: Optional[int] = None) -> str:
+        """按总耗时排序的统计表
+        Args:
+            limit: 最多显示的行数
+        """
+        rows = sorted(self.snapshot().items(), key=lambda item: item[1]['time'], reverse=True)
+        if limit:
+            rows = rows[:limit]
+
+        labels = [f"<{bound:g}ms" for bound in HISTOGRAM_BOUNDS] + [f">={HISTOGRAM_BOUNDS[-1]:g}ms"]
+        width = max([len('成员')] + [len(path) for path, _ in rows])
+        lines = [
+            f"{'成员':<{width}} {'次数':>8} {'总耗时ms':>10} {'平均ms':>8} {'最大ms':>8} {'字节':>12}  "
+            + ' '.join(f"{label:>8}" for label in labels)
+        ]
+        total_count = total_time = total_bytes = 0
+        for path, stats in rows:
+            total_count += stats['count']
+            total_time += stats['time']
+            total_bytes += stats['bytes']
+            lines.append(
+                f"{path:<{width}} {stats['count']:>8} {stats['time'] * 1000:>10.1f} "
+                f"{stats['time'] * 1000 / stats['count']:>8.3f} {stats['max'] * 1000:>8.1f} "
+                f"{stats['bytes']:>12}  "
+                + ' '.join(f"{count:>8}" for count in stats['histogram'])
+            )
+        lines.append(f"{'合计':<{width}} {total_count:>8} {total_time * 1000:>10.1f} {'':>8} {'':>8} {total_bytes:>12}")
+        return '\n'.join(lines)
+
+class ComProxy:
+    """COM对象的统计代理
+
+    透明地转发属性读写和方法调用，按"对象来源.成员"的路径记录到ComStats，
+    例如 UsedRange.Value、Range.Formula、Workbooks.Count。
+    返回的COM对象同样被包装，普通值原样返回。
+    """
+
+    __slots__ = ('_target', '_stats', '_kind')
+
+    def __init__(self, target: Any, stats: ComStats, kind: str = 'Application'):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_stats', stats)
+        object.__setattr__(self, '_kind', kind)
+
+    def _wrap(self, value: Any, kind: str) -> Any:
+        """包装返回的COM对象"""
+        if isinstance(value, PLAIN_TYPES) or isinstance(value, ComProxy):
+            return value
+        return ComProxy(value, self._stats, kind)
+
+    def __getattr__(self, name: str) -> Any:
+        path = f"{self._kind}.{name}"
+        start = time.perf_counter()
+        value = getattr(self._target, name)
+        if inspect.isroutine(value):
+            return self._method(value, name, path)
+        self._stats.record(path, time.perf_counter() - start, payload_size(value))
+        return self._wrap(value, name)
+
+    def _method(self, method, name: str, path: str):
+        """包装方法调用，参数中的代理还原为原对象"""
+        def call(*args, **kwargs):
+            args = [unwrap(arg) for arg in args]
+            kwargs = {key: unwrap(value) for key, value in kwargs.items()}
+            size = sum(payload_size(arg) for arg in args) + sum(payload_size(v) for v in kwargs.values())
+            start = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+            self._stats.record(f"{path}()", elapsed, size)
+            return self._wrap(result, name)
+        return call
+
+    def __setattr__(self, name: str, value: Any):
+        value = unwrap(value)
+        start = time.perf_counter()
+        setattr(self._target, name, value)
+        self._stats.record(f"{self._kind}.{name}=", time.perf_counter() - start, payload_size(value))
+
+    def __call__(self, *args, **kwargs):
+        return self._method(self._target, 'Item', self._kind)(*args, **kwargs)
+
+    def __iter__(self):
+        path = f"{self._kind}.__iter__"
+        iterator = iter(self._target)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self._stats.record(path, time.perf_counter() - start)
+                return
+            self._stats.record(path, time.perf_counter() - start, VARIANT_SIZE)
+            yield self._wrap(item, f"{self._kind}[]")
+
+    def __len__(self) -> int:
+        return len(self._target)
+
+    def __bool__(self) -> bool:
+        return bool(self._target)
+
+    def __eq__(self, other) -> bool:
+        return self._target == unwrap(other)
+
+    def __hash__(self) -> int:
+        return hash(self._target)
+
+    def __repr__(self) -> str:
+        return f"<ComProxy {self._kind}: {self._target!r}>"
+
+def unwrap(value: Any) -> Any:
+    """取出代理包装的原对象"""
+    if isinstance(value, ComProxy):
+        return object.__getattribute__(value, '_target')
+    return value
@@ -0,0 +1,75 @@
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+
+try:
+    import pythoncom
+except ImportError:
+    # 非Windows环境下没有pywin32，工作线程不需要初始化COM
+    pythoncom = None
+
+class ComWorker:
+    """COM工作线程
+
+    Excel的COM对象属于创建它的单线程套间(STA)，只能在同一个线程中使用。
+    所有Excel操作都提交到这个线程按顺序执行，界面线程通过Future取得结果，
+    不会因为Excel繁忙而卡住。
+    """
+
+    def __init__(self, name: str = 'excel-com'):
+        self.requests = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, func: Callable, *args, **kwargs) -> Future:
+        """提交操作
+        Args:
+            func: 在工作线程中执行的函数
+            *args, **kwargs: 函数参数
+        Returns:
+            Future: 操作完成后保存返回值或异常
+        """
+        future = Future()
+        self.requests.put((future, func, args, kwargs))
+        return future
+
+    def call(self, func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """在工作线程中执行并等待结果，已在工作线程中时直接执行"""
+        if self.in_worker():
+            return func(*args, **kwargs)
+        return self.submit(func, *args, **kwargs).result(timeout)
+
+    def in_worker(self) -> bool:
+        """当前是否为工作线程"""
+        return threading.current_thread() is self._thread
+
+    def pending(self) -> int:
+        """排队中的操作数"""
+        return self.requests.qsize()
+
+    def shutdown(self, wait: bool = True, timeout: Optional[float] = None):
+        """执行完已提交的操作后停止工作线程"""
+        self.requests.put(None)
+        if wait and not self.in_worker():
+            self._thread.join(timeout)
+
+    def _run(self):
+        """工作线程: 初始化COM套间，按顺序执行提交的操作"""
+        if pythoncom is not None:
+            pythoncom.CoInitialize()
+        try:
+            while True:
+                request = self.requests.get()
+                if request is None:
+                    break
+                future, func, args, kwargs = request
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(func(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+        finally:
+            if pythoncom is not None:
+                pythoncom.CoUninitialize()
@@ -5,9 +5,11 @@ from typing import Any, Dict, Optional
 class ConfigManager:
     """配置管理器"""
     
-    def __init__(self, config_file="config.json"):
+    def __init__(self, config_file="config.json", default_file=os.path.join('data', 'config.json')):
         self.config_file = config_file
+        self.default_file = default_file
         self.config = self.load_config()
+        self.defaults = self.load_defaults()
         
     def load_config(self):
         """加载配置"""
@@ -20,6 +22,17 @@ class ConfigManager:
             print(f"加载配置失败: {str(e)}")
             return {}
             
+    def load_defaults(self):
+        """加载默认配置(分组结构，如 {"excel": {"max_history": 20}})"""
+        try:
+            if os.path.exists(self.default_file):
+                with open(self.default_file, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            return {}
+        except Exception as e:
+            print(f"加载默认配置失败: {str(e)}")
+            return {}
+            
     def save_config(self):
         """保存配置"""
         try:
@@ -29,8 +42,19 @@ class ConfigManager:
             print(f"保存配置失败: {str(e)}")
             
     def get(self, key, default=None):
-        """获取配置项"""
-        return self.config.get(key, default)
+        """获取配置项
+        
+        先查找用户配置中的同名项，再按 "分组.名称" 在默认配置中查找
+        """
+        if key in self.config:
+            return self.config[key]
+        
+        value = self.defaults
+        for part in key.split('.'):
+            if not isinstance(value, dict) or part not in value:
+                return default
+            value = value[part]
+        return value
             
     def set(self, key, value):
         """设置配置项"""
@@ -1,26 +1,51 @@
-import win32com.client
-from typing import Dict, Optional, Tuple, Any
+from typing import Dict, List, Optional, Tuple, Any
 import os
+from .workbook_backend import WorkbookBackend
+from .com_profiler import ComProxy, ComStats
 
-class ExcelManager:
+try:
+    import win32com.client
+except ImportError:
+    # 非Windows环境下没有pywin32，只能使用xlsx后端
+    win32com = None
+
+# Excel常量 xlCalculationManual
+XL_CALCULATION_MANUAL = -4135
+
+class ExcelManager(WorkbookBackend):
     """Excel管理器"""
     
-    def __init__(self):
-        self.app = None
-        self.active_workbook = None
-        self.active_sheet = None
-        self.workbooks = {}
+    def __init__(self, app: Any = None, com_stats: Optional[ComStats] = None):
+        """初始化
+        Args:
+            app: 已有的Application对象（可选），例如测试用的FakeApplication，
+                不指定时在connect中连接Excel
+            com_stats: 统计COM调用（可选），指定时Application对象被ComProxy包装
+        """
+        super().__init__()
+        self.com_stats = com_stats
+        self.app = self._profile(app)
+    
+    def _profile(self, app: Any) -> Any:
+        """需要统计COM调用时包装Application对象"""
+        if app is None or self.com_stats is None:
+            return app
+        return ComProxy(app, self.com_stats)
         
     def connect(self) -> bool:
         """连接到Excel应用程序"""
         try:
             if not self.app:
+                if win32com is None:
+                    print("未安装pywin32，无法连接Excel")
+                    return False
+                
                 # 先尝试获取已打开的Excel实例
                 try:
-                    self.app = win32com.client.GetObject(Class='Excel.Application')
+                    self.app = self._profile(win32com.client.GetObject(Class='Excel.Application'))
                 except:
                     # 如果没有打开的Excel，则创建新实例
-                    self.app = win32com.client.Dispatch('Excel.Application')
+                    self.app = self._profile(win32com.client.Dispatch('Excel.Application'))
                     self.app.Visible = True
                 
             return True
@@ -90,15 +115,6 @@ class ExcelManager:
             print(f"打开Excel文件失败: {str(e)}")
             return False
             
-    def get_workbook(self, name: str) -> Optional[Any]:
-        """获取工作簿
-        Args:
-            name: 工作簿名称
-        Returns:
-            Workbook对象或None
-        """
-        return self.workbooks.get(name)
-            
     def refresh_workbooks(self) -> Dict[str, Any]:
         """刷新工作簿列表"""
         try:
@@ -118,95 +134,49 @@ class ExcelManager:
             print(f"刷新工作簿列表失败: {str(e)}")
             return {}
             
-    def select_range(self, mode: str, value: Any = None) -> Optional[Any]:
-        """选择区域
-        Args:
-            mode: 选择模式 ('input' 或 'output')
-            value: 可选的预设值
-        Returns:
-            Range对象或None
-        """
-        try:
-            if not self.active_sheet:
-                return None
-            
-            if value:
-                return self.active_sheet.Range(value)
-            
-            # 获取用户选择的区域
-            selection = self.app.Selection
-            if not selection:
-                return None
-            
-            return selection
-            
-        except Exception as e:
-            print(f"选择区域失败: {str(e)}")
+    def _suspend_app(self) -> Any:
+        """关闭屏幕刷新和事件，切换为手动计算"""
+        if not self.app:
             return None
-            
-    def apply_formula(self, formula: str, input_range: Any, output_range: Any = None) -> bool:
-        """应用公式
-        Args:
-            formula: 公式模板
-            input_range: 输入区域
-            output_range: 输出区域（可选）
-        Returns:
-            bool: 是否成功
-        """
-        try:
-            if not self.active_sheet:
-                return False
-            
-            # 如果没有指定输出区域，使用输入区域
-            if not output_range:
-                output_range = input_range
-            
-            # 替换公式中的占位符
-            formula = formula.replace('{range}', input_range.Address)
-            
-            # 应用公式
-            output_range.Formula = formula
-            return True
-            
-        except Exception as e:
-            print(f"应用公式失败: {str(e)}")
-            return False
-
-    def get_current_state(self) -> Optional[Dict]:
-        """获取当前状态"""
+        
+        saved = (
+            self.app.ScreenUpdating,
+            self.app.Calculation,
+            self.app.EnableEvents
+        )
         try:
-            if not self.active_sheet:
-                return None
-            
-            used_range = self.active_sheet.UsedRange
-            return {
-                'values': used_range.Value,
-                'formulas': used_range.Formula,
-                'range': used_range.Address
-            }
-        except Exception as e:
-            print(f"获取状态失败: {str(e)}")
-            return None
-
-    def restore_state(self, state: Dict) -> bool:
-        """恢复状态
-        Args:
-            state: 状态字典
-        Returns:
-            bool: 是否成功
-        """
+            # 计算模式最容易失败(例如没有打开的工作簿)，先设置
+            self.app.Calculation = XL_CALCULATION_MANUAL
+            self.app.ScreenUpdating = False
+            self.app.EnableEvents = False
+        except Exception:
+            # 部分设置已修改时恢复原设置，避免Excel停在不刷新、不响应事件的状态
+            self._restore_settings(saved)
+            raise
+        return saved
+    
+    def _restore_settings(self, saved: Any):
+        """恢复原来的设置，某一项失败不影响其余各项"""
+        screen_updating, calculation, enable_events = saved
+        for name, value in (('Calculation', calculation),
+                            ('EnableEvents', enable_events),
+                            ('ScreenUpdating', screen_updating)):
+            try:
+                setattr(self.app, name, value)
+            except Exception as e:
+                print(f"恢复{name}失败: {str(e)}")
+    
+    def _resume_app(self, saved: Any, touched: List[Any]):
+        """只重算写入过的区域，再恢复原来的设置"""
         try:
-            if not self.active_sheet or not state:
-                return False
-            
-            range_obj = self.active_sheet.Range(state['range'])
-            range_obj.Value = state['values']
-            range_obj.Formula = state['formulas']
-            return True
-        
-        except Exception as e:
-            print(f"恢复状态失败: {str(e)}")
-            return False
+            for range_obj in touched:
+                range_obj.Calculate()
+        finally:
+            self._restore_settings(saved)
+    
+    def get_selection(self) -> Optional[Any]:
+        """获取Excel中当前选中的区域"""
+        return self.app.Selection if self.app else None
 
     def disconnect(self):
         """断开Excel连接"""
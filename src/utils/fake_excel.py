@@ -0,0 +1,386 @@
+import os
+import time
+from collections import Counter
+from typing import Any, Optional
+from .range_address import parse_range, format_range, r1c1_to_a1
+from .xlsx_backend import format_number, parse_constant
+
+# Excel常量 xlCalculationAutomatic
+XL_CALCULATION_AUTOMATIC = -4105
+
+class ComProperty:
+    """模拟COM属性，每次读写计为一次调用"""
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        obj.app._call(f"{type(obj).__name__}.{self.name}")
+        return obj.__dict__.get(self.name)
+
+    def __set__(self, obj, value):
+        obj.app._call(f"{type(obj).__name__}.{self.name}")
+        obj.__dict__[self.name] = value
+
+class FakeApplication:
+    """内存中的Excel Application
+
+    实现ExcelManager用到的对象模型子集(Application、Workbooks、Workbook、
+    Worksheet、Range)，单元格保存在二维数组中。每次访问属性或调用方法
+    都计入calls并等待latency秒，用来模拟COM跨进程调用的开销，
+    可以在没有Excel的环境中测试和测量公式应用、快照和恢复。
+    """
+
+    Visible = ComProperty()
+    ScreenUpdating = ComProperty()
+    Calculation = ComProperty()
+    EnableEvents = ComProperty()
+
+    def __init__(self, latency: float = 0.0):
+        """初始化
+        Args:
+            latency: 每次调用的延迟(秒)
+        """
+        self.app = self
+        self.latency = latency
+        self.calls = 0
+        self.call_counts = Counter()
+        self.__dict__.update(
+            Visible=False,
+            ScreenUpdating=True,
+            Calculation=XL_CALCULATION_AUTOMATIC,
+            EnableEvents=True
+        )
+        self._workbooks = FakeWorkbooks(self)
+        self._active_workbook = None
+        self._selection = None
+
+    def _call(self, member: str):
+        """记录一次调用并模拟延迟"""
+        self.calls += 1
+        self.call_counts[member] += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def reset_calls(self):
+        """清零调用计数"""
+        self.calls = 0
+        self.call_counts.clear()
+
+    @property
+    def Workbooks(self) -> 'FakeWorkbooks':
+        self._call('FakeApplication.Workbooks')
+        return self._workbooks
+
+    @property
+    def ActiveWorkbook(self) -> Optional['FakeWorkbook']:
+        self._call('FakeApplication.ActiveWorkbook')
+        return self._active_workbook
+
+    @property
+    def ActiveSheet(self) -> Optional['FakeWorksheet']:
+        self._call('FakeApplication.ActiveSheet')
+        return self._active_workbook._active_sheet if self._active_workbook else None
+
+    @property
+    def Selection(self) -> Optional['FakeRange']:
+        self._call('FakeApplication.Selection')
+        if self._selection is None and self._active_workbook:
+            return self._active_workbook._active_sheet.Range('A1')
+        return self._selection
+
+    def Quit(self):
+        """关闭所有工作簿"""
+        self._call('FakeApplication.Quit')
+        self._workbooks._items.clear()
+        self._active_workbook = None
+        self._selection = None
+
+class FakeWorkbooks:
+    """工作簿集合"""
+
+    def __init__(self, app: FakeApplication):
+        self.app = app
+        self._items = []
+
+    def __iter__(self):
+        self.app._call('FakeWorkbooks.__iter__')
+        return iter(list(self._items))
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __call__(self, name: str) -> 'FakeWorkbook':
+        return self.Item(name)
+
+    @property
+    def Count(self) -> int:
+        self.app._call('FakeWorkbooks.Count')
+        return len(self._items)
+
+    def Item(self, name: str) -> 'FakeWorkbook':
+        """按名称获取工作簿"""
+        self.app._call('FakeWorkbooks.Item')
+        for workbook in self._items:
+            if workbook.__dict__['Name'] == name:
+                return workbook
+        raise KeyError(name)
+
+    def Add(self, name: Optional[str] = None, sheets: int = 1) -> 'FakeWorkbook':
+        """新建工作簿"""
+        self.app._call('FakeWorkbooks.Add')
+        name = name or f"Book{len(self._items) + 1}"
+        return self._add(FakeWorkbook(self.app, name, name, sheets))
+
+    def Open(self, file_path: str) -> 'FakeWorkbook':
+        """打开文件(只使用文件名，内容为空的工作簿)"""
+        self.app._call('FakeWorkbooks.Open')
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(file_path)
+        return self._add(FakeWorkbook(self.app, os.path.basename(file_path), file_path))
+
+    def _add(self, workbook: 'FakeWorkbook') -> 'FakeWorkbook':
+        self._items.append(workbook)
+        self.app._active_workbook = workbook
+        self.app._selection = None
+        return workbook
+
+class FakeWorkbook:
+    """工作簿"""
+
+    Name = ComProperty()
+    FullName = ComProperty()
+    Saved = ComProperty()
+
+    def __init__(self, app: FakeApplication, name: str, full_name: str, sheets: int = 1):
+        self.app = app
+        self.__dict__.update(Name=name, FullName=full_name, Saved=True)
+        self._sheets = [FakeWorksheet(self, f"Sheet{i + 1}") for i in range(max(1, sheets))]
+        self._active_sheet = self._sheets[0]
+
+    @property
+    def Worksheets(self) -> 'FakeSheets':
+        self.app._call('FakeWorkbook.Worksheets')
+        return FakeSheets(self._sheets)
+
+    Sheets = Worksheets
+
+    @property
+    def ActiveSheet(self) -> 'FakeWorksheet':
+        self.app._call('FakeWorkbook.ActiveSheet')
+        return self._active_sheet
+
+    def Activate(self):
+        self.app._call('FakeWorkbook.Activate')
+        self.app._active_workbook = self
+        self.app._selection = None
+
+    def Save(self):
+        self.app._call('FakeWorkbook.Save')
+        self.__dict__['Saved'] = True
+
+    def Close(self, SaveChanges: bool = False):
+        self.app._call('FakeWorkbook.Close')
+        if self in self.app._workbooks._items:
+            self.app._workbooks._items.remove(self)
+        if self.app._active_workbook is self:
+            items = self.app._workbooks._items
+            self.app._active_workbook = items[-1] if items else None
+            self.app._selection = None
+
+class FakeSheets(list):
+    """工作表集合，与COM一样可以按名称或序号(从1开始)调用"""
+
+    def __call__(self, key: Any) -> 'FakeWorksheet':
+        if isinstance(key, int):
+            return self[key - 1]
+        for sheet in self:
+            if sheet.__dict__['Name'] == key:
+                return sheet
+        raise KeyError(key)
+
+class FakeWorksheet:
+    """工作表，值和公式分别保存在按行的二维数组中"""
+
+    Name = ComProperty()
+
+    def __init__(self, workbook: FakeWorkbook, name: str):
+        self.app = workbook.app
+        self.workbook = workbook
+        self.__dict__['Name'] = name
+        self.values = []
+        self.formulas = []
+
+    @property
+    def Parent(self) -> FakeWorkbook:
+        return self.workbook
+
+    def Range(self, address: str) -> 'FakeRange':
+        self.app._call('FakeWorksheet.Range')
+        return FakeRange(self, *parse_range(address))
+
+    def Cells(self, row: int, col: int) -> 'FakeRange':
+        self.app._call('FakeWorksheet.Cells')
+        return FakeRange(self, row, col, row, col)
+
+    @property
+    def UsedRange(self) -> 'FakeRange':
+        self.app._call('FakeWorksheet.UsedRange')
+        rows = [
+            i for i, (values, formulas) in enumerate(zip(self.values, self.formulas))
+            if any(v is not None for v in values) or any(f is not None for f in formulas)
+        ]
+        if not rows:
+            return FakeRange(self, 1, 1, 1, 1)
+        cols = [
+            j for i in rows
+            for j, (value, formula) in enumerate(zip(self.values[i], self.formulas[i]))
+            if value is not None or formula is not None
+        ]
+        return FakeRange(self, rows[0] + 1, min(cols) + 1, rows[-1] + 1, max(cols) + 1)
+
+    def Calculate(self):
+        self.app._call('FakeWorksheet.Calculate')
+
+    def _ensure(self, last_row: int):
+        """扩展行数组，每行按需加长"""
+        while len(self.values) < last_row:
+            self.values.append([])
+            self.formulas.append([])
+
+    def get_cell(self, row: int, col: int):
+        """(值, 公式)，不计入调用"""
+        if row > len(self.values) or col > len(self.values[row - 1]):
+            return None, None
+        return self.values[row - 1][col - 1], self.formulas[row - 1][col - 1]
+
+    def set_cell(self, row: int, col: int, value: Any = None, formula: Optional[str] = None):
+        """写入单元格，不计入调用"""
+        if row > len(self.values):
+            self._ensure(row)
+        values = self.values[row - 1]
+        if col > len(values):
+            padding = [None] * (col - len(values))
+            values.extend(padding)
+            self.formulas[row - 1].extend(padding)
+        values[col - 1] = value
+        self.formulas[row - 1][col - 1] = formula
+        self.workbook.__dict__['Saved'] = False
+
+class FakeRange:
+    """区域，提供Address/Value/Formula/FormulaR1C1等接口"""
+
+    def __init__(self, sheet: FakeWorksheet, first_row: int, first_col: int,
+                 last_row: int, last_col: int):
+        self.app = sheet.app
+        self.sheet = sheet
+        self.first_row = first_row
+        self.first_col = first_col
+        self.last_row = last_row
+        self.last_col = last_col
+
+    @property
+    def Address(self) -> str:
+        self.app._call('FakeRange.Address')
+        return format_range(self.first_row, self.first_col, self.last_row, self.last_col)
+
+    @property
+    def Count(self) -> int:
+        self.app._call('FakeRange.Count')
+        return (self.last_row - self.first_row + 1) * (self.last_col - self.first_col + 1)
+
+    @property
+    def Worksheet(self) -> FakeWorksheet:
+        self.app._call('FakeRange.Worksheet')
+        return self.sheet
+
+    @property
+    def Value(self) -> Any:
+        self.app._call('FakeRange.Value')
+        return self._read(lambda value, formula: value)
+
+    @Value.setter
+    def Value(self, data: Any):
+        self.app._call('FakeRange.Value')
+        self._write(data, self._convert)
+
+    @property
+    def Formula(self) -> Any:
+        self.app._call('FakeRange.Formula')
+        return self._read(self._formula_text)
+
+    @Formula.setter
+    def Formula(self, data: Any):
+        self.app._call('FakeRange.Formula')
+        self._write(data, self._convert)
+
+    def _set_formula_r1c1(self, data: Any):
+        """按R1C1写入公式，相对引用按各单元格位置换算"""
+        self.app._call('FakeRange.FormulaR1C1')
+        self.sheet._ensure(self.last_row)
+        for row in range(self.first_row, self.last_row + 1):
+            for col in range(self.first_col, self.last_col + 1):
+                if isinstance(data, str) and data.startswith('='):
+                    self.sheet.set_cell(row, col, None, r1c1_to_a1(data, row, col))
+                else:
+                    self.sheet.set_cell(row, col, parse_constant(data))
+
+    FormulaR1C1 = property(fset=_set_formula_r1c1)
+
+    def Select(self):
+        self.app._call('FakeRange.Select')
+        self.app._selection = self
+
+    def Calculate(self):
+        self.app._call('FakeRange.Calculate')
+
+    @staticmethod
+    def _convert(item: Any):
+        """写入的内容转换为(值, 公式)，以=开头的文本为公式"""
+        if isinstance(item, str) and item.startswith('='):
+            return None, item
+        return parse_constant(item), None
+
+    @staticmethod
+    def _formula_text(value: Any, formula: Optional[str]) -> str:
+        """单元格的Formula文本：公式返回公式，常量返回其文本"""
+        if formula:
+            return formula
+        if value is None:
+            return ''
+        if isinstance(value, bool):
+            return 'TRUE' if value else 'FALSE'
+        if isinstance(value, (int, float)):
+            return format_number(value)
+        return str(value)
+
+    def _read(self, getter) -> Any:
+        """读取区域，单个单元格返回标量，否则返回二维元组"""
+        rows = []
+        for row in range(self.first_row, self.last_row + 1):
+            rows.append(tuple(
+                getter(*self.sheet.get_cell(row, col))
+                for col in range(self.first_col, self.last_col + 1)
+            ))
+        if len(rows) == 1 and len(rows[0]) == 1:
+            return rows[0][0]
+        return tuple(rows)
+
+    def _write(self, data: Any, convert):
+        """写入区域，标量广播到每个单元格，二维数据按位置写入"""
+        self.sheet._ensure(self.last_row)
+        if isinstance(data, (list, tuple)):
+            if data and not isinstance(data[0], (list, tuple)):
+                data = (data,)
+        for row_offset, row in enumerate(range(self.first_row, self.last_row + 1)):
+            for col_offset, col in enumerate(range(self.first_col, self.last_col + 1)):
+                if isinstance(data, (list, tuple)):
+                    try:
+                        item = data[row_offset][col_offset]
+                    except IndexError:
+                        continue
+                else:
+                    item = data
+                self.sheet.set_cell(row, col, *convert(item))
@@ -0,0 +1,408 @@
+import bisect
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from .pinyin import pinyin_keys
+
+# 模板中的函数名等英文标记，占位符({range})不计入
+TOKEN_PATTERN = re.compile(r'[a-z][a-z0-9_.]*')
+PLACEHOLDER_PATTERN = re.compile(r'\{[^}]*\}')
+
+# 匹配位置的得分
+SCORE_NAME_EXACT = 100
+SCORE_NAME_PREFIX = 60
+SCORE_NAME = 40
+SCORE_PINYIN_PREFIX = 50
+SCORE_PINYIN = 35
+SCORE_TOKEN_EXACT = 30
+SCORE_TOKEN_PREFIX = 20
+SCORE_TEMPLATE = 15
+SCORE_DESCRIPTION = 10
+# 模糊匹配的得分，每个编辑距离扣2分
+SCORE_FUZZY = 8
+
+# 模糊匹配的最短查询长度
+FUZZY_MIN_LENGTH = 3
+
+def bigrams(text: str) -> Set[str]:
+    """相邻两个字符组成的片段，适合中文名称"""
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+def trigrams(text: str) -> Set[str]:
+    """相邻三个字符组成的片段，用于模板和拼音"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def fuzzy_limit(term: str) -> int:
+    """允许的最大编辑距离"""
+    return 1 if len(term) <= 4 else 2
+
+def fuzzy_distance(term: str, text: str, limit: int) -> int:
+    """term与text中最相近的子串之间的编辑距离
+    Args:
+        term: 查询词
+        text: 被搜索的文本
+        limit: 距离上限，超过时提前结束
+    Returns:
+        int: 编辑距离，超过上限时返回limit + 1
+    """
+    # text中的起点不计代价
+    previous = [0] * (len(text) + 1)
+    for i, a in enumerate(term, 1):
+        current = [i] + [0] * len(text)
+        for j, b in enumerate(text, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a != b))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous)
+
+def template_tokens(template: str) -> Set[str]:
+    """模板中的英文标记，例如 =SUMIF({range}, {criteria}) -> {'sumif'}"""
+    return set(TOKEN_PATTERN.findall(PLACEHOLDER_PATTERN.sub(' ', template.lower())))
+
+class FormulaDocument:
+    """索引中的一条公式"""
+    __slots__ = ('category', 'formula', 'name', 'description', 'template', 'tokens',
+                 'initials', 'pinyin')
+
+    def __init__(self, category: str, formula: Dict):
+        self.category = category
+        self.formula = formula
+        self.name = formula.get('name', '').lower()
+        self.description = formula.get('description', '').lower()
+        template = formula.get('template', '')
+        self.template = PLACEHOLDER_PATTERN.sub(' ', template.lower())
+        self.tokens = template_tokens(template)
+        self.initials, self.pinyin = pinyin_keys(formula.get('name', ''))
+
+    @property
+    def grams(self) -> Set[str]:
+        """二元片段: 名称、描述、模板、拼音首字母和全拼
+
+        覆盖score检查的全部文本，一两个字符的查询词(例如 qi)
+        直接查索引和在上一次结果中缩小范围的结果相同。
+        """
+        return (bigrams(self.name) | bigrams(self.description) | bigrams(self.template)
+                | bigrams(self.initials) | bigrams(self.pinyin))
+
+    @property
+    def trigrams(self) -> Set[str]:
+        """三元片段: 名称、模板和全拼"""
+        return trigrams(self.name) | trigrams(self.template) | trigrams(self.pinyin)
+
+    def to_data(self) -> tuple:
+        """转换为可用marshal保存的元组"""
+        return (self.category, self.formula, self.name, self.description, self.template,
+                self.tokens, self.initials, self.pinyin)
+
+    @classmethod
+    def from_data(cls, data: tuple) -> 'FormulaDocument':
+        """从to_data的结果还原，不需要重新计算拼音等"""
+        document = cls.__new__(cls)
+        (document.category, document.formula, document.name, document.description,
+         document.template, document.tokens, document.initials, document.pinyin) = data
+        return document
+
+    @property
+    def fuzzy_keys(self):
+        """模糊匹配的对象"""
+        keys = {self.name, self.initials, self.pinyin} | self.tokens
+        keys.discard('')
+        return keys
+
+    def score(self, term: str) -> int:
+        """单个查询词的得分，0表示不匹配"""
+        if self.name == term:
+            return SCORE_NAME_EXACT
+        if self.name.startswith(term):
+            return SCORE_NAME_PREFIX
+        if term in self.name:
+            return SCORE_NAME
+        if self.initials.startswith(term) or self.pinyin.startswith(term):
+            return SCORE_PINYIN_PREFIX
+        if term in self.initials or term in self.pinyin:
+            return SCORE_PINYIN
+        if term in self.tokens:
+            return SCORE_TOKEN_EXACT
+        if any(token.startswith(term) for token in self.tokens):
+            return SCORE_TOKEN_PREFIX
+        if term in self.template:
+            return SCORE_TEMPLATE
+        if term in self.description:
+            return SCORE_DESCRIPTION
+        return 0
+
+class FormulaSearchIndex:
+    """公式全文索引
+
+    名称、描述、模板和拼音按二元字符片段建立倒排表，名称、模板和全拼
+    按三元片段建立倒排表，模板中的函数名按标记建立倒排表。
+    查询时先用倒排表求候选集，再按匹配位置计算相关度排序；
+    没有精确匹配时按编辑距离做模糊匹配，距离只对不重复的检索键计算，
+    与公式数量无关。
+    """
+
+    def __init__(self):
+        self.documents = {}
+        self.gram_postings = {}
+        self.token_postings = {}
+        self.trigram_postings = {}
+        self.char_grams = {}
+        # 模糊匹配: 检索键 -> 公式名称集合, 三元片段 -> 检索键集合
+        # 只在第一次模糊匹配时建立
+        self.key_postings = None
+        self.key_trigrams = None
+        self._tokens = []
+
+    def build(self, formulas: Dict[str, List[Dict]]):
+        """根据全部公式重建索引(同名公式以先出现的为准)"""
+        self.__init__()
+        for category, items in formulas.items():
+            for formula in items:
+                if formula.get('name') not in self.documents:
+                    self.add(category, formula)
+
+    def add(self, category: str, formula: Dict):
+        """添加公式，同名公式会被替换"""
+        name = formula.get('name', '')
+        if name in self.documents:
+            self.remove(name)
+
+        document = FormulaDocument(category, formula)
+        self.documents[name] = document
+
+        for gram in document.grams:
+            postings = self.gram_postings.get(gram)
+            if postings is None:
+                postings = self.gram_postings[gram] = set()
+                for char in gram:
+                    self.char_grams.setdefault(char, set()).add(gram)
+            postings.add(name)
+        for gram in document.trigrams:
+            self.trigram_postings.setdefault(gram, set()).add(name)
+        if self.key_postings is not None:
+            self._add_keys(name, document)
+        for token in document.tokens:
+            postings = self.token_postings.get(token)
+            if postings is None:
+                postings = self.token_postings[token] = set()
+                bisect.insort(self._tokens, token)
+            postings.add(name)
+
+    def remove(self, name: str):
+        """删除公式"""
+        document = self.documents.pop(name, None)
+        if document is None:
+            return
+
+        for gram in document.grams:
+            postings = self.gram_postings.get(gram)
+            if postings is not None:
+                postings.discard(name)
+                if not postings:
+                    del self.gram_postings[gram]
+                    for char in gram:
+                        grams = self.char_grams.get(char)
+                        if grams is not None:
+                            grams.discard(gram)
+        for gram in document.trigrams:
+            postings = self.trigram_postings.get(gram)
+            if postings is not None:
+                postings.discard(name)
+                if not postings:
+                    del self.trigram_postings[gram]
+        if self.key_postings is not None:
+            self._remove_keys(name, document)
+        for token in document.tokens:
+            postings = self.token_postings.get(token)
+            if postings is not None:
+                postings.discard(name)
+                if not postings:
+                    del self.token_postings[token]
+                    index = bisect.bisect_left(self._tokens, token)
+                    if index < len(self._tokens) and self._tokens[index] == token:
+                        self._tokens.pop(index)
+
+    def update(self, old_name: str, category: str, formula: Dict):
+        """更新公式"""
+        self.remove(old_name)
+        self.add(category, formula)
+
+    def _add_keys(self, name: str, document: FormulaDocument):
+        """添加模糊匹配的检索键"""
+        for key in document.fuzzy_keys:
+            postings = self.key_postings.get(key)
+            if postings is None:
+                postings = self.key_postings[key] = set()
+                for gram in trigrams(key):
+                    self.key_trigrams.setdefault(gram, set()).add(key)
+            postings.add(name)
+
+    def _remove_keys(self, name: str, document: FormulaDocument):
+        """删除模糊匹配的检索键"""
+        for key in document.fuzzy_keys:
+            postings = self.key_postings.get(key)
+            if postings is not None:
+                postings.discard(name)
+                if not postings:
+                    del self.key_postings[key]
+                    for gram in trigrams(key):
+                        keys = self.key_trigrams.get(gram)
+                        if keys is not None:
+                            keys.discard(key)
+                            if not keys:
+                                del self.key_trigrams[gram]
+
+    def _ensure_fuzzy(self):
+        """建立模糊匹配的检索键索引"""
+        if self.key_postings is not None:
+            return
+        self.key_postings = {}
+        self.key_trigrams = {}
+        for name, document in self.documents.items():
+            self._add_keys(name, document)
+
+    def to_data(self) -> dict:
+        """转换为可用marshal保存的数据(不含模糊匹配索引)"""
+        return {
+            'documents': {name: document.to_data() for name, document in self.documents.items()},
+            'gram_postings': self.gram_postings,
+            'token_postings': self.token_postings,
+            'trigram_postings': self.trigram_postings,
+            'char_grams': self.char_grams,
+            'tokens': self._tokens,
+        }
+
+    @classmethod
+    def from_data(cls, data: dict) -> 'FormulaSearchIndex':
+        """从to_data的结果还原"""
+        index = cls()
+        index.documents = {
+            name: FormulaDocument.from_data(document) for name, document in data['documents'].items()
+        }
+        index.gram_postings = data['gram_postings']
+        index.token_postings = data['token_postings']
+        index.trigram_postings = data['trigram_postings']
+        index.char_grams = data['char_grams']
+        index._tokens = data['tokens']
+        return index
+
+    @staticmethod
+    def _intersect(postings: Dict[str, Set[str]], grams: Set[str]) -> Set[str]:
+        """包含全部片段的公式，从最短的倒排表开始求交集"""
+        candidates = None
+        for gram in sorted(grams, key=lambda g: len(postings.get(g, ()))):
+            gram_postings = postings.get(gram)
+            if not gram_postings:
+                return set()
+            candidates = set(gram_postings) if candidates is None else candidates & gram_postings
+            if not candidates:
+                return set()
+        return candidates or set()
+
+    def _term_candidates(self, term: str) -> Set[str]:
+        """单个查询词的候选公式"""
+        if len(term) == 1:
+            # 单字查询：包含该字的所有片段
+            candidates = set()
+            for gram in self.char_grams.get(term, ()):
+                candidates |= self.gram_postings[gram]
+            # 名称只有一个字时没有片段，直接按名称查找
+            for name in (term, term.upper()):
+                if name in self.documents:
+                    candidates.add(name)
+        else:
+            candidates = self._intersect(self.gram_postings, bigrams(term))
+            # 模板、拼音中的匹配
+            if len(term) >= 3:
+                candidates |= self._intersect(self.trigram_postings, trigrams(term))
+
+        # 模板标记按前缀匹配
+        start = bisect.bisect_left(self._tokens, term)
+        for token in self._tokens[start:]:
+            if not token.startswith(term):
+                break
+            candidates |= self.token_postings[token]
+
+        return candidates
+
+    def fuzzy_matches(self, term: str) -> Dict[str, int]:
+        """模糊匹配
+        Args:
+            term: 查询词(至少3个英文字符)
+        Returns:
+            公式名称 -> 编辑距离(只包含不超过上限的)
+        """
+        if len(term) < FUZZY_MIN_LENGTH or not term.isascii():
+            return {}
+        self._ensure_fuzzy()
+
+        # 编辑距离为k时最多有3k个三元片段不同，共有片段太少的检索键不用计算
+        grams = trigrams(term)
+        counts = Counter()
+        for gram in grams:
+            counts.update(self.key_trigrams.get(gram, ()))
+        limit = fuzzy_limit(term)
+        required = max(1, len(grams) - 3 * limit)
+
+        matches = {}
+        for key, count in counts.items():
+            if count < required:
+                continue
+            distance = fuzzy_distance(term, key, limit)
+            if distance > limit:
+                continue
+            for name in self.key_postings[key]:
+                if distance < matches.get(name, limit + 1):
+                    matches[name] = distance
+        return matches
+
+    def search(self, keyword: str, candidates: Optional[Iterable[str]] = None) -> List[Tuple[int, FormulaDocument]]:
+        """搜索公式
+        Args:
+            keyword: 搜索关键词，多个词用空格分隔，需全部匹配
+            candidates: 只在这些公式名称中搜索（可选），
+                用于在上一次的结果中继续缩小范围
+        Returns:
+            按相关度从高到低排列的 (得分, 公式) 列表
+        """
+        terms = keyword.lower().split()
+        if not terms:
+            return []
+
+        if candidates is not None:
+            names = set(name for name in candidates if name in self.documents)
+        else:
+            names = None
+
+        # 没有精确匹配的查询词改用模糊匹配
+        fuzzy = {}
+        for term in sorted(terms, key=len, reverse=True):
+            if candidates is None:
+                term_names = self._term_candidates(term)
+            else:
+                term_names = set(name for name in names if self.documents[name].score(term))
+            if not term_names:
+                fuzzy[term] = self.fuzzy_matches(term)
+                term_names = set(fuzzy[term])
+            names = term_names if names is None else names & term_names
+            if not names:
+                return []
+
+        results = []
+        for name in names:
+            document = self.documents[name]
+            total = 0
+            for term in terms:
+                if term in fuzzy:
+                    score = SCORE_FUZZY - 2 * fuzzy[term][name]
+                else:
+                    score = document.score(term)
+                if not score:
+                    break
+                total += score
+            else:
+                results.append((total, document))
+
+        results.sort(key=lambda item: (-item[0], item[1].category, item[1].formula.get('name', '')))
+        return results
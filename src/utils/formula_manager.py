@@ -1,139 +1,503 @@
 import json
+import marshal
 import os
+import struct
+import tempfile
+import threading
+import time
 from typing import Dict, List, Optional, Any
 import copy
+from .workbook_backend import write_formula, write_formula_chunked
+from .range_address import parse_range, format_cell
+from .xlsx_inject import inject_formulas
+from .formula_index import FormulaSearchIndex
 
-class FormulaManager:
-    def __init__(self):
-        """初始化公式管理器"""
-        self.formulas = {
-            "基础运算": [
-                {
-                    "name": "求和",
-                    "description": "计算选定区域的和",
-                    "template": "=SUM({range})"
-                },
-                {
-                    "name": "平均值",
-                    "description": "计算选定区域的平均值",
-                    "template": "=AVERAGE({range})"
-                },
-                {
-                    "name": "最大值",
-                    "description": "返回选定区域中的最大值",
-                    "template": "=MAX({range})"
-                },
-                {
-                    "name": "最小值",
-                    "description": "返回选定区域中的最小值",
-                    "template": "=MIN({range})"
-                },
-                {
-                    "name": "乘积",
-                    "description": "返回选定区域中所有数值的乘积",
-                    "template": "=PRODUCT({range})"
-                }
-            ],
-            "统计函数": [
-                {
-                    "name": "计数",
-                    "description": "统计选定区域内数值的个数",
-                    "template": "=COUNT({range})"
-                },
-                {
-                    "name": "文本计数",
-                    "description": "统计选定区域内非空单元格的个数",
-                    "template": "=COUNTA({range})"
-                },
-                {
-                    "name": "空值计数",
-                    "description": "统计选定区域内空单元格的个数",
-                    "template": "=COUNTBLANK({range})"
-                },
-                {
-                    "name": "标准差",
-                    "description": "返回选定区域中数值的标准差",
-                    "template": "=STDEV({range})"
-                },
-                {
-                    "name": "方差",
-                    "description": "返回选定区域中数值的方差",
-                    "template": "=VAR({range})"
-                }
-            ],
-            "条件函数": [
-                {
-                    "name": "条件求和",
-                    "description": "计算选定区域内符合条件的数值之和",
-                    "template": "=SUMIF({range}, {criteria})"
-                },
-                {
-                    "name": "条件计数",
-                    "description": "统计选定区域内符合条件的数值个数",
-                    "template": "=COUNTIF({range}, {criteria})"
-                },
-                {
-                    "name": "条件平均",
-                    "description": "计算选定区域内符合条件的数值的平均值",
-                    "template": "=AVERAGEIF({range}, {criteria})"
-                }
-            ],
-            "查找函数": [
-                {
-                    "name": "查找最大值位置",
-                    "description": "查找最大值在区域中的位置",
-                    "template": "=MATCH(MAX({range}),{range},0)"
-                },
-                {
-                    "name": "查找最小值位置",
-                    "description": "查找最小值在区域中的位置",
-                    "template": "=MATCH(MIN({range}),{range},0)"
-                }
-            ]
+# 修改后延迟保存的秒数，期间的多次修改合并为一次写入
+DEFAULT_SAVE_DELAY = 1.0
+
+# formulas.json不存在时使用的内置公式
+DEFAULT_FORMULAS = {
+    "基础运算": [
+        {
+            "name": "求和",
+            "description": "计算选定区域的和",
+            "template": "=SUM({range})"
+        },
+        {
+            "name": "平均值",
+            "description": "计算选定区域的平均值",
+            "template": "=AVERAGE({range})"
+        },
+        {
+            "name": "最大值",
+            "description": "返回选定区域中的最大值",
+            "template": "=MAX({range})"
+        },
+        {
+            "name": "最小值",
+            "description": "返回选定区域中的最小值",
+            "template": "=MIN({range})"
+        },
+        {
+            "name": "乘积",
+            "description": "返回选定区域中所有数值的乘积",
+            "template": "=PRODUCT({range})"
+        }
+    ],
+    "统计函数": [
+        {
+            "name": "计数",
+            "description": "统计选定区域内数值的个数",
+            "template": "=COUNT({range})"
+        },
+        {
+            "name": "文本计数",
+            "description": "统计选定区域内非空单元格的个数",
+            "template": "=COUNTA({range})"
+        },
+        {
+            "name": "空值计数",
+            "description": "统计选定区域内空单元格的个数",
+            "template": "=COUNTBLANK({range})"
+        },
+        {
+            "name": "标准差",
+            "description": "返回选定区域中数值的标准差",
+            "template": "=STDEV({range})"
+        },
+        {
+            "name": "方差",
+            "description": "返回选定区域中数值的方差",
+            "template": "=VAR({range})"
+        }
+    ],
+    "条件函数": [
+        {
+            "name": "条件求和",
+            "description": "计算选定区域内符合条件的数值之和",
+            "template": "=SUMIF({range}, {criteria})"
+        },
+        {
+            "name": "条件计数",
+            "description": "统计选定区域内符合条件的数值个数",
+            "template": "=COUNTIF({range}, {criteria})"
+        },
+        {
+            "name": "条件平均",
+            "description": "计算选定区域内符合条件的数值的平均值",
+            "template": "=AVERAGEIF({range}, {criteria})"
+        }
+    ],
+    "查找函数": [
+        {
+            "name": "查找最大值位置",
+            "description": "查找最大值在区域中的位置",
+            "template": "=MATCH(MAX({range}),{range},0)"
+        },
+        {
+            "name": "查找最小值位置",
+            "description": "查找最小值在区域中的位置",
+            "template": "=MATCH(MIN({range}),{range},0)"
         }
+    ]
+}
+
+# 解析结果缓存的格式版本，缓存内容的结构变化时递增
+CACHE_VERSION = 2
+# 缓存文件头: 缓存键的长度
+CACHE_HEADER = struct.Struct('<I')
+
+def merge_formulas(base: Dict[str, List[Dict]], ours: Dict[str, List[Dict]],
+                   theirs: Dict[str, List[Dict]]) -> tuple:
+    """按公式名称三方合并公式库
+    
+    只有一方相对base修改的公式采用该方的版本；双方都修改且结果不同时保留本地版本
+    并记为冲突。分类和公式的顺序以外部文件为准，本地新增的排在后面。
+    Args:
+        base: 上次载入或保存时文件中的公式库
+        ours: 本地(尚未保存)的公式库
+        theirs: 文件中现在的公式库
+    Returns:
+        (合并后的公式库, 冲突的公式名称列表)
+    """
+    def flatten(formulas):
+        entries = {}
+        for category, items in formulas.items():
+            for formula in items:
+                entries.setdefault(formula['name'], (category, formula))
+        return entries
+    
+    base_entries, our_entries, their_entries = flatten(base), flatten(ours), flatten(theirs)
+    names = list(their_entries) + [name for name in our_entries if name not in their_entries]
+    
+    merged = {}
+    conflicts = []
+    for category in list(theirs) + [category for category in ours if category not in theirs]:
+        # 任意一方删除的空分类不保留
+        if category in base and (category not in ours or category not in theirs):
+            continue
+        merged[category] = []
+    for name in names:
+        base_entry, our_entry, their_entry = (
+            base_entries.get(name), our_entries.get(name), their_entries.get(name)
+        )
+        if our_entry == base_entry:
+            entry = their_entry
+        elif their_entry == base_entry or our_entry == their_entry:
+            entry = our_entry
+        else:
+            entry = our_entry
+            conflicts.append(name)
+        if entry is not None:
+            merged.setdefault(entry[0], []).append(entry[1])
+    return merged, conflicts
+
+class FormulaManager:
+    def __init__(self, save_delay: float = DEFAULT_SAVE_DELAY):
+        """初始化公式管理器
+        Args:
+            save_delay: 修改后延迟保存的秒数
+        """
+        # 公式库: 分类 -> 公式列表
+        self.formulas = {}
+        
+        # 名称索引: 公式名称 -> (分类, 在分类中的位置, 公式信息)
+        self.index = {}
+        # 全文索引: 用于搜索
+        self.search_index = FormulaSearchIndex()
+        
+        # 延迟保存: 修改只设置dirty标志，由后台线程合并写入
+        self.save_delay = save_delay
+        self.dirty = False
+        # 上次载入或保存时文件中的公式库，合并外部修改时作为共同的基础
+        self.base_formulas = {}
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._save_event = threading.Event()
+        self._flusher = None
+        
         self.load_formulas()
     
-    def load_formulas(self) -> Dict:
-        """加载公式配置"""
+    def load_formulas(self, config_path: Optional[str] = None) -> Dict:
+        """加载公式配置
+        
+        优先读取解析结果的marshal缓存(含索引)，缓存与formulas.json的修改时间和大小
+        不一致时重新解析并更新缓存。
+        Args:
+            config_path: 公式配置文件路径，默认为data/formulas.json
+        """
+        start = time.perf_counter()
+        self.cache_hit = False
+        
+        # 获取公式配置文件路径，记录修改时间和大小用于检查外部修改
+        config_path = config_path or os.path.join('data', 'formulas.json')
+        self.source_path = config_path
+        self.source_key = None
         try:
-            # 获取公式配置文件路径
-            config_path = os.path.join('data', 'formulas.json')
+            cache_path = os.path.splitext(config_path)[0] + '.cache'
+            stat = os.stat(config_path)
+            self.source_key = (stat.st_mtime_ns, stat.st_size)
+            key = (CACHE_VERSION,) + self.source_key
             
-            # 读取配置文件
-            with open(config_path, 'r', encoding='utf-8') as f:
-                self.formulas = json.load(f)  # 直接赋值给self.formulas
-                return self.formulas
-                
+            self.cache_hit = self.load_cache(cache_path, key)
+            if not self.cache_hit:
+                # 读取配置文件
+                with open(config_path, 'r', encoding='utf-8') as f:
+                    self.formulas = json.load(f)  # 直接赋值给self.formulas
+                self.rebuild_index()
+                self.save_cache(cache_path, key)
+            self.base_formulas = copy.deepcopy(self.formulas)
+            return self.formulas
+        
+        except FileNotFoundError:
+            print(f"公式配置文件不存在，使用内置公式: {config_path}")
+            self.base_formulas = {}
+            self.formulas = copy.deepcopy(DEFAULT_FORMULAS)
+            self.rebuild_index()
+            return self.formulas
+        
         except Exception as e:
             print(f"加载公式配置失败: {str(e)}")
+            self.base_formulas = {}
             self.formulas = {}  # 确保失败时也是字典
+            self.rebuild_index()
             return self.formulas
+        
+        finally:
+            self.load_time = time.perf_counter() - start
+    
+    def check_for_changes(self) -> Optional[Dict[str, List[str]]]:
+        """检查formulas.json是否被其他程序修改，修改时重新载入
+        
+        只比较文件的修改时间和大小，没有变化时开销很小，可以定时调用。
+        有尚未保存的本地修改时与文件合并，之后保存合并的结果。
+        Returns:
+            没有变化时返回None，否则返回merge_source的结果
+        """
+        try:
+            stat = os.stat(self.source_path)
+        except OSError:
+            return None
+        key = (stat.st_mtime_ns, stat.st_size)
+        if key == self.source_key:
+            return None
+        
+        # 正在保存时下次再检查
+        if not self._write_lock.acquire(blocking=False):
+            return None
+        try:
+            changes = self.merge_source(key)
+        except Exception as e:
+            # 文件可能正在写入，下次再试
+            print(f"重新载入公式配置失败: {str(e)}")
+            return None
+        finally:
+            self._write_lock.release()
+        
+        cache_path = os.path.splitext(self.source_path)[0] + '.cache'
+        self.save_cache(cache_path, (CACHE_VERSION,) + key)
+        return changes
+    
+    def merge_source(self, key: tuple) -> Dict[str, List[str]]:
+        """读取被外部修改的formulas.json，与尚未保存的本地修改合并(调用方持有_write_lock)
+        Args:
+            key: 文件的(修改时间, 大小)
+        Returns:
+            Dict: apply_changes的结果，另外conflicts为双方都修改了的公式，保留本地版本
+        """
+        with open(self.source_path, 'r', encoding='utf-8') as f:
+            theirs = json.load(f)
+        
+        with self._lock:
+            # 没有本地修改时合并结果就是文件的内容
+            formulas, conflicts = merge_formulas(self.base_formulas, self.formulas, theirs)
+            changes = self.apply_changes(formulas)
+            self.base_formulas = copy.deepcopy(theirs)
+            self.source_key = key
+        
+        changes['conflicts'] = conflicts
+        if conflicts:
+            print(f"公式库被外部修改，以下公式保留本地修改: {', '.join(conflicts)}")
+        return changes
+    
+    def apply_changes(self, formulas: Dict[str, List[Dict]]) -> Dict[str, List[str]]:
+        """替换公式库，只更新有变化的公式的全文索引
+        Args:
+            formulas: 新的公式库
+        Returns:
+            Dict: 变化的公式名称和分类
+                - added: 新增的公式
+                - removed: 删除的公式
+                - changed: 内容或分类有变化的公式
+                - categories: 公式列表有变化的分类(包括删除的分类)
+        """
+        with self._lock:
+            old_formulas = self.formulas
+            old_index = self.index
+            self.formulas = formulas
+            
+            # 位置可能整体变化，名称索引直接重建(不涉及拼音等计算)
+            self.index = {}
+            for category, items in formulas.items():
+                for i, formula in enumerate(items):
+                    self.index.setdefault(formula['name'], (category, i, formula))
+            
+            changes = {'added': [], 'removed': [], 'changed': [], 'categories': []}
+            for name in old_index:
+                if name not in self.index:
+                    changes['removed'].append(name)
+                    self.search_index.remove(name)
+            for name, (category, _, formula) in self.index.items():
+                entry = old_index.get(name)
+                if entry is None:
+                    changes['added'].append(name)
+                    self.search_index.add(category, formula)
+                elif entry[0] != category or entry[2] != formula:
+                    changes['changed'].append(name)
+                    self.search_index.add(category, formula)
+                else:
+                    # 内容相同，只更新引用
+                    self.search_index.documents[name].formula = formula
+            
+            for category, items in formulas.items():
+                if old_formulas.get(category) != items:
+                    changes['categories'].append(category)
+            changes['categories'].extend(
+                category for category in old_formulas if category not in formulas
+            )
+            return changes
+    
+    def load_cache(self, cache_path: str, key: tuple) -> bool:
+        """读取解析结果缓存
+        Args:
+            cache_path: 缓存文件路径
+            key: (格式版本, 修改时间, 文件大小)
+        Returns:
+            bool: 缓存有效并已载入
+        """
+        try:
+            with open(cache_path, 'rb') as f:
+                # 先只读取缓存键，不一致时不必读取整个公式库
+                (key_length,) = CACHE_HEADER.unpack(f.read(CACHE_HEADER.size))
+                if marshal.loads(f.read(key_length)) != key:
+                    return False
+                # 整体读入后再反序列化，比逐个对象从文件读取快得多
+                formulas, positions, search_data = marshal.loads(f.read())
+            
+            self.formulas = formulas
+            self.index = {
+                name: (category, i, formulas[category][i])
+                for name, (category, i) in positions.items()
+            }
+            self.search_index = FormulaSearchIndex.from_data(search_data)
+            return True
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            print(f"读取公式缓存失败: {str(e)}")
+            return False
+    
+    def save_cache(self, cache_path: str, key: tuple) -> bool:
+        """保存解析结果缓存(写入临时文件后替换)"""
+        temp_path = None
+        try:
+            fd, temp_path = tempfile.mkstemp(
+                prefix='.formulas_', suffix='.tmp', dir=os.path.dirname(cache_path) or '.'
+            )
+            # 公式信息在公式库和全文索引中是同一个对象，marshal会保留引用关系
+            positions = {name: (category, i) for name, (category, i, _) in self.index.items()}
+            key_data = marshal.dumps(key)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(CACHE_HEADER.pack(len(key_data)))
+                f.write(key_data)
+                f.write(marshal.dumps((self.formulas, positions, self.search_index.to_data())))
+            os.replace(temp_path, cache_path)
+            return True
+        except Exception as e:
+            print(f"保存公式缓存失败: {str(e)}")
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+    
+    def rebuild_index(self):
+        """重建名称索引和全文索引(同名公式以先出现的为准)"""
+        self.index = {}
+        for category, formulas in self.formulas.items():
+            for i, formula in enumerate(formulas):
+                self.index.setdefault(formula['name'], (category, i, formula))
+        self.search_index.build(self.formulas)
+    
+    def reindex_category(self, category: str, start: int = 0):
+        """更新分类中从start开始的公式在索引中的位置"""
+        formulas = self.formulas.get(category, [])
+        for i in range(start, len(formulas)):
+            formula = formulas[i]
+            entry = self.index.get(formula['name'])
+            if entry is None or entry[0] == category:
+                self.index[formula['name']] = (category, i, formula)
+    
+    def get_formulas_path(self) -> str:
+        """formulas.json的完整路径"""
+        # 获取当前文件的绝对路径
+        current_file = os.path.abspath(__file__)
+        # 获取utils目录的路径
+        utils_dir = os.path.dirname(current_file)
+        # 获取src目录的路径
+        src_dir = os.path.dirname(utils_dir)
+        # 获取项目根目录的路径
+        root_dir = os.path.dirname(src_dir)
+        # 构建formulas.json的完整路径
+        return os.path.join(root_dir, 'data', 'formulas.json')
     
     def save_formulas(self) -> bool:
-        """保存公式到文件"""
+        """保存公式到文件
+        
+        先写入同目录下的临时文件再替换原文件，写入中断时原文件不受影响。
+        """
+        temp_path = None
         try:
-            # 获取当前文件的绝对路径
-            current_file = os.path.abspath(__file__)
-            # 获取utils目录的路径
-            utils_dir = os.path.dirname(current_file)
-            # 获取src目录的路径
-            src_dir = os.path.dirname(utils_dir)
-            # 获取项目根目录的路径
-            root_dir = os.path.dirname(src_dir)
-            # 构建formulas.json的完整路径
-            json_path = os.path.join(root_dir, 'data', 'formulas.json')
+            json_path = self.get_formulas_path()
             
             # 确保data目录存在
             os.makedirs(os.path.dirname(json_path), exist_ok=True)
             
-            # 保存到JSON文件
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(self.formulas, f, ensure_ascii=False, indent=2)
+            # 文件在上次载入后被外部修改时先合并，不直接覆盖
+            is_source = os.path.abspath(json_path) == os.path.abspath(self.source_path)
+            if is_source and os.path.exists(json_path):
+                stat = os.stat(json_path)
+                key = (stat.st_mtime_ns, stat.st_size)
+                if key != self.source_key:
+                    self.merge_source(key)
+            
+            # 序列化时不允许修改
+            with self._lock:
+                data = json.dumps(self.formulas, ensure_ascii=False, indent=2)
+            
+            # 写入临时文件后替换
+            fd, temp_path = tempfile.mkstemp(
+                prefix='.formulas_', suffix='.tmp', dir=os.path.dirname(json_path)
+            )
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, json_path)
+            
+            # 自己保存的修改不需要重新载入
+            if is_source:
+                stat = os.stat(json_path)
+                self.source_key = (stat.st_mtime_ns, stat.st_size)
+                self.base_formulas = json.loads(data)
             return True
         except Exception as e:
             print(f"保存公式失败: {str(e)}")
             import traceback
             traceback.print_exc()
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+    
+    def mark_dirty(self) -> bool:
+        """标记公式已修改，由后台线程延迟保存
+        Returns:
+            bool: 总是True
+        """
+        with self._lock:
+            self.dirty = True
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(
+                    target=self._flush_loop, name='FormulaFlusher', daemon=True
+                )
+                self._flusher.start()
+        self._save_event.set()
+        return True
+    
+    def _flush_loop(self):
+        """后台保存线程"""
+        while True:
+            self._save_event.wait()
+            # 等待一段时间，合并连续的修改
+            time.sleep(self.save_delay)
+            self._save_event.clear()
+            self.flush()
+    
+    def flush(self) -> bool:
+        """立即保存未保存的修改(程序退出前调用)
+        Returns:
+            bool: 是否保存成功，没有修改时返回True
+        """
+        with self._write_lock:
+            with self._lock:
+                if not self.dirty:
+                    return True
+                self.dirty = False
+            
+            if self.save_formulas():
+                return True
+            
+            # 保存失败，下次再试
+            with self._lock:
+                self.dirty = True
             return False
     
     def get_categories(self) -> List[str]:
@@ -152,12 +516,9 @@ class FormulaManager:
     def get_formula_description(self, formula_name: str) -> str:
         """获取公式描述"""
         try:
-            # 遍历所有分类
-            for category in self.formulas.values():
-                # 遍历分类中的公式
-                for formula in category:
-                    if formula['name'] == formula_name:
-                        return formula.get('description', '')
+            entry = self.index.get(formula_name)
+            if entry:
+                return entry[2].get('description', '')
             return ''
         except Exception as e:
             print(f"获取公式描述失败: {str(e)}")
@@ -175,12 +536,8 @@ class FormulaManager:
             if isinstance(name, dict):
                 return name
             
-            # 遍历所有分类查找公式
-            for category, formulas in self.formulas.items():
-                for formula in formulas:
-                    if formula['name'] == name:
-                        return formula
-            return None
+            entry = self.index.get(name)
+            return entry[2] if entry else None
         
         except Exception as e:
             print(f"获取公式失败: {str(e)}")
@@ -195,15 +552,19 @@ class FormulaManager:
             bool: 是否成功
         """
         try:
-            # 如果分类不存在，创建新分类
-            if category not in self.formulas:
-                self.formulas[category] = []
-                
-            # 添加公式
-            self.formulas[category].append(formula)
+            with self._lock:
+                # 如果分类不存在，创建新分类
+                if category not in self.formulas:
+                    self.formulas[category] = []
+                    
+                # 添加公式
+                self.formulas[category].append(formula)
+                if formula['name'] not in self.index:
+                    self.index[formula['name']] = (category, len(self.formulas[category]) - 1, formula)
+                    self.search_index.add(category, formula)
             
-            # 保存配置
-            return self.save_formulas()
+            # 延迟保存配置
+            return self.mark_dirty()
         except Exception as e:
             print(f"添加公式失败: {str(e)}")
             return False
@@ -217,16 +578,22 @@ class FormulaManager:
             bool: 是否成功
         """
         try:
-            # 遍历所有分类
-            for category in self.formulas.values():
-                # 遍历分类中的公式
-                for i, formula in enumerate(category):
-                    if formula['name'] == old_name:
-                        # 更新公式
-                        category[i] = new_formula
-                        # 保存配置
-                        return self.save_formulas()
-            return False
+            with self._lock:
+                entry = self.index.get(old_name)
+                if not entry:
+                    return False
+                
+                # 更新公式
+                category, i, _ = entry
+                self.formulas[category][i] = new_formula
+                del self.index[old_name]
+                self.search_index.remove(old_name)
+                if new_formula['name'] not in self.index:
+                    self.index[new_formula['name']] = (category, i, new_formula)
+                    self.search_index.add(category, new_formula)
+            
+            # 延迟保存配置
+            return self.mark_dirty()
         except Exception as e:
             print(f"更新公式失败: {str(e)}")
             return False
@@ -239,16 +606,19 @@ class FormulaManager:
             bool: 是否成功
         """
         try:
-            # 遍历所有分类
-            for category in self.formulas.values():
-                # 遍历分类中的公式
-                for i, formula in enumerate(category):
-                    if formula['name'] == formula_name:
-                        # 删除公式
-                        category.pop(i)
-                        # 保存配置
-                        return self.save_formulas()
-            return False
+            with self._lock:
+                entry = self.index.pop(formula_name, None)
+                if not entry:
+                    return False
+                
+                # 删除公式，后面的公式位置前移
+                category, i, _ = entry
+                self.formulas[category].pop(i)
+                self.reindex_category(category, i)
+                self.search_index.remove(formula_name)
+            
+            # 延迟保存配置
+            return self.mark_dirty()
         except Exception as e:
             print(f"删除公式失败: {str(e)}")
             return False
@@ -261,12 +631,9 @@ class FormulaManager:
             str: 公式模板
         """
         try:
-            # 遍历所有分类
-            for category in self.formulas.values():
-                # 遍历分类中的公式
-                for formula in category:
-                    if formula['name'] == formula_name:
-                        return formula.get('template', '')
+            entry = self.index.get(formula_name)
+            if entry:
+                return entry[2].get('template', '')
             return None
         except Exception as e:
             print(f"获取公式模板失败: {str(e)}")
@@ -301,38 +668,35 @@ class FormulaManager:
             traceback.print_exc()
             return []
     
-    def search_formulas(self, keyword: str) -> List[Dict]:
+    def search_formulas(self, keyword: str, candidates: Optional[List[str]] = None) -> List[Dict]:
         """搜索公式
         
         Args:
-            keyword (str): 搜索关键词
+            keyword (str): 搜索关键词，匹配名称、描述和模板中的函数名，
+                多个词用空格分隔
+            candidates (List[str]): 只在这些公式名称中搜索（可选），
+                关键词在上次基础上追加输入时传入上次的结果
             
         Returns:
-            List[Dict]: 匹配的公式列表，每个公式包含:
+            List[Dict]: 按相关度排序的匹配公式列表，每个公式包含:
                 - category: 分类名称
                 - name: 公式名称
                 - template: 公式模板
                 - description: 公式描述
         """
-        keyword = keyword.lower()
-        results = []
-        
         try:
-            for category, formulas in self.formulas.items():
-                for formula in formulas:
-                    # 在名称和描述中搜索
-                    if (keyword in formula['name'].lower() or 
-                        keyword in formula['description'].lower()):
-                        results.append({
-                            "category": category,
-                            "name": formula['name'],
-                            "template": formula['template'],
-                            "description": formula['description']
-                        })
-            
-            # 按分类和名称排序
-            results.sort(key=lambda x: (x["category"], x["name"]))
-            
+            # 可能在后台线程中搜索，与修改公式互斥
+            with self._lock:
+                matches = self.search_index.search(keyword, candidates)
+                results = []
+                for _, document in matches:
+                    formula = document.formula
+                    results.append({
+                        "category": document.category,
+                        "name": formula['name'],
+                        "template": formula.get('template', ''),
+                        "description": formula.get('description', '')
+                    })
             return results
         except Exception as e:
             print(f"搜索公式时出错: {str(e)}")
@@ -340,6 +704,10 @@ class FormulaManager:
             traceback.print_exc()
             return []
     
+    def search(self, keyword: str) -> List[Dict]:
+        """搜索公式(同search_formulas)"""
+        return self.search_formulas(keyword)
+    
     def prepare_formula(self, category, formula_name, input_range, output_range=None):
         """准备公式
         Args:
@@ -391,14 +759,44 @@ class FormulaManager:
             print(f"准备公式失败: {str(e)}")
             return None
     
-    def apply_formula(self, name, input_range, output_range=None):
+    def render_formula(self, template: str, input_address: str, output_address: Optional[str] = None) -> str:
+        """用区域地址替换公式模板中的占位符
+        Args:
+            template: 公式模板
+            input_address: 输入区域地址
+            output_address: 输出区域地址（可选）
+        Returns:
+            str: 公式文本
+        """
+        # 替换输入区域
+        formula_text = template.replace('{range}', input_address)
+        
+        # 如果有输出区域且公式模板包含输出占位符
+        if output_address and '{output}' in formula_text:
+            formula_text = formula_text.replace('{output}', output_address)
+        
+        # 如果是条件函数，添加条件参数
+        if '{criteria}' in formula_text:
+            # TODO: 后续添加条件输入对话框
+            criteria = '">0"'  # 临时使用固定条件
+            formula_text = formula_text.replace('{criteria}', criteria)
+        
+        return formula_text
+    
+    def apply_formula(self, name, input_range, output_range=None, fill=None,
+                      chunked=False, progress=None, cancelled=None):
         """应用公式
         Args:
             name: 公式名称
             input_range: 输入区域
             output_range: 输出区域（可选）
+            fill: 填充模式（可选），'block' 按相对位置为每个单元格生成公式，
+                'r1c1' 生成一个R1C1公式，均只写入一次
+            chunked: 是否按行分块写入，用于很大的区域
+            progress: 分块写入的进度回调，见write_formula_chunked
+            cancelled: 分块写入时检查是否取消的函数
         Returns:
-            bool: 是否应用成功
+            bool: 是否应用成功，分块写入被取消时返回False
         """
         try:
             # 获取公式信息
@@ -409,30 +807,60 @@ class FormulaManager:
 
             # 获取区域地址
             input_address = input_range.Address
-            if output_range:
-                output_address = output_range.Address
-
-            # 准备公式文本
-            formula_text = formula['template']
-            
-            # 替换输入区域
-            formula_text = formula_text.replace('{range}', input_address)
-            
-            # 如果有输出区域且公式模板包含输出占位符
-            if output_range and '{output}' in formula_text:
-                formula_text = formula_text.replace('{output}', output_address)
-            
-            # 如果是条件函数，添加条件参数
-            if '{criteria}' in formula_text:
-                # TODO: 后续添加条件输入对话框
-                criteria = '">0"'  # 临时使用固定条件
-                formula_text = formula_text.replace('{criteria}', criteria)
+            output_address = output_range.Address if output_range else None
 
             # 应用公式到Excel
             target_range = output_range if output_range else input_range
-            target_range.Formula = formula_text
+            render = lambda address, output: self.render_formula(formula['template'], address, output)
+            if chunked:
+                return write_formula_chunked(
+                    target_range,
+                    render,
+                    input_address,
+                    output_address,
+                    fill=fill,
+                    progress=progress,
+                    cancelled=cancelled
+                )
+            write_formula(
+                target_range,
+                render,
+                input_address,
+                output_address,
+                fill=fill
+            )
             return True
 
         except Exception as e:
             print(f"应用公式失败: {str(e)}")
-            return False 
\ No newline at end of file
+            return False
+
+    def inject_formula(self, name, file_path, input_address, output_address, sheet=None):
+        """直接把公式写入xlsx文件，不经过Excel也不加载整个工作簿
+        Args:
+            name: 公式名称
+            file_path: xlsx文件路径
+            input_address: 输入区域地址
+            output_address: 输出区域地址，区域中每个单元格写入相同的公式
+            sheet: 工作表名称或序号（可选），默认为活动工作表
+        Returns:
+            bool: 是否写入成功
+        """
+        try:
+            formula = self.get_formula(name)
+            if not formula:
+                print(f"未找到公式: {name}")
+                return False
+
+            formula_text = self.render_formula(formula['template'], input_address, output_address)
+            first_row, first_col, last_row, last_col = parse_range(output_address)
+            inject_formulas(file_path, {
+                format_cell(row, col): formula_text
+                for row in range(first_row, last_row + 1)
+                for col in range(first_col, last_col + 1)
+            }, sheet)
+            return True
+
+        except Exception as e:
+            print(f"写入公式失败: {str(e)}")
+            return False
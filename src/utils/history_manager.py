@@ -1,49 +1,281 @@
+import pickle
+import zlib
+from typing import Any, Dict, List, Optional
+from .history_store import HistoryStore
+
+# 状态中按单元格存储的二维数据
+GRID_KEYS = ('values', 'formulas')
+
+class HistoryEntry:
+    """压缩后的历史状态
+
+    关键帧保存完整状态；差量帧只保存相对于关键帧变化的单元格，
+    并引用其关键帧，解码时在关键帧上回放变化。
+    转存到磁盘后内存中只保留偏移量，使用时再读取。
+    """
+    __slots__ = ('_blob', 'base', 'size', 'store', 'offset')
+
+    def __init__(self, blob: bytes, base: Optional['HistoryEntry'] = None):
+        self._blob = blob
+        self.base = base
+        self.size = len(blob)
+        self.store = None
+        self.offset = None
+
+    @property
+    def is_keyframe(self) -> bool:
+        return self.base is None
+
+    @property
+    def in_memory(self) -> bool:
+        return self._blob is not None
+
+    @property
+    def blob(self) -> bytes:
+        if self._blob is not None:
+            return self._blob
+        return self.store.read(self.offset, self.size)
+
+    def spill(self, store: HistoryStore):
+        """转存到磁盘并释放内存"""
+        if self._blob is None:
+            return
+        self.offset = store.write(self._blob)
+        self.store = store
+        self._blob = None
+
+    def release(self):
+        """丢弃记录，释放在磁盘上占用的空间"""
+        if self.store is not None:
+            self.store.free(self.size)
+            self.store = None
+
+    @classmethod
+    def keyframe(cls, state: Any) -> 'HistoryEntry':
+        return cls(zlib.compress(pickle.dumps(state, pickle.HIGHEST_PROTOCOL)))
+
+    @classmethod
+    def delta(cls, state: Dict, base: 'HistoryEntry', base_state: Dict) -> Optional['HistoryEntry']:
+        """生成差量帧，形状不同无法比较时返回None"""
+        if not isinstance(state, dict) or not isinstance(base_state, dict):
+            return None
+
+        changes = {}
+        for key in GRID_KEYS:
+            grid, base_grid = state.get(key), base_state.get(key)
+            if not is_grid(grid) or not is_grid(base_grid):
+                return None
+            if len(grid) != len(base_grid):
+                return None
+            cells = []
+            for i, (row, base_row) in enumerate(zip(grid, base_grid)):
+                if len(row) != len(base_row):
+                    return None
+                if row == base_row:
+                    continue
+                cells.extend(
+                    (i, j, value)
+                    for j, (value, base_value) in enumerate(zip(row, base_row))
+                    if value != base_value
+                )
+            changes[key] = cells
+
+        meta = {key: value for key, value in state.items() if key not in GRID_KEYS}
+        data = pickle.dumps((meta, changes), pickle.HIGHEST_PROTOCOL)
+        return cls(zlib.compress(data), base)
+
+    def decode(self) -> Any:
+        """还原状态"""
+        data = pickle.loads(zlib.decompress(self.blob))
+        if self.is_keyframe:
+            return data
+
+        meta, changes = data
+        state = self.base.decode()
+        for key, cells in changes.items():
+            rows = [list(row) for row in state[key]]
+            for i, j, value in cells:
+                rows[i][j] = value
+            state[key] = tuple(tuple(row) for row in rows)
+        state.update(meta)
+        return state
+
+def is_grid(value: Any) -> bool:
+    """是否为二维元组(单个单元格的值不是)"""
+    return isinstance(value, (tuple, list)) and all(isinstance(row, (tuple, list)) for row in value)
+
+class HistoryCommand:
+    """一次操作的记录：目标区域操作前后的内容
+
+    操作前的内容保存为关键帧，操作后的内容保存为相对它的差量，
+    撤销时写回操作前的内容，重做时写回操作后的内容。
+    """
+    __slots__ = ('before', 'after')
+
+    def __init__(self, before: Dict, after: Dict):
+        self.before = HistoryEntry.keyframe(before)
+        delta = HistoryEntry.delta(after, self.before, before)
+        # 变化太多时差量反而更大，改存完整内容
+        if delta is None or delta.size >= self.before.size:
+            delta = HistoryEntry.keyframe(after)
+        self.after = delta
+
+    @property
+    def entries(self):
+        return (self.before, self.after)
+
+    def spill(self, store: HistoryStore):
+        """转存到磁盘"""
+        for entry in self.entries:
+            entry.spill(store)
+
+    def release(self):
+        """丢弃记录"""
+        for entry in self.entries:
+            entry.release()
+
+# 默认的历史记录内存上限(压缩后)
+DEFAULT_HISTORY_BUDGET = 64 * 1024 * 1024
+
 class HistoryManager:
-    """历史记录管理器"""
-    def __init__(self):
+    """历史记录管理器
+
+    每条记录只保存一次操作覆盖的区域，撤销时对该区域执行逆操作，
+    占用的时间和内存与操作涉及的单元格数成正比。
+    """
+    def __init__(self, config=None):
         self.history = []
         self.redo_stack = []
-        self.initial_state = None
-        
-    def save_state(self, state):
-        """保存状态"""
-        self.history.append(state)
+
+        # 步数和内存上限，超出时淘汰最早的记录
+        config = config if config is not None else {}
+        self.max_history = config.get('excel.max_history', 20)
+        self.max_bytes = config.get('excel.history_budget', DEFAULT_HISTORY_BUDGET)
+        self.evicted_count = 0
+
+        # 可选的磁盘存储：只在内存中保留最近的若干条记录
+        self.store = None
+        self.memory_states = config.get('excel.history_memory_states', 5)
+        if config.get('excel.history_spill', False):
+            self.store = HistoryStore(config.get('excel.history_spill_dir'))
+
+    def save_command(self, before: Dict, after: Dict):
+        """记录一次操作
+        Args:
+            before: 操作前目标区域的状态(get_current_state的结果)
+            after: 操作后同一区域的状态
+        """
+        self.history.append(HistoryCommand(before, after))
+        self.discard(self.redo_stack)
         self.redo_stack.clear()
-        
-        if self.initial_state is None:
-            self.initial_state = state.copy()
-            
+
+        self.enforce_limits()
+        self.spill_old_entries()
+
+    def spill_old_entries(self):
+        """把最近记录以外的记录转存到磁盘"""
+        if self.store is None:
+            return
+
+        recent = self.history[-self.memory_states:] if self.memory_states > 0 else []
+        keep = set(id(command) for command in recent + self.redo_stack)
+        for command in self.history:
+            if id(command) not in keep:
+                command.spill(self.store)
+
+    def discard(self, commands: List[HistoryCommand]):
+        """丢弃不再需要的记录，磁盘文件中失效的记录过多时压缩文件"""
+        if self.store is None:
+            return
+        for command in commands:
+            command.release()
+        if self.store.needs_compaction():
+            self.store.compact([
+                entry
+                for command in self.history + self.redo_stack
+                for entry in command.entries
+                if entry.store is self.store
+            ])
+
+    def enforce_limits(self):
+        """超出步数或内存上限时淘汰最早的记录(至少保留最新的一条)"""
+        while len(self.history) > 1:
+            if len(self.history) <= self.max_history and self.memory_usage() <= self.max_bytes:
+                break
+            self.discard([self.history.pop(0)])
+            self.evicted_count += 1
+
     def can_undo(self):
-        return len(self.history) > 1
-        
+        return len(self.history) > 0
+
     def can_redo(self):
         return len(self.redo_stack) > 0
-        
+
     def can_reset(self):
-        return self.initial_state is not None 
+        return len(self.history) > 0
 
-    def undo(self):
-        """撤销操作"""
+    def peek_undo(self) -> Optional[Dict]:
+        """撤销需要写回的状态，不修改历史记录；写回成功后再调用undo"""
         if self.can_undo():
-            state = self.history.pop()
-            self.redo_stack.append(state)
-            return self.history[-1]
+            return self.history[-1].before.decode()
         return None
 
-    def redo(self):
-        """重做操作"""
+    def peek_redo(self) -> Optional[Dict]:
+        """重做需要写回的状态，不修改历史记录；写回成功后再调用redo"""
         if self.can_redo():
-            state = self.redo_stack.pop()
-            self.history.append(state)
-            return state
+            return self.redo_stack[-1].after.decode()
         return None
 
-    def reset(self):
-        """重置状态"""
-        if self.can_reset():
-            state = self.initial_state.copy()
-            self.history.clear()
-            self.redo_stack.clear()
-            self.history.append(state)
-            return state
-        return None 
\ No newline at end of file
+    def peek_reset(self) -> List[Dict]:
+        """重置需要按从新到旧顺序写回的状态，不修改历史记录"""
+        return [command.before.decode() for command in reversed(self.history)]
+
+    def undo(self) -> bool:
+        """撤销操作：把最新的记录移到重做栈(只修改历史记录，写回的状态由peek_undo取得)
+        Returns:
+            bool: 是否有可撤销的记录
+        """
+        if not self.can_undo():
+            return False
+        self.redo_stack.append(self.history.pop())
+        return True
+
+    def redo(self) -> bool:
+        """重做操作：把重做栈顶的记录移回历史记录(写回的状态由peek_redo取得)
+        Returns:
+            bool: 是否有可重做的记录
+        """
+        if not self.can_redo():
+            return False
+        self.history.append(self.redo_stack.pop())
+        return True
+
+    def reset(self) -> bool:
+        """重置状态：丢弃所有记录(写回的状态由peek_reset取得)
+        Returns:
+            bool: 是否有可重置的记录
+        """
+        had_history = self.can_reset()
+        self.discard(self.history + self.redo_stack)
+        self.history.clear()
+        self.redo_stack.clear()
+        return had_history
+
+    def memory_usage(self) -> int:
+        """历史记录占用的内存字节数(压缩后，已转存到磁盘的不计)"""
+        return sum(
+            entry.size
+            for command in self.history + self.redo_stack
+            for entry in command.entries
+            if entry.in_memory
+        )
+
+    def disk_usage(self) -> int:
+        """磁盘存储文件的字节数"""
+        return self.store.size if self.store else 0
+
+    def close(self):
+        """释放磁盘存储"""
+        if self.store is not None:
+            self.store.close()
+            self.store = None
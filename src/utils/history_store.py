@@ -0,0 +1,102 @@
+import mmap
+import os
+import struct
+import tempfile
+from typing import Any, List, Optional
+
+# 记录头：数据长度(4字节，小端)
+RECORD_HEADER = struct.Struct('<I')
+
+# 失效记录超过该字节数且超过文件的一半时压缩文件
+COMPACT_MIN_BYTES = 64 * 1024
+
+class HistoryStore:
+    """历史记录磁盘存储
+
+    把较早的历史状态(已压缩的字节)顺序追加到本地临时文件，
+    每条记录为 长度头 + 数据，读取时通过内存映射按偏移量取出。
+    被淘汰的记录只计入失效字节数，积累到一定程度后由compact回收。
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(prefix='history_', suffix='.bin', dir=directory)
+        self.file = os.fdopen(fd, 'w+b')
+        self.size = 0
+        self.dead = 0
+        self._map = None
+
+    def write(self, data: bytes) -> int:
+        """追加一条记录
+        Returns:
+            int: 记录的偏移量
+        """
+        offset = self.size
+        self.file.seek(offset)
+        self.file.write(RECORD_HEADER.pack(len(data)))
+        self.file.write(data)
+        self.file.flush()
+        self.size += RECORD_HEADER.size + len(data)
+        return offset
+
+    def read(self, offset: int, length: int) -> bytes:
+        """读取记录"""
+        # 文件增长后需要重新映射
+        if self._map is None or len(self._map) < offset + RECORD_HEADER.size + length:
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self.file.fileno(), self.size, access=mmap.ACCESS_READ)
+
+        start = offset + RECORD_HEADER.size
+        (stored_length,) = RECORD_HEADER.unpack_from(self._map, offset)
+        if stored_length != length:
+            raise ValueError(f"历史记录损坏: 偏移量 {offset}")
+        return self._map[start:start + length]
+
+    def free(self, length: int):
+        """标记一条记录失效，空间在压缩时回收
+        Args:
+            length: 记录的数据长度
+        """
+        self.dead += RECORD_HEADER.size + length
+
+    def needs_compaction(self) -> bool:
+        """失效记录是否多到需要压缩"""
+        return self.dead > COMPACT_MIN_BYTES and self.dead * 2 > self.size
+
+    def compact(self, entries: List[Any]):
+        """把仍在使用的记录依次前移并截断文件
+        Args:
+            entries: 仍在使用的记录，需要有offset和size属性，偏移量会被更新
+        """
+        position = 0
+        for entry in sorted(entries, key=lambda entry: entry.offset):
+            # 新位置不会超过原位置，先读出再写入不会覆盖后面的记录
+            data = self.read(entry.offset, entry.size)
+            if entry.offset != position:
+                self.file.seek(position)
+                self.file.write(RECORD_HEADER.pack(len(data)))
+                self.file.write(data)
+                entry.offset = position
+            position += RECORD_HEADER.size + len(data)
+
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self.file.truncate(position)
+        self.file.flush()
+        self.size = position
+        self.dead = 0
+
+    def close(self):
+        """关闭并删除存储文件"""
+        try:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            self.file.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+        except Exception as e:
+            print(f"关闭历史存储失败: {str(e)}")
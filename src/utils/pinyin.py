@@ -0,0 +1,71 @@
+from typing import List, Tuple
+
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:
+    lazy_pinyin = None
+
+# 未安装pypinyin时使用的常用字拼音表，覆盖公式名称和分类中的常见汉字
+PINYIN_TABLE = {
+    '百': 'bai', '报': 'bao', '本': 'ben', '比': 'bi', '编': 'bian', '标': 'biao',
+    '表': 'biao', '并': 'bing', '不': 'bu', '部': 'bu', '参': 'can', '侧': 'ce',
+    '查': 'cha', '差': 'cha', '长': 'chang', '常': 'chang', '乘': 'cheng', '除': 'chu',
+    '础': 'chu', '串': 'chuan', '错': 'cuo', '大': 'da', '单': 'dan', '当': 'dang',
+    '到': 'dao', '等': 'deng', '低': 'di', '点': 'dian', '定': 'ding', '度': 'du',
+    '断': 'duan', '对': 'dui', '额': 'e', '二': 'er', '返': 'fan', '方': 'fang',
+    '非': 'fei', '分': 'fen', '份': 'fen', '符': 'fu', '负': 'fu', '复': 'fu',
+    '高': 'gao', '格': 'ge', '个': 'ge', '根': 'gen', '公': 'gong', '估': 'gu',
+    '果': 'guo', '函': 'han', '行': 'hang', '号': 'hao', '合': 'he', '和': 'he',
+    '后': 'hou', '换': 'huan', '回': 'hui', '或': 'huo', '基': 'ji', '机': 'ji',
+    '积': 'ji', '计': 'ji', '辑': 'ji', '加': 'jia', '假': 'jia', '价': 'jia',
+    '间': 'jian', '件': 'jian', '减': 'jian', '接': 'jie', '截': 'jie', '今': 'jin',
+    '金': 'jin', '精': 'jing', '旧': 'jiu', '据': 'ju', '绝': 'jue', '均': 'jun',
+    '开': 'kai', '空': 'kong', '列': 'lie', '利': 'li', '量': 'liang', '连': 'lian',
+    '零': 'ling', '率': 'lv', '逻': 'luo', '码': 'ma', '幂': 'mi', '名': 'ming',
+    '年': 'nian', '排': 'pai', '判': 'pan', '配': 'pei', '匹': 'pi', '频': 'pin',
+    '平': 'ping', '期': 'qi', '前': 'qian', '且': 'qie', '求': 'qiu', '取': 'qu',
+    '去': 'qu', '全': 'quan', '确': 'que', '日': 'ri', '如': 'ru', '入': 'ru',
+    '舍': 'she', '上': 'shang', '时': 'shi', '式': 'shi', '数': 'shu', '四': 'si',
+    '算': 'suan', '随': 'sui', '余': 'yu', '提': 'ti', '替': 'ti', '天': 'tian',
+    '条': 'tiao', '统': 'tong', '投': 'tou', '为': 'wei', '位': 'wei', '文': 'wen',
+    '误': 'wu', '五': 'wu', '息': 'xi', '下': 'xia', '现': 'xian', '向': 'xiang',
+    '小': 'xiao', '写': 'xie', '新': 'xin', '序': 'xu', '引': 'yin', '用': 'yong',
+    '右': 'you', '于': 'yu', '元': 'yuan', '月': 'yue', '运': 'yun', '真': 'zhen',
+    '整': 'zheng', '正': 'zheng', '值': 'zhi', '指': 'zhi', '置': 'zhi', '中': 'zhong',
+    '众': 'zhong', '重': 'zhong', '找': 'zhao', '折': 'zhe', '转': 'zhuan', '准': 'zhun',
+    '资': 'zi', '字': 'zi', '总': 'zong', '最': 'zui', '左': 'zuo',
+}
+
+def is_cjk(char: str) -> bool:
+    """是否为汉字"""
+    return '一' <= char <= '鿿'
+
+def to_pinyin(text: str) -> List[str]:
+    """把文本转换为拼音音节列表，连续的非汉字字符作为一项"""
+    if lazy_pinyin is not None:
+        return [syllable.lower() for syllable in lazy_pinyin(text)]
+
+    syllables = []
+    run = ''
+    for char in text:
+        if is_cjk(char):
+            if run:
+                syllables.append(run)
+                run = ''
+            syllables.append(PINYIN_TABLE.get(char, char))
+        else:
+            run += char.lower()
+    if run:
+        syllables.append(run)
+    return syllables
+
+def pinyin_keys(text: str) -> Tuple[str, str]:
+    """生成拼音检索键
+    Args:
+        text: 公式名称
+    Returns:
+        (首字母, 全拼)，例如 条件求和 -> ('tjqh', 'tiaojianqiuhe')
+    """
+    syllables = [syllable.strip() for syllable in to_pinyin(text)]
+    syllables = [syllable for syllable in syllables if syllable]
+    return ''.join(syllable[0] for syllable in syllables), ''.join(syllables)
@@ -0,0 +1,275 @@
+import re
+from typing import List, Tuple
+
+# 单元格引用，例如 A1 / $B$2
+CELL_PATTERN = re.compile(r'^\$?([A-Za-z]{1,3})\$?(\d+)$')
+# 整行/整列引用中的端点，例如 $A / 3
+BOUND_PATTERN = re.compile(r'^\$?([A-Za-z]{1,3})?\$?(\d+)?$')
+
+# 工作表最大行列数
+MAX_ROWS = 1048576
+MAX_COLS = 16384
+
+def column_index(letters: str) -> int:
+    """列字母转列号(从1开始)"""
+    index = 0
+    for char in letters.upper():
+        index = index * 26 + (ord(char) - ord('A') + 1)
+    return index
+
+def column_letter(index: int) -> str:
+    """列号(从1开始)转列字母"""
+    letters = ''
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+def parse_cell(ref: str) -> Tuple[int, int]:
+    """解析单元格引用
+    Args:
+        ref: 单元格引用，如 "$A$1"
+    Returns:
+        (行号, 列号)
+    """
+    match = CELL_PATTERN.match(ref.strip())
+    if not match:
+        raise ValueError(f"无效的单元格引用: {ref}")
+    return int(match.group(2)), column_index(match.group(1))
+
+def parse_range(address: str) -> Tuple[int, int, int, int]:
+    """解析区域地址
+    Args:
+        address: 区域地址，如 "$A$1:$C$3"、"Sheet1!A1"、"$A:$B"，
+            多个区域(逗号分隔)时返回它们的外接矩形
+    Returns:
+        (起始行, 起始列, 结束行, 结束列)
+    """
+    # 去掉工作表前缀
+    if '!' in address:
+        address = address.rsplit('!', 1)[1]
+
+    bounds = [_parse_area(area) for area in address.split(',')]
+    return (
+        min(b[0] for b in bounds),
+        min(b[1] for b in bounds),
+        max(b[2] for b in bounds),
+        max(b[3] for b in bounds)
+    )
+
+def _parse_area(area: str) -> Tuple[int, int, int, int]:
+    """解析单个区域，支持整行(3:5)和整列(A:C)引用"""
+    parts = area.strip().split(':')
+    if len(parts) == 2 and not CELL_PATTERN.match(parts[0].strip()):
+        first = BOUND_PATTERN.match(parts[0].strip())
+        last = BOUND_PATTERN.match(parts[1].strip())
+        if not first or not last:
+            raise ValueError(f"无效的区域地址: {area}")
+        if first.group(1) and last.group(1):
+            # 整列
+            first_row, last_row = 1, MAX_ROWS
+            first_col, last_col = column_index(first.group(1)), column_index(last.group(1))
+        elif first.group(2) and last.group(2):
+            # 整行
+            first_row, last_row = int(first.group(2)), int(last.group(2))
+            first_col, last_col = 1, MAX_COLS
+        else:
+            raise ValueError(f"无效的区域地址: {area}")
+    else:
+        first_row, first_col = parse_cell(parts[0])
+        last_row, last_col = parse_cell(parts[-1])
+
+    return (
+        min(first_row, last_row),
+        min(first_col, last_col),
+        max(first_row, last_row),
+        max(first_col, last_col)
+    )
+
+def format_cell(row: int, col: int, absolute: bool = True) -> str:
+    """生成单元格引用"""
+    if absolute:
+        return f"${column_letter(col)}${row}"
+    return f"{column_letter(col)}{row}"
+
+def format_range(first_row: int, first_col: int, last_row: int, last_col: int,
+                 absolute: bool = True) -> str:
+    """生成区域地址(与Excel的Range.Address格式一致)"""
+    first = format_cell(first_row, first_col, absolute)
+    if (first_row, first_col) == (last_row, last_col):
+        return first
+    return f"{first}:{format_cell(last_row, last_col, absolute)}"
+
+def expand_range(address: str, margin: int) -> str:
+    """把区域向四周扩展margin行/列(不超出工作表边界)"""
+    first_row, first_col, last_row, last_col = parse_range(address)
+    return format_range(
+        max(1, first_row - margin), max(1, first_col - margin),
+        min(MAX_ROWS, last_row + margin), min(MAX_COLS, last_col + margin)
+    )
+
+def split_areas(address: str) -> Tuple[str, List[Tuple[str, Tuple[int, int, int, int]]]]:
+    """拆分区域地址
+    Args:
+        address: 区域地址，可以带工作表前缀，多个区域用逗号分隔
+    Returns:
+        (工作表前缀(含!), [(类型, (起始行, 起始列, 结束行, 结束列))])，
+        类型为 'column'(整列)、'row'(整行) 或 'cell'
+    """
+    prefix = ''
+    if '!' in address:
+        sheet, address = address.rsplit('!', 1)
+        prefix = sheet + '!'
+
+    areas = []
+    for area in address.split(','):
+        bounds = _parse_area(area)
+        if not re.search(r'\d', area):
+            kind = 'column'
+        elif not re.search(r'[A-Za-z]', area):
+            kind = 'row'
+        else:
+            kind = 'cell'
+        areas.append((kind, bounds))
+    return prefix, areas
+
+def shift_range(address: str, row_offset: int, col_offset: int) -> str:
+    """按偏移量平移区域(相当于Excel中相对引用的填充)
+    
+    整列引用只平移列，整行引用只平移行，多个区域分别平移。
+    Raises:
+        ValueError: 地址无效或平移后超出工作表范围
+    """
+    prefix, areas = split_areas(address)
+    shifted = []
+    for kind, (first_row, first_col, last_row, last_col) in areas:
+        if kind != 'row':
+            first_col, last_col = first_col + col_offset, last_col + col_offset
+            if first_col < 1 or last_col > MAX_COLS:
+                raise ValueError(f"平移后超出工作表范围: {address}")
+        if kind != 'column':
+            first_row, last_row = first_row + row_offset, last_row + row_offset
+            if first_row < 1 or last_row > MAX_ROWS:
+                raise ValueError(f"平移后超出工作表范围: {address}")
+
+        if kind == 'column':
+            shifted.append(f"${column_letter(first_col)}:${column_letter(last_col)}")
+        elif kind == 'row':
+            shifted.append(f"${first_row}:${last_row}")
+        else:
+            shifted.append(format_range(first_row, first_col, last_row, last_col))
+    return prefix + ','.join(shifted)
+
+def to_r1c1(address: str, base_row: int, base_col: int) -> str:
+    """把区域转换为相对于基准单元格的R1C1引用
+    
+    整列引用转换为C[n]:C[m]，整行引用转换为R[n]:R[m]，多个区域分别转换。
+    Raises:
+        ValueError: 地址无效
+    """
+    def relative(prefix, offset):
+        return f"{prefix}[{offset}]" if offset else prefix
+
+    prefix, areas = split_areas(address)
+    converted = []
+    for kind, (first_row, first_col, last_row, last_col) in areas:
+        if kind == 'column':
+            converted.append(f"{relative('C', first_col - base_col)}:{relative('C', last_col - base_col)}")
+            continue
+        if kind == 'row':
+            converted.append(f"{relative('R', first_row - base_row)}:{relative('R', last_row - base_row)}")
+            continue
+        first = relative('R', first_row - base_row) + relative('C', first_col - base_col)
+        if (first_row, first_col) == (last_row, last_col):
+            converted.append(first)
+        else:
+            converted.append(f"{first}:{relative('R', last_row - base_row)}{relative('C', last_col - base_col)}")
+    return prefix + ','.join(converted)
+
+# R1C1引用: 整列(C[1]:C[2])、整行(R1:R3)或单元格(RC、R[-1]C[2]、R1C1)
+R1C1_PATTERN = re.compile(
+    r'(?<![\w.$])(?:'
+    r'C(\[-?\d+\]|\d+)?:C(\[-?\d+\]|\d+)?'
+    r'|R(\[-?\d+\]|\d+)?:R(\[-?\d+\]|\d+)?'
+    r'|R(\[-?\d+\]|\d+)?C(\[-?\d+\]|\d+)?'
+    r')(?![\w(])'
+)
+# A1引用: 整列(A:B)、整行(3:5)或单元格(A1)；字符串常量和带引号的工作表名原样保留
+A1_PATTERN = re.compile(
+    r'"[^"]*"|\'[^\']*\''
+    r'|(?<![\w.$])(?:'
+    r'\$?([A-Za-z]{1,3}):\$?([A-Za-z]{1,3})'
+    r'|\$?(\d+):\$?(\d+)'
+    r'|\$?([A-Za-z]{1,3})\$?(\d+)'
+    r')(?![\w(])'
+)
+
+def r1c1_to_a1(formula: str, row: int, col: int) -> str:
+    """把R1C1公式转换为指定单元格上的A1公式(字符串常量中的内容不转换)"""
+    def part(text, base):
+        if text is None:
+            return base, False
+        if text.startswith('['):
+            return base + int(text[1:-1]), False
+        return int(text), True
+
+    def column(text):
+        index, absolute = part(text, col)
+        return ('$' if absolute else '') + column_letter(index)
+
+    def row_number(text):
+        index, absolute = part(text, row)
+        return ('$' if absolute else '') + str(index)
+
+    def convert(match):
+        if match.group(0).startswith('C'):
+            return f"{column(match.group(1))}:{column(match.group(2))}"
+        if ':' in match.group(0):
+            return f"{row_number(match.group(3))}:{row_number(match.group(4))}"
+        return column(match.group(6)) + row_number(match.group(5))
+
+    # 按引号拆分，奇数段为字符串常量
+    parts = formula.split('"')
+    for i in range(0, len(parts), 2):
+        parts[i] = R1C1_PATTERN.sub(convert, parts[i])
+    return '"'.join(parts)
+
+def a1_to_absolute_r1c1(formula: str) -> str:
+    """把公式中的A1引用都转换为绝对R1C1引用(不论是否带$)
+    
+    用于公式模板中写死的引用：按'block'方式填充时它们在每个单元格中都相同。
+    """
+    def convert(match):
+        if match.group(1):
+            return f"C{column_index(match.group(1))}:C{column_index(match.group(2))}"
+        if match.group(3):
+            return f"R{match.group(3)}:R{match.group(4)}"
+        if match.group(5):
+            return f"R{match.group(6)}C{column_index(match.group(5))}"
+        # 字符串常量或工作表名
+        return match.group(0)
+
+    return A1_PATTERN.sub(convert, formula)
+
+# A1引用中的列字母或行号(可能带$)
+A1_PART_PATTERN = re.compile(r'(\$?)([A-Za-z]{1,3}|\d+)')
+
+def translate_formula(formula: str, row_offset: int, col_offset: int) -> str:
+    """平移A1公式中的相对引用(相当于把公式复制到偏移后的单元格)，带$的部分不变
+    
+    用于展开共享公式：从属单元格的公式由主单元格的公式平移得到。
+    """
+    def shift(match):
+        if match.group(1):
+            return match.group(0)
+        if match.group(2).isdigit():
+            return str(int(match.group(2)) + row_offset)
+        return column_letter(column_index(match.group(2)) + col_offset)
+
+    def convert(match):
+        if match.group(1) or match.group(3) or match.group(5):
+            return A1_PART_PATTERN.sub(shift, match.group(0))
+        # 字符串常量或工作表名
+        return match.group(0)
+
+    return A1_PATTERN.sub(convert, formula)
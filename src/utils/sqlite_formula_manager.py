@@ -0,0 +1,479 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+from .formula_manager import FormulaManager
+from .formula_index import FUZZY_MIN_LENGTH, fuzzy_distance, fuzzy_limit, template_tokens, trigrams
+from .pinyin import pinyin_keys
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS categories (
+    name TEXT PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS formulas (
+    id INTEGER PRIMARY KEY,
+    category TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT '',
+    template TEXT NOT NULL DEFAULT '',
+    pinyin TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS formulas_name ON formulas(name);
+CREATE INDEX IF NOT EXISTS formulas_category ON formulas(category, position);
+CREATE VIRTUAL TABLE IF NOT EXISTS formulas_fts USING fts5(
+    name, description, template, pinyin,
+    content='formulas', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS formulas_ai AFTER INSERT ON formulas BEGIN
+    INSERT INTO formulas_fts(rowid, name, description, template, pinyin)
+    VALUES (new.id, new.name, new.description, new.template, new.pinyin);
+END;
+CREATE TRIGGER IF NOT EXISTS formulas_ad AFTER DELETE ON formulas BEGIN
+    INSERT INTO formulas_fts(formulas_fts, rowid, name, description, template, pinyin)
+    VALUES ('delete', old.id, old.name, old.description, old.template, old.pinyin);
+END;
+CREATE TRIGGER IF NOT EXISTS formulas_au AFTER UPDATE ON formulas BEGIN
+    INSERT INTO formulas_fts(formulas_fts, rowid, name, description, template, pinyin)
+    VALUES ('delete', old.id, old.name, old.description, old.template, old.pinyin);
+    INSERT INTO formulas_fts(rowid, name, description, template, pinyin)
+    VALUES (new.id, new.name, new.description, new.template, new.pinyin);
+END;
+CREATE TABLE IF NOT EXISTS fuzzy_keys (
+    formula_id INTEGER NOT NULL,
+    key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS fuzzy_keys_formula ON fuzzy_keys(formula_id);
+CREATE INDEX IF NOT EXISTS fuzzy_keys_key ON fuzzy_keys(key);
+CREATE TABLE IF NOT EXISTS key_trigrams (
+    gram TEXT NOT NULL,
+    key TEXT NOT NULL,
+    PRIMARY KEY (gram, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS key_trigrams_key ON key_trigrams(key);
+CREATE TRIGGER IF NOT EXISTS formulas_keys_ad AFTER DELETE ON formulas BEGIN
+    DELETE FROM fuzzy_keys WHERE formula_id = old.id;
+END;
+CREATE TRIGGER IF NOT EXISTS fuzzy_keys_ad AFTER DELETE ON fuzzy_keys BEGIN
+    DELETE FROM key_trigrams WHERE key = old.key
+        AND NOT EXISTS (SELECT 1 FROM fuzzy_keys WHERE key = old.key);
+END;
+"""
+
+# 同名公式以分类和位置靠前的为准
+ORDER = "c.position, f.position, f.id"
+
+# trigram分词器只能匹配至少3个字符的查询词
+FTS_MIN_LENGTH = 3
+
+# 内存中缓存的分类页数
+DEFAULT_PAGE_CACHE = 32
+
+def pinyin_text(name: str) -> str:
+    """名称的拼音检索文本: 首字母和全拼"""
+    return ' '.join(pinyin_keys(name))
+
+def fuzzy_keys(name: str, template: str, pinyin: str) -> Set[str]:
+    """模糊匹配的检索键，与FormulaDocument.fuzzy_keys相同: 名称、拼音和模板中的英文标记"""
+    keys = {name.lower(), *pinyin.split(), *template_tokens(template)}
+    keys.discard('')
+    return keys
+
+class SqliteFormulaManager(FormulaManager):
+    """基于SQLite的公式管理器
+
+    公式保存在本地SQLite数据库中，名称建有索引，搜索使用FTS5全文索引，
+    分类下的公式按需读取并缓存最近使用的若干页，不需要把整个公式库载入内存。
+    模糊匹配的检索键及其三元片段也保存在表中，先用SQL筛选候选再计算编辑距离。
+    接口与FormulaManager相同，数据库为空时从formulas.json导入。
+    连接在界面线程和搜索线程之间共享，所有读写都在_lock中进行。
+    """
+
+    def __init__(self, database: Optional[str] = None, source: Optional[str] = None,
+                 page_cache: int = DEFAULT_PAGE_CACHE):
+        """初始化
+        Args:
+            database: 数据库文件路径，默认为data/formulas.db
+            source: 首次使用时导入的JSON文件，默认为data/formulas.json
+            page_cache: 缓存的分类页数
+        """
+        self.database = database or os.path.join('data', 'formulas.db')
+        self.source = source or os.path.join('data', 'formulas.json')
+        self.page_cache = page_cache
+        self.pages = OrderedDict()
+        self.conn = None
+        # 初始化共享的状态(锁、延迟保存等)，其中会调用load_formulas打开数据库
+        super().__init__()
+
+    def load_formulas(self) -> bool:
+        """打开数据库，为空时从JSON导入"""
+        start = time.perf_counter()
+        self.cache_hit = False
+        self.source_path = self.source
+        self.source_key = None
+        try:
+            directory = os.path.dirname(self.database)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.conn = sqlite3.connect(self.database, check_same_thread=False)
+            self.conn.row_factory = sqlite3.Row
+            with self.conn:
+                self.conn.executescript(SCHEMA)
+
+            empty = self.conn.execute("SELECT 1 FROM formulas LIMIT 1").fetchone() is None
+            if empty and os.path.exists(self.source):
+                with open(self.source, 'r', encoding='utf-8') as f:
+                    self.import_formulas(json.load(f))
+            else:
+                # 旧版本的数据库没有模糊匹配的检索键
+                with self._lock, self.conn:
+                    self._index_keys()
+            return True
+        except Exception as e:
+            print(f"打开公式数据库失败: {str(e)}")
+            return False
+        finally:
+            self.load_time = time.perf_counter() - start
+
+    def import_formulas(self, formulas: Dict[str, List[Dict]]):
+        """批量导入公式(分类 -> 公式列表)"""
+        with self._lock, self.conn:
+            for category, items in formulas.items():
+                self._ensure_category(category)
+                self.conn.executemany(
+                    "INSERT INTO formulas (category, position, name, description, template, pinyin) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (category, i, formula['name'], formula.get('description', ''),
+                         formula.get('template', ''), pinyin_text(formula['name']))
+                        for i, formula in enumerate(items)
+                    ]
+                )
+            self._index_keys()
+            self.pages.clear()
+
+    def _index_keys(self, ids: Optional[List[int]] = None):
+        """写入公式的模糊匹配检索键(调用方持有_lock并在事务中)
+        Args:
+            ids: 公式id，默认为还没有检索键的全部公式
+        """
+        if ids is None:
+            rows = self.conn.execute(
+                "SELECT id, name, template, pinyin FROM formulas f "
+                "WHERE NOT EXISTS (SELECT 1 FROM fuzzy_keys k WHERE k.formula_id = f.id)"
+            ).fetchall()
+        else:
+            rows = self.conn.execute(
+                "SELECT id, name, template, pinyin FROM formulas WHERE id IN (SELECT value FROM json_each(?))",
+                (json.dumps(ids),)
+            ).fetchall()
+
+        entries = [
+            (row['id'], key)
+            for row in rows for key in fuzzy_keys(row['name'], row['template'], row['pinyin'])
+        ]
+        self.conn.executemany("INSERT INTO fuzzy_keys (formula_id, key) VALUES (?, ?)", entries)
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO key_trigrams (gram, key) VALUES (?, ?)",
+            [(gram, key) for key in {key for _, key in entries} for gram in trigrams(key)]
+        )
+
+    def _ensure_category(self, category: str):
+        """分类不存在时添加到末尾"""
+        self.conn.execute(
+            "INSERT OR IGNORE INTO categories (name, position) "
+            "SELECT ?, COALESCE(MAX(position), -1) + 1 FROM categories",
+            (category,)
+        )
+
+    def get_page(self, category: str) -> List[Dict]:
+        """读取分类下的公式，最近使用的分类保存在缓存中"""
+        with self._lock:
+            page = self.pages.get(category)
+            if page is not None:
+                self.pages.move_to_end(category)
+                return page
+
+            rows = self.conn.execute(
+                "SELECT name, description, template FROM formulas "
+                "WHERE category = ? ORDER BY position, id",
+                (category,)
+            ).fetchall()
+            page = [dict(row) for row in rows]
+            self.pages[category] = page
+            while len(self.pages) > self.page_cache:
+                self.pages.popitem(last=False)
+            return page
+
+    def _find(self, name: str) -> Optional[sqlite3.Row]:
+        """按名称查找公式"""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT f.id, f.category, f.name, f.description, f.template FROM formulas f "
+                "JOIN categories c ON c.name = f.category "
+                f"WHERE f.name = ? ORDER BY {ORDER} LIMIT 1",
+                (name,)
+            ).fetchone()
+
+    def get_categories(self) -> List[str]:
+        """获取所有公式分类"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT name FROM categories c WHERE EXISTS "
+                "(SELECT 1 FROM formulas f WHERE f.category = c.name) ORDER BY position"
+            ).fetchall()
+        return [row['name'] for row in rows]
+
+    def get_formulas(self, category: str) -> List[str]:
+        """获取指定分类下的所有公式名称"""
+        try:
+            return [formula['name'] for formula in self.get_page(category)]
+        except Exception as e:
+            print(f"获取公式列表失败: {str(e)}")
+            return []
+
+    def get_formula(self, name: str) -> Optional[Dict]:
+        """获取指定公式"""
+        try:
+            if isinstance(name, dict):
+                return name
+            row = self._find(name)
+            if row is None:
+                return None
+            return {'name': row['name'], 'description': row['description'], 'template': row['template']}
+        except Exception as e:
+            print(f"获取公式失败: {str(e)}")
+            return None
+
+    def get_formula_description(self, formula_name: str) -> str:
+        """获取公式描述"""
+        formula = self.get_formula(formula_name)
+        return formula.get('description', '') if formula else ''
+
+    def get_formula_template(self, formula_name: str) -> Optional[str]:
+        """获取公式模板"""
+        formula = self.get_formula(formula_name)
+        return formula.get('template', '') if formula else None
+
+    def add_formula(self, category: str, formula: Dict) -> bool:
+        """添加公式"""
+        try:
+            with self._lock, self.conn:
+                self._ensure_category(category)
+                cursor = self.conn.execute(
+                    "INSERT INTO formulas (category, position, name, description, template, pinyin) "
+                    "SELECT ?, COALESCE(MAX(position), -1) + 1, ?, ?, ?, ? FROM formulas WHERE category = ?",
+                    (category, formula['name'], formula.get('description', ''),
+                     formula.get('template', ''), pinyin_text(formula['name']), category)
+                )
+                self._index_keys([cursor.lastrowid])
+                self.pages.pop(category, None)
+            return True
+        except Exception as e:
+            print(f"添加公式失败: {str(e)}")
+            return False
+
+    def update_formula(self, old_name: str, new_formula: Dict) -> bool:
+        """更新公式"""
+        try:
+            with self._lock, self.conn:
+                row = self._find(old_name)
+                if row is None:
+                    return False
+                self.conn.execute(
+                    "UPDATE formulas SET name = ?, description = ?, template = ?, pinyin = ? WHERE id = ?",
+                    (new_formula['name'], new_formula.get('description', ''),
+                     new_formula.get('template', ''), pinyin_text(new_formula['name']), row['id'])
+                )
+                self.conn.execute("DELETE FROM fuzzy_keys WHERE formula_id = ?", (row['id'],))
+                self._index_keys([row['id']])
+                self.pages.pop(row['category'], None)
+            return True
+        except Exception as e:
+            print(f"更新公式失败: {str(e)}")
+            return False
+
+    def delete_formula(self, formula_name: str) -> bool:
+        """删除公式"""
+        try:
+            with self._lock, self.conn:
+                row = self._find(formula_name)
+                if row is None:
+                    return False
+                self.conn.execute("DELETE FROM formulas WHERE id = ?", (row['id'],))
+                self.pages.pop(row['category'], None)
+            return True
+        except Exception as e:
+            print(f"删除公式失败: {str(e)}")
+            return False
+
+    def get_all_formulas(self) -> List[Dict]:
+        """获取所有公式，按分类和名称排序"""
+        try:
+            with self._lock:
+                rows = self.conn.execute(
+                    "SELECT category, name, template, description FROM formulas ORDER BY category, name"
+                ).fetchall()
+            return [dict(row) for row in rows]
+        except Exception as e:
+            print(f"获取所有公式失败: {str(e)}")
+            return []
+
+    def search_formulas(self, keyword: str, candidates: Optional[List[str]] = None) -> List[Dict]:
+        """搜索公式
+        Args:
+            keyword: 搜索关键词，多个词用空格分隔，需全部匹配
+            candidates: 只在这些公式名称中搜索（可选）
+        Returns:
+            按相关度排序的匹配公式列表；与FormulaManager相同，
+            没有精确匹配的查询词改用编辑距离做模糊匹配
+        """
+        try:
+            terms = keyword.lower().split()
+            if not terms:
+                return []
+
+            rows = self._search_rows(terms, candidates)
+            if rows:
+                return [dict(row) for row in rows]
+
+            # 没有精确匹配的查询词改用模糊匹配
+            fuzzy_terms = [term for term in terms if not self._search_rows([term], candidates, limit=1)]
+            if not fuzzy_terms:
+                return []
+            distances = None
+            for term in fuzzy_terms:
+                matches = self._fuzzy_matches(term, candidates)
+                if distances is None:
+                    distances = matches
+                else:
+                    distances = {
+                        name: distances[name] + distance
+                        for name, distance in matches.items() if name in distances
+                    }
+                if not distances:
+                    return []
+
+            exact_terms = [term for term in terms if term not in fuzzy_terms]
+            rows = self._search_rows(exact_terms, list(distances))
+            # 按编辑距离排序，距离相同时保持精确匹配的顺序
+            rows.sort(key=lambda row: distances[row['name']])
+            return [dict(row) for row in rows]
+        except Exception as e:
+            print(f"搜索公式时出错: {str(e)}")
+            return []
+
+    def _search_rows(self, terms: List[str], candidates: Optional[List[str]] = None,
+                     limit: Optional[int] = None) -> List[sqlite3.Row]:
+        """精确匹配全部查询词的公式
+        Args:
+            terms: 小写的查询词，为空时返回全部候选公式
+            candidates: 只在这些公式名称中搜索（可选）
+            limit: 最多返回的行数（可选）
+        """
+        # 至少3个字符的词使用全文索引，较短的词逐行匹配
+        long_terms = [term for term in terms if len(term) >= FTS_MIN_LENGTH]
+        short_terms = [term for term in terms if len(term) < FTS_MIN_LENGTH]
+
+        sql = ["SELECT f.category, f.name, f.template, f.description FROM formulas f"]
+        where, params = [], []
+        if long_terms:
+            sql.append("JOIN formulas_fts ON formulas_fts.rowid = f.id")
+            where.append("formulas_fts MATCH ?")
+            params.append(' AND '.join('"' + term.replace('"', '""') + '"' for term in long_terms))
+        sql.append("JOIN categories c ON c.name = f.category")
+        for term in short_terms:
+            where.append(
+                "instr(lower(f.name || ' ' || f.description || ' ' || f.template || ' ' || f.pinyin), ?) > 0"
+            )
+            params.append(term)
+        if candidates is not None:
+            where.append("f.name IN (SELECT value FROM json_each(?))")
+            params.append(json.dumps(list(candidates), ensure_ascii=False))
+        if where:
+            sql.append("WHERE " + " AND ".join(where))
+
+        # 名称完全匹配、前缀匹配、包含的排在前面
+        query = ' '.join(terms)
+        sql.append(
+            "ORDER BY lower(f.name) = ? DESC, "
+            "substr(lower(f.name), 1, length(?)) = ? DESC, "
+            "instr(lower(f.name), ?) > 0 DESC, "
+            + ("bm25(formulas_fts), " if long_terms else "")
+            + "f.category, f.name"
+        )
+        params.extend([query, query, query, query])
+        if limit is not None:
+            sql.append(f"LIMIT {int(limit)}")
+
+        with self._lock:
+            return self.conn.execute(' '.join(sql), params).fetchall()
+
+    def _fuzzy_matches(self, term: str, candidates: Optional[List[str]] = None) -> Dict[str, int]:
+        """模糊匹配，规则与FormulaSearchIndex.fuzzy_matches相同
+        
+        先按三元片段在key_trigrams中筛选检索键，只对共有片段足够多的键计算编辑距离；
+        编辑距离在锁外计算，不阻塞界面线程的读取。
+        Returns:
+            公式名称 -> 编辑距离(只包含不超过上限的)
+        """
+        if len(term) < FUZZY_MIN_LENGTH or not term.isascii():
+            return {}
+        limit = fuzzy_limit(term)
+        grams = trigrams(term)
+        # 编辑距离为k时最多有3k个三元片段不同
+        required = max(1, len(grams) - 3 * limit)
+
+        with self._lock:
+            keys = [row['key'] for row in self.conn.execute(
+                "SELECT key FROM key_trigrams WHERE gram IN (SELECT value FROM json_each(?)) "
+                "GROUP BY key HAVING COUNT(*) >= ?",
+                (json.dumps(list(grams)), required)
+            )]
+        distances = {}
+        for key in keys:
+            distance = fuzzy_distance(term, key, limit)
+            if distance <= limit:
+                distances[key] = distance
+        if not distances:
+            return {}
+
+        sql = (
+            "SELECT k.key, f.name FROM fuzzy_keys k JOIN formulas f ON f.id = k.formula_id "
+            "WHERE k.key IN (SELECT value FROM json_each(?))"
+        )
+        params = [json.dumps(list(distances), ensure_ascii=False)]
+        if candidates is not None:
+            sql += " AND f.name IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps(list(candidates), ensure_ascii=False))
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+
+        matches = {}
+        for row in rows:
+            distance = distances[row['key']]
+            if distance < matches.get(row['name'], limit + 1):
+                matches[row['name']] = distance
+        return matches
+
+    def check_for_changes(self) -> Optional[Dict[str, List[str]]]:
+        """数据库中的修改直接可见，不需要重新载入"""
+        return None
+
+    def flush(self) -> bool:
+        """修改已在事务中提交，无需额外保存"""
+        return True
+
+    def save_formulas(self) -> bool:
+        """修改已直接写入数据库，不导出到formulas.json"""
+        return True
+
+    def close(self):
+        """关闭数据库"""
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
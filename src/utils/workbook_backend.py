@@ -0,0 +1,387 @@
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Any
+from .range_address import (
+    parse_range, format_cell, format_range, shift_range, to_r1c1, expand_range, a1_to_absolute_r1c1
+)
+
+# 填充模式: None 所有单元格写入同一公式; 'block' 本地生成二维公式块;
+# 'r1c1' 生成一个相对引用的R1C1公式。两种填充模式都只需一次写入调用
+FILL_MODES = (None, 'block', 'r1c1')
+
+# 生成R1C1公式时输入区域和输出单元格的占位符，不会被当作A1引用
+R1C1_INPUT_MARK = '\x00'
+R1C1_OUTPUT_MARK = '\x01'
+
+# 分块写入时第一块的单元格数，以及每块的目标耗时(秒)
+CHUNK_START_CELLS = 10000
+CHUNK_TARGET_SECONDS = 0.25
+
+def render_r1c1(render: Callable[[str, Optional[str]], str], input_address: str,
+                row: int, col: int) -> str:
+    """生成填充到以(row, col)为左上角的区域的R1C1公式
+    
+    输入区域和{output}转换为相对引用，随单元格平移；模板中写死的A1引用
+    (例如VLOOKUP的A:B)转换为绝对引用，结果与'block'填充相同。
+    Args:
+        render, input_address: 同write_formula
+        row, col: 目标区域左上角
+    Returns:
+        str: R1C1公式
+    """
+    text = a1_to_absolute_r1c1(render(R1C1_INPUT_MARK, R1C1_OUTPUT_MARK))
+    return text.replace(R1C1_INPUT_MARK, to_r1c1(input_address, row, col)).replace(R1C1_OUTPUT_MARK, 'RC')
+
+def write_formula(target_range: Any, render: Callable[[str, Optional[str]], str],
+                  input_address: str, output_address: Optional[str] = None,
+                  fill: Optional[str] = None):
+    """把公式一次性写入目标区域
+    Args:
+        target_range: 目标区域
+        render: 根据(输入地址, 输出地址)生成公式文本的函数
+        input_address: 输入区域地址
+        output_address: 输出区域地址（可选）
+        fill: 填充模式，见FILL_MODES。填充时左上角单元格使用原始输入区域，
+            其余单元格按相对位置平移输入区域，{output}为当前单元格
+    """
+    if fill not in FILL_MODES:
+        raise ValueError(f"不支持的填充模式: {fill}")
+
+    if not fill:
+        target_range.Formula = render(input_address, output_address)
+        return
+
+    first_row, first_col, last_row, last_col = parse_range(target_range.Address)
+    if fill == 'r1c1':
+        target_range.FormulaR1C1 = render_r1c1(render, input_address, first_row, first_col)
+        return
+
+    target_range.Formula = tuple(
+        tuple(
+            render(
+                shift_range(input_address, row_offset, col_offset),
+                format_cell(first_row + row_offset, first_col + col_offset)
+            )
+            for col_offset in range(last_col - first_col + 1)
+        )
+        for row_offset in range(last_row - first_row + 1)
+    )
+
+def write_formula_chunked(target_range: Any, render: Callable[[str, Optional[str]], str],
+                          input_address: str, output_address: Optional[str] = None,
+                          fill: Optional[str] = None,
+                          progress: Optional[Callable[[int, int, float], None]] = None,
+                          cancelled: Optional[Callable[[], bool]] = None,
+                          target_seconds: float = CHUNK_TARGET_SECONDS) -> bool:
+    """按行分块写入公式，结果与write_formula相同
+    
+    每块的行数根据上一块的耗时调整，使每块耗时接近target_seconds，
+    每块写完后报告进度并检查是否取消。
+    Args:
+        target_range: 目标区域，需要提供Worksheet属性
+        render, input_address, output_address, fill: 同write_formula
+        progress: 进度回调，参数为(已写入单元格数, 总单元格数, 已用秒数)
+        cancelled: 返回True时在下一块之前停止
+        target_seconds: 每块的目标耗时
+    Returns:
+        bool: 全部写入返回True；被取消时返回False，已写入的行由调用方恢复
+    """
+    if fill not in FILL_MODES:
+        raise ValueError(f"不支持的填充模式: {fill}")
+
+    address = target_range.Address
+    first_row, first_col, last_row, last_col = parse_range(address)
+    columns = last_col - first_col + 1
+    total = (last_row - first_row + 1) * columns
+    start = time.perf_counter()
+
+    # 多个区域时外接矩形中有不属于目标的单元格，只能一次写入
+    if ',' in address:
+        write_formula(target_range, render, input_address, output_address, fill)
+        if progress:
+            progress(total, total, time.perf_counter() - start)
+        return True
+
+    # 地址都是绝对引用，同一公式文本可以分别写入每一块
+    if fill == 'r1c1':
+        text = render_r1c1(render, input_address, first_row, first_col)
+    elif not fill:
+        text = render(input_address, output_address)
+
+    sheet = target_range.Worksheet
+    block_rows = max(1, CHUNK_START_CELLS // columns)
+    done = 0
+    row = first_row
+    while row <= last_row:
+        if cancelled and cancelled():
+            return False
+
+        end = min(last_row, row + block_rows - 1)
+        block = sheet.Range(format_range(row, first_col, end, last_col))
+        block_start = time.perf_counter()
+        if fill == 'r1c1':
+            block.FormulaR1C1 = text
+        elif not fill:
+            block.Formula = text
+        else:
+            block.Formula = tuple(
+                tuple(
+                    render(
+                        shift_range(input_address, block_row - first_row, col_offset),
+                        format_cell(block_row, first_col + col_offset)
+                    )
+                    for col_offset in range(columns)
+                )
+                for block_row in range(row, end + 1)
+            )
+        elapsed = time.perf_counter() - block_start
+
+        done += (end - row + 1) * columns
+        row = end + 1
+        if progress:
+            progress(done, total, time.perf_counter() - start)
+
+        # 根据本块的耗时调整下一块的行数，每次最多翻倍或减半
+        scale = target_seconds / elapsed if elapsed > 0 else 2.0
+        block_rows = max(1, int(block_rows * min(2.0, max(0.5, scale))))
+    return True
+
+class WorkbookBackend(ABC):
+    """工作簿后端基类
+
+    子类实现open_file、is_connected和get_selection，并提供与Excel对象模型一致的
+    Workbook/Worksheet/Range 接口(Address、Value、Formula、UsedRange)，
+    公式应用和状态保存/恢复的逻辑在此统一实现。
+    """
+
+    def __init__(self):
+        self.active_workbook = None
+        self.active_sheet = None
+        self.workbooks = {}
+        
+        # 批量操作状态
+        self._bulk_depth = 0
+        self._bulk_saved = None
+        self._bulk_touched = []
+
+    @contextmanager
+    def bulk_operation(self):
+        """批量操作范围，可嵌套
+        
+        最外层进入时暂停刷新/计算/事件，退出时只重算写入过的区域并恢复原设置。
+        """
+        self._bulk_depth += 1
+        if self._bulk_depth == 1:
+            self._bulk_touched = []
+            try:
+                self._bulk_saved = self._suspend_app()
+            except Exception as e:
+                print(f"暂停刷新失败: {str(e)}")
+                self._bulk_saved = None
+        try:
+            yield self
+        finally:
+            self._bulk_depth -= 1
+            if self._bulk_depth == 0:
+                touched, self._bulk_touched = self._bulk_touched, []
+                if self._bulk_saved is not None:
+                    try:
+                        self._resume_app(self._bulk_saved, touched)
+                    except Exception as e:
+                        print(f"恢复刷新失败: {str(e)}")
+                    self._bulk_saved = None
+
+    def mark_touched(self, range_obj: Any):
+        """记录批量操作中写入过的区域"""
+        if self._bulk_depth:
+            self._bulk_touched.append(range_obj)
+
+    def _suspend_app(self) -> Any:
+        """暂停刷新/计算/事件，返回原设置；不需要时返回None"""
+        return None
+
+    def _resume_app(self, saved: Any, touched: List[Any]):
+        """重算写入过的区域并恢复原设置"""
+        pass
+
+    @abstractmethod
+    def open_file(self, file_path: str) -> bool:
+        """打开工作簿文件"""
+
+    @abstractmethod
+    def is_connected(self) -> bool:
+        """检查后端是否可用"""
+
+    def refresh_workbooks(self) -> Dict[str, Any]:
+        """刷新工作簿列表"""
+        return self.workbooks
+
+    def get_workbook(self, name: str) -> Optional[Any]:
+        """获取工作簿
+        Args:
+            name: 工作簿名称
+        Returns:
+            Workbook对象或None
+        """
+        return self.workbooks.get(name)
+
+    def activate_workbook(self, name: str) -> bool:
+        """激活工作簿，之后的操作都在它的活动工作表上进行
+        Args:
+            name: 工作簿名称
+        Returns:
+            bool: 是否成功
+        """
+        try:
+            workbook = self.get_workbook(name)
+            if not workbook:
+                return False
+            workbook.Activate()
+            self.active_workbook = workbook
+            self.active_sheet = workbook.ActiveSheet
+            return True
+        except Exception as e:
+            print(f"激活工作簿失败: {str(e)}")
+            return False
+
+    @abstractmethod
+    def get_selection(self) -> Optional[Any]:
+        """获取当前选中的区域"""
+
+    def select_range(self, mode: str, value: Any = None) -> Optional[Any]:
+        """选择区域
+        Args:
+            mode: 选择模式 ('input' 或 'output')
+            value: 可选的预设值
+        Returns:
+            Range对象或None
+        """
+        try:
+            if not self.active_sheet:
+                return None
+
+            if value:
+                return self.active_sheet.Range(value)
+
+            # 获取用户选择的区域
+            selection = self.get_selection()
+            if not selection:
+                return None
+
+            return selection
+
+        except Exception as e:
+            print(f"选择区域失败: {str(e)}")
+            return None
+
+    def apply_formula(self, formula: str, input_range: Any, output_range: Any = None,
+                      fill: Optional[str] = None) -> bool:
+        """应用公式
+        Args:
+            formula: 公式模板
+            input_range: 输入区域
+            output_range: 输出区域（可选）
+            fill: 填充模式（可选），见FILL_MODES
+        Returns:
+            bool: 是否成功
+        """
+        try:
+            if not self.active_sheet:
+                return False
+
+            # 如果没有指定输出区域，使用输入区域
+            if not output_range:
+                output_range = input_range
+
+            # 替换公式中的占位符并一次性写入
+            write_formula(
+                output_range,
+                lambda address, _: formula.replace('{range}', address),
+                input_range.Address,
+                fill=fill
+            )
+            self.mark_touched(output_range)
+            return True
+
+        except Exception as e:
+            print(f"应用公式失败: {str(e)}")
+            return False
+
+    def get_current_state(self, address: Optional[str] = None, margin: int = 0,
+                          sheet: Optional[Any] = None) -> Optional[Dict]:
+        """获取当前状态
+        Args:
+            address: 快照区域（可选），通常是下一步操作要覆盖的输出区域；
+                不指定时保存整个UsedRange
+            margin: 在快照区域四周额外保存的行/列数
+            sheet: 快照所在的工作表，默认为活动工作表；写入其他工作表时
+                应传入目标区域的Worksheet
+        Returns:
+            状态字典，restore_state只会写回其中的区域
+        """
+        try:
+            sheet = sheet or self.active_sheet
+            if not sheet:
+                return None
+
+            if address:
+                range_obj = sheet.Range(expand_range(address, margin))
+            else:
+                range_obj = sheet.UsedRange
+            return {
+                'values': range_obj.Value,
+                'formulas': range_obj.Formula,
+                'range': range_obj.Address,
+                'sheet': sheet.Name,
+                'workbook': sheet.Parent.Name
+            }
+        except Exception as e:
+            print(f"获取状态失败: {str(e)}")
+            return None
+
+    def restore_state(self, state: Dict) -> bool:
+        """恢复状态，写回快照所在的工作表
+        Args:
+            state: 状态字典
+        Returns:
+            bool: 是否成功
+        """
+        try:
+            if not state:
+                return False
+            sheet = self._state_sheet(state)
+            if not sheet:
+                return False
+
+            range_obj = sheet.Range(state['range'])
+            range_obj.Value = state['values']
+            range_obj.Formula = state['formulas']
+            self.mark_touched(range_obj)
+            return True
+
+        except Exception as e:
+            print(f"恢复状态失败: {str(e)}")
+            return False
+
+    def _state_sheet(self, state: Dict) -> Optional[Any]:
+        """查找状态所属的工作表，没有记录工作表的旧状态使用活动工作表"""
+        if 'sheet' not in state:
+            return self.active_sheet
+
+        name = state.get('workbook')
+        workbook = self.get_workbook(name)
+        if workbook is None and self.active_workbook is not None \
+                and self.active_workbook.Name == name:
+            workbook = self.active_workbook
+        if workbook is None:
+            # 不能退回活动工作簿，否则会把快照写到别的文件里
+            raise KeyError(f"工作簿未打开: {name}")
+        return workbook.Worksheets(state['sheet'])
+
+    def disconnect(self):
+        """断开连接并释放工作簿"""
+        self.workbooks.clear()
+        self.active_workbook = None
+        self.active_sheet = None
+        return True
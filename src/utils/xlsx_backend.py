@@ -0,0 +1,702 @@
+import os
+import re
+import posixpath
+import tempfile
+import zipfile
+from typing import Dict, List, Optional, Any, Tuple
+from xml.sax.saxutils import escape, unescape
+from .workbook_backend import WorkbookBackend
+from .zip_writer import RawZipWriter
+from .range_address import (parse_range, parse_cell, format_cell, format_range, column_letter,
+                            r1c1_to_a1, translate_formula)
+
+# XML实体(属性值中还需要处理引号)
+XML_ENTITIES = {'&quot;': '"', '&apos;': "'"}
+
+ATTR_PATTERN = re.compile(r'([\w:]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+ROW_PATTERN = re.compile(r'<row\b([^>]*?)(?:/>|>(.*?)</row>)', re.S)
+CELL_PATTERN = re.compile(r'<c\b([^>]*?)(?:/>|>(.*?)</c>)', re.S)
+FORMULA_PATTERN = re.compile(r'<f\b([^>]*?)(?:/>|>(.*?)</f>)', re.S)
+VALUE_PATTERN = re.compile(r'<v>(.*?)</v>', re.S)
+TEXT_PATTERN = re.compile(r'<t\b[^>]*?(?:/>|>(.*?)</t>)', re.S)
+PHONETIC_PATTERN = re.compile(r'<rPh\b.*?</rPh>', re.S)
+SHEET_DATA_PATTERN = re.compile(r'<sheetData\s*/>|<sheetData>(.*?)</sheetData>', re.S)
+SELECTION_PATTERN = re.compile(r'<selection\b([^>]*?)/?>')
+SHARED_STRING_PATTERN = re.compile(r'<si>(.*?)</si>', re.S)
+
+# Excel的错误值
+ERROR_LITERALS = ('#NULL!', '#DIV/0!', '#VALUE!', '#REF!', '#NAME?', '#NUM!', '#N/A',
+                  '#GETTING_DATA', '#SPILL!', '#CALC!')
+
+# 写入公式后需要修改的部件，见patch_for_recalc
+RECALC_PARTS = ('xl/workbook.xml', 'xl/_rels/workbook.xml.rels', '[Content_Types].xml')
+
+def parse_attrs(text: str) -> Dict[str, str]:
+    """解析XML属性"""
+    attrs = {}
+    for match in ATTR_PATTERN.finditer(text or ''):
+        value = match.group(2) if match.group(2) is not None else match.group(3)
+        attrs[match.group(1)] = unescape(value, XML_ENTITIES)
+    return attrs
+
+def format_attrs(attrs: Dict[str, str]) -> str:
+    """生成XML属性文本"""
+    return ''.join(
+        f' {key}="{escape(str(value), {chr(34): "&quot;"})}"'
+        for key, value in attrs.items()
+    )
+
+def read_text_runs(xml: str) -> str:
+    """合并<t>文本(忽略拼音注音)"""
+    xml = PHONETIC_PATTERN.sub('', xml)
+    return ''.join(unescape(m.group(1) or '') for m in TEXT_PATTERN.finditer(xml))
+
+def format_number(value: float) -> str:
+    """数值转为xlsx中的文本"""
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+class XlsxError(str):
+    """错误值(如#N/A)，写回时保存为错误类型的单元格"""
+    __slots__ = ()
+
+def parse_constant(text: Any) -> Any:
+    """把写入Formula的常量文本转换为值(与Excel行为一致，数字文本转为数值，
+    TRUE/FALSE转为布尔值，#N/A等转为错误值)"""
+    if not isinstance(text, str):
+        return text
+    if text == '':
+        return None
+    upper = text.upper()
+    if upper in ('TRUE', 'FALSE'):
+        return upper == 'TRUE'
+    if upper in ERROR_LITERALS:
+        return XlsxError(upper)
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+def formula_text(value: Any, formula: Optional[str]) -> str:
+    """单元格的Formula文本：公式返回公式，常量返回其文本"""
+    if formula:
+        return formula
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, (int, float)):
+        return format_number(value)
+    return str(value)
+
+class XlsxCell:
+    """单元格"""
+    __slots__ = ('attrs', 'value', 'formula', 'raw', 'original')
+
+    def __init__(self, attrs: Dict[str, str], value: Any = None,
+                 formula: Optional[str] = None, raw: Optional[str] = None):
+        self.attrs = attrs
+        self.value = value
+        self.formula = formula
+        self.raw = raw
+        # 文件中的原始内容，写回相同内容时恢复原始XML
+        self.original = (value, formula, raw) if raw is not None else None
+
+    def to_xml(self, ref: str) -> str:
+        """生成单元格XML，未修改的单元格原样输出"""
+        if self.raw is not None:
+            return self.raw
+
+        attrs = {'r': ref}
+        if 's' in self.attrs:
+            attrs['s'] = self.attrs['s']
+
+        if self.formula:
+            # 不写缓存值，由Excel打开时重新计算
+            return f'<c{format_attrs(attrs)}><f>{escape(self.formula[1:])}</f></c>'
+        if self.value is None:
+            return f'<c{format_attrs(attrs)}/>' if 's' in attrs else ''
+        if isinstance(self.value, bool):
+            attrs['t'] = 'b'
+            return f'<c{format_attrs(attrs)}><v>{format_number(self.value)}</v></c>'
+        if isinstance(self.value, XlsxError):
+            attrs['t'] = 'e'
+            return f'<c{format_attrs(attrs)}><v>{escape(self.value)}</v></c>'
+        if isinstance(self.value, (int, float)):
+            return f'<c{format_attrs(attrs)}><v>{format_number(self.value)}</v></c>'
+
+        attrs['t'] = 'inlineStr'
+        text = escape(str(self.value))
+        return f'<c{format_attrs(attrs)}><is><t xml:space="preserve">{text}</t></is></c>'
+
+class XlsxRow:
+    """行"""
+    __slots__ = ('attrs', 'raw', 'cells')
+
+    def __init__(self, attrs: Dict[str, str], raw: Optional[str] = None):
+        self.attrs = attrs
+        self.raw = raw
+        self.cells = {}
+
+    def to_xml(self, row: int) -> str:
+        """生成行XML，未修改的行原样输出"""
+        if self.raw is not None:
+            return self.raw
+
+        attrs = dict(self.attrs)
+        attrs['r'] = str(row)
+        # 单元格变化后spans可能失效，它只是可选的提示
+        attrs.pop('spans', None)
+        cells = ''.join(
+            self.cells[col].to_xml(f"{column_letter(col)}{row}")
+            for col in sorted(self.cells)
+        )
+        if not cells:
+            return f'<row{format_attrs(attrs)}/>' if len(attrs) > 1 else ''
+        return f'<row{format_attrs(attrs)}>{cells}</row>'
+
+class XlsxRange:
+    """区域，提供与Excel Range对象相同的Address/Value/Formula接口"""
+
+    def __init__(self, sheet: 'XlsxSheet', first_row: int, first_col: int,
+                 last_row: int, last_col: int):
+        self.sheet = sheet
+        self.first_row = first_row
+        self.first_col = first_col
+        self.last_row = last_row
+        self.last_col = last_col
+
+    @property
+    def Address(self) -> str:
+        return format_range(self.first_row, self.first_col, self.last_row, self.last_col)
+
+    @property
+    def Worksheet(self) -> 'XlsxSheet':
+        return self.sheet
+
+    @property
+    def Count(self) -> int:
+        return (self.last_row - self.first_row + 1) * (self.last_col - self.first_col + 1)
+
+    @property
+    def Value(self) -> Any:
+        return self._read(lambda cell: cell.value if cell else None)
+
+    @Value.setter
+    def Value(self, data: Any):
+        self._write(data, lambda value: (value, None))
+
+    @property
+    def Formula(self) -> Any:
+        return self._read(self._formula_text)
+
+    @Formula.setter
+    def Formula(self, data: Any):
+        def convert(text):
+            if isinstance(text, str) and text.startswith('='):
+                return None, text
+            return parse_constant(text), None
+        self._write(data, convert)
+
+    def _set_formula_r1c1(self, data: Any):
+        """按R1C1写入公式，相对引用按各单元格位置换算"""
+        self.sheet.load()
+        for row in range(self.first_row, self.last_row + 1):
+            for col in range(self.first_col, self.last_col + 1):
+                if isinstance(data, str) and data.startswith('='):
+                    self.sheet.set_cell(row, col, None, r1c1_to_a1(data, row, col))
+                else:
+                    self.sheet.set_cell(row, col, parse_constant(data))
+
+    FormulaR1C1 = property(fset=_set_formula_r1c1)
+
+    @staticmethod
+    def _formula_text(cell: Optional[XlsxCell]) -> str:
+        """单元格的Formula文本：公式返回公式，常量返回其文本"""
+        if not cell:
+            return ''
+        return formula_text(cell.value, cell.formula)
+
+    def _read(self, getter) -> Any:
+        """读取区域，单个单元格返回标量，否则返回二维元组"""
+        self.sheet.load()
+        rows = []
+        for row in range(self.first_row, self.last_row + 1):
+            row_obj = self.sheet.rows.get(row)
+            cells = row_obj.cells if row_obj else {}
+            rows.append(tuple(
+                getter(cells.get(col))
+                for col in range(self.first_col, self.last_col + 1)
+            ))
+        if len(rows) == 1 and len(rows[0]) == 1:
+            return rows[0][0]
+        return tuple(rows)
+
+    def _write(self, data: Any, convert):
+        """写入区域，标量广播到每个单元格，二维数据按位置写入"""
+        self.sheet.load()
+        if isinstance(data, (list, tuple)):
+            if data and not isinstance(data[0], (list, tuple)):
+                data = (data,)
+        for row_offset, row in enumerate(range(self.first_row, self.last_row + 1)):
+            for col_offset, col in enumerate(range(self.first_col, self.last_col + 1)):
+                if isinstance(data, (list, tuple)):
+                    try:
+                        item = data[row_offset][col_offset]
+                    except IndexError:
+                        continue
+                else:
+                    item = data
+                value, formula = convert(item)
+                self.sheet.set_cell(row, col, value, formula)
+
+class XlsxSheet:
+    """工作表，按需解析sheet XML"""
+
+    def __init__(self, workbook: 'XlsxWorkbook', name: str, part_name: str):
+        self.workbook = workbook
+        self.Name = name
+        self.part_name = part_name
+        self.rows = {}
+        self.modified = False
+        self.has_formulas = False
+        # 共享公式: si -> 成员单元格(按文件顺序，第一个为主单元格)
+        self.shared_groups = {}
+        # 数组公式: (起始行, 起始列, 结束行, 结束列, 主单元格行, 主单元格列)
+        self.array_ranges = []
+        self._head = ''
+        self._tail = ''
+        self._loaded = False
+
+    @property
+    def Parent(self) -> 'XlsxWorkbook':
+        return self.workbook
+
+    def load(self):
+        """解析sheetData，未修改的行和单元格保留原始XML"""
+        if self._loaded:
+            return
+
+        xml = self.workbook.read_part(self.part_name)
+        match = SHEET_DATA_PATTERN.search(xml)
+        if not match:
+            raise ValueError(f"工作表缺少sheetData: {self.part_name}")
+        self._head = xml[:match.start()]
+        self._tail = xml[match.end():]
+
+        shared_strings = self.workbook.shared_strings
+        # 共享公式主单元格: si -> (公式, 行, 列)
+        masters = {}
+        next_row = 1
+        for row_match in ROW_PATTERN.finditer(match.group(1) or ''):
+            attrs = parse_attrs(row_match.group(1))
+            row = int(attrs['r']) if 'r' in attrs else next_row
+            next_row = row + 1
+            row_obj = XlsxRow(attrs, row_match.group(0))
+            self.rows[row] = row_obj
+
+            next_col = 1
+            for cell_match in CELL_PATTERN.finditer(row_match.group(2) or ''):
+                cell_attrs = parse_attrs(cell_match.group(1))
+                col = parse_cell(cell_attrs['r'])[1] if 'r' in cell_attrs else next_col
+                next_col = col + 1
+                inner = cell_match.group(2) or ''
+                formula_match = FORMULA_PATTERN.search(inner)
+                formula = self._read_formula(formula_match, row, col, masters) if formula_match else None
+                value = self._parse_value(cell_attrs, inner, shared_strings)
+                row_obj.cells[col] = XlsxCell(cell_attrs, value, formula, cell_match.group(0))
+
+        self._loaded = True
+
+    def _read_formula(self, match: Any, row: int, col: int,
+                      masters: Dict[str, Tuple[str, int, int]]) -> Optional[str]:
+        """解析<f>，共享公式的从属单元格按主单元格的公式平移得到
+        Args:
+            match: FORMULA_PATTERN的匹配结果
+            row: 行号
+            col: 列号
+            masters: 已读到的共享公式主单元格
+        Returns:
+            以=开头的公式，没有公式时返回None
+        """
+        attrs = parse_attrs(match.group(1))
+        text = unescape(match.group(2)) if match.group(2) else None
+
+        if attrs.get('t') == 'shared' and 'si' in attrs:
+            si = attrs['si']
+            self.shared_groups.setdefault(si, []).append((row, col))
+            if text is not None:
+                masters[si] = (text, row, col)
+            elif si in masters:
+                master_text, master_row, master_col = masters[si]
+                text = translate_formula(master_text, row - master_row, col - master_col)
+        elif attrs.get('t') == 'array' and 'ref' in attrs:
+            self.array_ranges.append((*parse_range(attrs['ref']), row, col))
+
+        return '=' + text if text else None
+
+    @staticmethod
+    def _parse_value(attrs: Dict[str, str], inner: str, shared_strings: List[str]) -> Any:
+        """解析单元格的值"""
+        cell_type = attrs.get('t', 'n')
+        if cell_type == 'inlineStr':
+            return read_text_runs(inner)
+
+        value_match = VALUE_PATTERN.search(inner)
+        if not value_match:
+            return None
+        text = unescape(value_match.group(1))
+
+        if cell_type == 's':
+            return shared_strings[int(text)]
+        if cell_type == 'b':
+            return text == '1'
+        if cell_type == 'e':
+            return XlsxError(text)
+        if cell_type == 'str':
+            return text
+        try:
+            return float(text)
+        except ValueError:
+            return text
+
+    def array_master(self, row: int, col: int) -> Optional[Tuple[int, int]]:
+        """单元格所在数组公式的主单元格，不在数组公式中时返回None"""
+        for first_row, first_col, last_row, last_col, master_row, master_col in self.array_ranges:
+            if first_row <= row <= last_row and first_col <= col <= last_col:
+                return master_row, master_col
+        return None
+
+    def set_cell(self, row: int, col: int, value: Any, formula: Optional[str] = None):
+        """修改单元格，写入的内容与文件中相同时保留原始XML
+        Raises:
+            ValueError: 修改数组公式中的非主单元格
+        """
+        row_obj = self.rows.get(row)
+        cell = row_obj.cells.get(col) if row_obj else None
+        if cell is None and value is None and not formula:
+            return
+
+        unchanged = cell is not None and cell.original is not None \
+            and formula_text(value, formula) == formula_text(*cell.original[:2])
+        master = self.array_master(row, col)
+        if master and master != (row, col) and not unchanged:
+            # 只能整体修改数组公式；主单元格在保存时检查(恢复快照时会先写值再写公式)
+            raise ValueError(f"不能修改数组公式的一部分: {format_cell(row, col, absolute=False)}")
+
+        if row_obj is None:
+            row_obj = self.rows[row] = XlsxRow({'r': str(row)})
+        row_obj.raw = None
+        if cell is None:
+            cell = row_obj.cells[col] = XlsxCell({})
+        if unchanged:
+            cell.value, cell.formula, cell.raw = cell.original
+        else:
+            cell.value = value
+            cell.formula = formula
+            cell.raw = None
+
+        self.modified = True
+        if formula:
+            self.has_formulas = True
+
+    def _get_cell(self, row: int, col: int) -> Optional[XlsxCell]:
+        """获取已有的单元格"""
+        row_obj = self.rows.get(row)
+        return row_obj.cells.get(col) if row_obj else None
+
+    def _check_arrays(self):
+        """数组公式的主单元格被修改后其余单元格会失效，拒绝保存"""
+        for *_, master_row, master_col in self.array_ranges:
+            cell = self._get_cell(master_row, master_col)
+            if cell is None or cell.raw is None:
+                raise ValueError(f"不能覆盖数组公式: {format_cell(master_row, master_col, absolute=False)}")
+
+    def _promote_shared_masters(self):
+        """共享公式的主单元格被修改后，把组内下一个未修改的单元格提升为主单元格"""
+        for si, members in self.shared_groups.items():
+            master = self._get_cell(*members[0]) if members else None
+            if master is None or master.raw is not None:
+                continue
+            ref = None
+            if master.original is not None:
+                ref = parse_attrs(FORMULA_PATTERN.search(master.original[2]).group(1)).get('ref')
+
+            promoted = None
+            for index, (row, col) in enumerate(members):
+                cell = self._get_cell(row, col)
+                if cell.raw is not None and cell.formula:
+                    promoted = index
+                    break
+                # 已脱离共享组，不能再恢复为引用si的原始XML
+                cell.original = None
+            self.shared_groups[si] = members[promoted:] if promoted is not None else []
+            if promoted is None:
+                continue
+
+            attrs = {'t': 'shared', 'ref': ref or format_cell(row, col, absolute=False), 'si': si}
+            cell.raw = FORMULA_PATTERN.sub(
+                lambda _: f'<f{format_attrs(attrs)}>{escape(cell.formula[1:])}</f>', cell.raw, count=1
+            )
+            cell.original = (cell.value, cell.formula, cell.raw)
+            self.rows[row].raw = None
+
+    def used_bounds(self) -> Optional[Tuple[int, int, int, int]]:
+        """已使用区域的边界"""
+        self.load()
+        rows = [row for row, row_obj in self.rows.items() if row_obj.cells]
+        if not rows:
+            return None
+        cols = [col for row in rows for col in self.rows[row].cells]
+        return min(rows), min(cols), max(rows), max(cols)
+
+    def Range(self, address: str) -> XlsxRange:
+        """按地址获取区域"""
+        return XlsxRange(self, *parse_range(address))
+
+    @property
+    def UsedRange(self) -> XlsxRange:
+        bounds = self.used_bounds()
+        if not bounds:
+            return XlsxRange(self, 1, 1, 1, 1)
+        return XlsxRange(self, *bounds)
+
+    @property
+    def Selection(self) -> XlsxRange:
+        """文件中保存的选中区域"""
+        self.load()
+        match = SELECTION_PATTERN.search(self._head)
+        sqref = parse_attrs(match.group(1)).get('sqref', 'A1') if match else 'A1'
+        return self.Range(sqref.split()[0])
+
+    def to_xml(self) -> str:
+        """生成完整的sheet XML"""
+        self._check_arrays()
+        self._promote_shared_masters()
+        rows = ''.join(self.rows[row].to_xml(row) for row in sorted(self.rows))
+        head = self._head
+        bounds = self.used_bounds()
+        if bounds:
+            head = re.sub(
+                r'<dimension\b[^>]*?/>',
+                f'<dimension ref="{format_range(*bounds, absolute=False)}"/>',
+                head, count=1
+            )
+        return f'{head}<sheetData>{rows}</sheetData>{self._tail}'
+
+class XlsxWorkbook:
+    """工作簿，直接读写.xlsx中的zip/XML部件"""
+
+    def __init__(self, file_path: str):
+        self.FullName = os.path.abspath(file_path)
+        self.Name = os.path.basename(file_path)
+        self.sheets = []
+        self.ActiveSheet = None
+        self._shared_strings = None
+
+        self._load_sheets()
+
+    def read_part(self, name: str) -> str:
+        """读取zip中的部件"""
+        with zipfile.ZipFile(self.FullName) as archive:
+            return archive.read(name).decode('utf-8')
+
+    @property
+    def shared_strings(self) -> List[str]:
+        """共享字符串表"""
+        if self._shared_strings is None:
+            try:
+                xml = self.read_part('xl/sharedStrings.xml')
+            except KeyError:
+                xml = ''
+            self._shared_strings = [
+                read_text_runs(match.group(1))
+                for match in SHARED_STRING_PATTERN.finditer(xml)
+            ]
+        return self._shared_strings
+
+    def _load_sheets(self):
+        """读取工作表列表和各工作表对应的部件"""
+        workbook_xml = self.read_part('xl/workbook.xml')
+        rels_xml = self.read_part('xl/_rels/workbook.xml.rels')
+
+        targets = {}
+        for match in re.finditer(r'<Relationship\b([^>]*?)/?>', rels_xml):
+            attrs = parse_attrs(match.group(1))
+            target = attrs.get('Target', '')
+            if target.startswith('/'):
+                target = target[1:]
+            else:
+                target = posixpath.normpath(posixpath.join('xl', target))
+            targets[attrs.get('Id')] = target
+
+        for match in re.finditer(r'<sheet\b([^>]*?)/?>', workbook_xml):
+            attrs = parse_attrs(match.group(1))
+            part_name = targets.get(attrs.get('r:id'))
+            if part_name and 'worksheets/' in part_name:
+                self.sheets.append(XlsxSheet(self, attrs.get('name', ''), part_name))
+
+        if not self.sheets:
+            raise ValueError(f"工作簿中没有工作表: {self.Name}")
+
+        view = re.search(r'<workbookView\b([^>]*?)/?>', workbook_xml)
+        active_tab = int(parse_attrs(view.group(1)).get('activeTab', 0)) if view else 0
+        self.ActiveSheet = self.sheets[min(active_tab, len(self.sheets) - 1)]
+
+    def Worksheets(self, key: Any) -> XlsxSheet:
+        """按名称或序号(从1开始)获取工作表"""
+        if isinstance(key, int):
+            return self.sheets[key - 1]
+        for sheet in self.sheets:
+            if sheet.Name == key:
+                return sheet
+        raise KeyError(key)
+
+    def Activate(self):
+        """与COM接口保持一致，无需操作"""
+        pass
+
+    @property
+    def Saved(self) -> bool:
+        return not any(sheet.modified for sheet in self.sheets)
+
+    def Save(self):
+        """保存修改，只重写发生变化的工作表部件"""
+        if self.Saved:
+            return
+
+        modified = {sheet.part_name: sheet for sheet in self.sheets if sheet.modified}
+        has_formulas = any(sheet.has_formulas for sheet in modified.values())
+        rewrite_parts(
+            self.FullName,
+            {name: sheet.to_xml().encode('utf-8') for name, sheet in modified.items()},
+            recalc=has_formulas
+        )
+
+        for sheet in modified.values():
+            sheet.modified = False
+            sheet.has_formulas = False
+
+    def Close(self, SaveChanges: bool = False):
+        """关闭工作簿"""
+        if SaveChanges:
+            self.Save()
+
+def patch_for_recalc(name: str, data: bytes) -> bytes:
+    """写入公式后要求Excel打开时完整重算，并移除计算链引用"""
+    if name == 'xl/workbook.xml':
+        return set_full_calc_on_load(data.decode('utf-8')).encode('utf-8')
+    if name == 'xl/_rels/workbook.xml.rels':
+        xml = re.sub(r'<Relationship\b[^>]*?calcChain[^>]*?/>', '', data.decode('utf-8'))
+        return xml.encode('utf-8')
+    if name == '[Content_Types].xml':
+        xml = re.sub(r'<Override\b[^>]*?/xl/calcChain\.xml[^>]*?/>', '', data.decode('utf-8'))
+        return xml.encode('utf-8')
+    return data
+
+def rewrite_parts(file_path: str, parts: Dict[str, bytes], recalc: bool = False):
+    """重写xlsx中的部件，其余条目原样复制
+    Args:
+        file_path: xlsx文件路径
+        parts: 部件名称到新内容的映射
+        recalc: 是否写入了公式，是则删除计算链并要求Excel打开时完整重算
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, temp_path = tempfile.mkstemp(suffix='.xlsx', dir=directory)
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(file_path) as archive, open(file_path, 'rb') as source, \
+             RawZipWriter(temp_path, archive.comment) as target:
+            for info in archive.infolist():
+                name = info.filename
+                if recalc and name == 'xl/calcChain.xml':
+                    # 计算链会和新公式不一致，删除后由Excel重建
+                    continue
+
+                if name in parts:
+                    target.write(info, parts[name])
+                elif recalc and name in RECALC_PARTS:
+                    target.write(info, patch_for_recalc(name, archive.read(name)))
+                else:
+                    # 未修改的条目不解压也不重新压缩
+                    target.copy(source, info)
+
+        os.replace(temp_path, file_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def set_full_calc_on_load(workbook_xml: str) -> str:
+    """在workbook.xml的calcPr上设置fullCalcOnLoad"""
+    match = re.search(r'<calcPr\b([^>]*?)(/?)>', workbook_xml)
+    if match:
+        attrs = parse_attrs(match.group(1))
+        attrs['fullCalcOnLoad'] = '1'
+        element = f'<calcPr{format_attrs(attrs)}{match.group(2)}>'
+        return workbook_xml[:match.start()] + element + workbook_xml[match.end():]
+
+    # calcPr位于definedNames等元素之后
+    position = -1
+    for tag in ('</sheets>', '</functionGroups>', '</externalReferences>', '</definedNames>'):
+        index = workbook_xml.find(tag)
+        if index >= 0:
+            position = max(position, index + len(tag))
+    if position < 0:
+        return workbook_xml
+    return workbook_xml[:position] + '<calcPr fullCalcOnLoad="1"/>' + workbook_xml[position:]
+
+class XlsxManager(WorkbookBackend):
+    """xlsx文件管理器，不依赖Excel直接读写文件，可在无界面环境下批量处理"""
+
+    def open_file(self, file_path: str) -> bool:
+        """打开xlsx文件"""
+        try:
+            if not os.path.exists(file_path):
+                print(f"文件不存在: {file_path}")
+                return False
+
+            # 检查文件扩展名
+            _, ext = os.path.splitext(file_path)
+            if ext.lower() not in ('.xlsx', '.xlsm'):
+                print(f"不支持的文件类型: {ext}")
+                return False
+
+            # 检查文件是否已经打开
+            full_name = os.path.abspath(file_path).lower()
+            for wb in self.workbooks.values():
+                if wb.FullName.lower() == full_name:
+                    self.active_workbook = wb
+                    self.active_sheet = wb.ActiveSheet
+                    return True
+
+            workbook = XlsxWorkbook(file_path)
+            self.workbooks[workbook.Name] = workbook
+            self.active_workbook = workbook
+            self.active_sheet = workbook.ActiveSheet
+            return True
+
+        except Exception as e:
+            print(f"打开xlsx文件失败: {str(e)}")
+            return False
+
+    def is_connected(self) -> bool:
+        """是否有打开的工作簿"""
+        return bool(self.workbooks)
+
+    def get_selection(self) -> Optional[Any]:
+        """获取文件中保存的选中区域"""
+        return self.active_sheet.Selection if self.active_sheet else None
+
+    def save(self) -> bool:
+        """保存所有修改过的工作簿"""
+        try:
+            for wb in self.workbooks.values():
+                wb.Save()
+            return True
+        except Exception as e:
+            print(f"保存xlsx文件失败: {str(e)}")
+            return False
@@ -0,0 +1,156 @@
+import re
+from typing import Any, Dict, List, Tuple
+from .range_address import parse_cell, parse_range, format_cell, format_range
+from .xlsx_backend import (
+    ROW_PATTERN, CELL_PATTERN, FORMULA_PATTERN, SHEET_DATA_PATTERN,
+    XlsxCell, XlsxRow, XlsxWorkbook, parse_attrs, rewrite_parts
+)
+
+DIMENSION_PATTERN = re.compile(r'<dimension\b([^>]*?)/>')
+
+def inject_formulas(file_path: str, formulas: Dict[str, str], sheet: Any = None) -> int:
+    """直接把公式写入xlsx文件，不加载整个工作簿
+    只重写目标工作表部件，其余zip条目原样复制；写入的单元格不保留缓存值，
+    并要求Excel打开时完整重算。耗时与目标工作表的大小成正比。
+    Args:
+        file_path: xlsx文件路径
+        formulas: 单元格地址到公式(以=开头)的映射
+        sheet: 工作表名称或序号(从1开始)，默认为活动工作表
+    Returns:
+        int: 写入的单元格数
+    """
+    targets = {}
+    for address, formula in formulas.items():
+        if not isinstance(formula, str) or not formula.startswith('='):
+            raise ValueError(f"公式必须以=开头: {address}")
+        row, col = parse_cell(address)
+        targets.setdefault(row, {})[col] = formula
+    if not targets:
+        return 0
+
+    workbook = XlsxWorkbook(file_path)
+    sheet_obj = workbook.ActiveSheet if sheet is None else workbook.Worksheets(sheet)
+    xml = inject_sheet_xml(workbook.read_part(sheet_obj.part_name), targets)
+    rewrite_parts(workbook.FullName, {sheet_obj.part_name: xml.encode('utf-8')}, recalc=True)
+    return sum(len(cells) for cells in targets.values())
+
+def inject_sheet_xml(xml: str, targets: Dict[int, Dict[int, str]]) -> str:
+    """在sheet XML中写入公式，只重新生成包含目标单元格的行
+    Args:
+        xml: sheet XML
+        targets: 行号到{列号: 公式}的映射
+    Returns:
+        str: 新的sheet XML
+    """
+    match = SHEET_DATA_PATTERN.search(xml)
+    if not match:
+        raise ValueError("工作表缺少sheetData")
+    rows_xml = match.group(1) or ''
+
+    pieces = []
+    position = 0
+    pending = sorted(targets)
+    index = 0
+    next_row = 1
+    # 已扫描到的数组公式区域，主单元格在区域左上角，一定先于区域内的其余行出现
+    arrays = []
+    for row_match in ROW_PATTERN.finditer(rows_xml):
+        if index >= len(pending):
+            break
+        attrs = parse_attrs(row_match.group(1))
+        row = int(attrs['r']) if 'r' in attrs else next_row
+        next_row = row + 1
+        arrays.extend(_array_ranges(row_match.group(0)))
+        if pending[index] > row:
+            continue
+
+        pieces.append(rows_xml[position:row_match.start()])
+        # 文件中不存在的行按顺序插入
+        while index < len(pending) and pending[index] < row:
+            _check_arrays(pending[index], targets[pending[index]], arrays)
+            pieces.append(_new_row(pending[index], targets[pending[index]]))
+            index += 1
+        if index < len(pending) and pending[index] == row:
+            _check_arrays(row, targets[row], arrays)
+            pieces.append(_inject_row(row_match, row, targets[row]))
+            index += 1
+        else:
+            pieces.append(row_match.group(0))
+        position = row_match.end()
+
+    pieces.append(rows_xml[position:])
+    for row in pending[index:]:
+        _check_arrays(row, targets[row], arrays)
+        pieces.append(_new_row(row, targets[row]))
+
+    head = _update_dimension(xml[:match.start()], targets)
+    return f"{head}<sheetData>{''.join(pieces)}</sheetData>{xml[match.end():]}"
+
+def _array_ranges(row_xml: str) -> List[Tuple[int, int, int, int]]:
+    """行中数组公式的区域"""
+    if 'array' not in row_xml:
+        return []
+    ranges = []
+    for formula_match in FORMULA_PATTERN.finditer(row_xml):
+        attrs = parse_attrs(formula_match.group(1))
+        if attrs.get('t') == 'array' and 'ref' in attrs:
+            ranges.append(parse_range(attrs['ref']))
+    return ranges
+
+def _check_arrays(row: int, formulas: Dict[int, str], arrays: List[Tuple[int, int, int, int]]):
+    """数组公式区域内的单元格只能整体修改，单独写入公式会损坏文件"""
+    for first_row, first_col, last_row, last_col in arrays:
+        if not first_row <= row <= last_row:
+            continue
+        for col in formulas:
+            if first_col <= col <= last_col:
+                raise ValueError(f"不能写入数组公式的区域: {format_cell(row, col, absolute=False)}")
+
+def _new_row(row: int, formulas: Dict[int, str]) -> str:
+    """生成只包含公式单元格的新行"""
+    row_obj = XlsxRow({'r': str(row)})
+    for col, formula in formulas.items():
+        row_obj.cells[col] = XlsxCell({}, None, formula)
+    return row_obj.to_xml(row)
+
+def _inject_row(row_match: Any, row: int, formulas: Dict[int, str]) -> str:
+    """替换或插入行中的公式单元格，其余单元格原样输出"""
+    row_obj = XlsxRow(parse_attrs(row_match.group(1)))
+    next_col = 1
+    for cell_match in CELL_PATTERN.finditer(row_match.group(2) or ''):
+        attrs = parse_attrs(cell_match.group(1))
+        col = parse_cell(attrs['r'])[1] if 'r' in attrs else next_col
+        next_col = col + 1
+        if col not in formulas:
+            row_obj.cells[col] = XlsxCell(attrs, raw=cell_match.group(0))
+            continue
+
+        formula_match = FORMULA_PATTERN.search(cell_match.group(2) or '')
+        if formula_match and 'ref' in parse_attrs(formula_match.group(1)):
+            # 共享公式和数组公式的主单元格被替换后，其余单元格会失效
+            raise ValueError(f"不能覆盖共享公式或数组公式: {attrs.get('r', col)}")
+        row_obj.cells[col] = XlsxCell(attrs)
+
+    for col, formula in formulas.items():
+        cell = row_obj.cells.setdefault(col, XlsxCell({}))
+        cell.formula = formula
+    return row_obj.to_xml(row)
+
+def _update_dimension(head: str, targets: Dict[int, Dict[int, str]]) -> str:
+    """扩大<dimension>使其包含写入的单元格"""
+    match = DIMENSION_PATTERN.search(head)
+    if not match:
+        return head
+    attrs = parse_attrs(match.group(1))
+    try:
+        bounds = parse_range(attrs.get('ref', ''))
+    except ValueError:
+        return head
+
+    cols = [col for cells in targets.values() for col in cells]
+    bounds = [
+        min(bounds[0], min(targets)), min(bounds[1], min(cols)),
+        max(bounds[2], max(targets)), max(bounds[3], max(cols))
+    ]
+    element = f'<dimension ref="{format_range(*bounds, absolute=False)}"/>'
+    return head[:match.start()] + element + head[match.end():]
@@ -0,0 +1,280 @@
+import io
+import zipfile
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from xml.etree.ElementTree import iterparse
+from .range_address import parse_range, parse_cell, format_range, translate_formula
+from .xlsx_backend import XlsxCell, XlsxError, XlsxRange, XlsxWorkbook
+
+# 每批返回的行数
+DEFAULT_BATCH_ROWS = 1000
+
+def local_name(tag: str) -> str:
+    """去掉命名空间的标签名"""
+    return tag.rsplit('}', 1)[-1]
+
+def namespace(tag: str) -> str:
+    """标签的命名空间前缀，例如 {http://...main}"""
+    return tag[:tag.find('}') + 1]
+
+def element_text(element: Any) -> str:
+    """合并元素下的<t>文本(忽略拼音注音)"""
+    parts = []
+    for child in element:
+        name = local_name(child.tag)
+        if name == 't':
+            parts.append(child.text or '')
+        elif name == 'r':
+            parts.extend(t.text or '' for t in child if local_name(t.tag) == 't')
+    return ''.join(parts)
+
+class SharedStringTable:
+    """紧凑的共享字符串表
+
+    所有字符串拼接成一个str，另存每个字符串的起始位置，
+    避免为几百万个字符串各建一个Python对象。
+    """
+
+    def __init__(self):
+        self._text = ''
+        self._offsets = array('q', [0])
+
+    @classmethod
+    def load(cls, stream: Any) -> 'SharedStringTable':
+        """增量解析sharedStrings.xml
+        Args:
+            stream: 部件的文件对象
+        """
+        table = cls()
+        # 逐个写入缓冲区，不在列表中保留每个字符串
+        buffer = io.StringIO()
+        length = 0
+        root = None
+        for event, element in iterparse(stream, events=('start', 'end')):
+            if root is None:
+                root = element
+            if event == 'end' and local_name(element.tag) == 'si':
+                length += buffer.write(element_text(element))
+                table._offsets.append(length)
+                # 已处理的<si>不再保留
+                root.clear()
+        table._text = buffer.getvalue()
+        return table
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        return self._text[self._offsets[index]:self._offsets[index + 1]]
+
+class XlsxStreamReader:
+    """流式读取工作表，内存占用与工作表大小无关
+
+    增量解析sheet XML，每处理完一行就释放对应的元素，按批返回行；
+    读取区域时越过最后一行即停止解析。用于预览和快照很大的工作簿。
+    """
+
+    def __init__(self, file_path: str):
+        """初始化
+        Args:
+            file_path: xlsx文件路径
+        """
+        # 只读取workbook.xml和关系部件，得到工作表列表
+        self.workbook = XlsxWorkbook(file_path)
+        self._shared_strings = None
+
+    @property
+    def sheet_names(self) -> List[str]:
+        return [sheet.Name for sheet in self.workbook.sheets]
+
+    @property
+    def shared_strings(self) -> SharedStringTable:
+        """共享字符串表，第一次遇到共享字符串单元格时加载"""
+        if self._shared_strings is None:
+            with zipfile.ZipFile(self.workbook.FullName) as archive:
+                try:
+                    with archive.open('xl/sharedStrings.xml') as stream:
+                        self._shared_strings = SharedStringTable.load(stream)
+                except KeyError:
+                    self._shared_strings = SharedStringTable()
+        return self._shared_strings
+
+    def iter_rows(self, sheet: Any = None, batch_rows: int = DEFAULT_BATCH_ROWS,
+                  first_row: int = 1, last_row: Optional[int] = None,
+                  first_col: int = 1, last_col: Optional[int] = None
+                  ) -> Iterator[List[Tuple[int, Dict[int, XlsxCell]]]]:
+        """按批返回行
+        Args:
+            sheet: 工作表名称或序号(从1开始)，默认为活动工作表
+            batch_rows: 每批的行数
+            first_row, last_row: 行范围，越过last_row后停止解析
+            first_col, last_col: 列范围
+        Returns:
+            每批为[(行号, {列号: XlsxCell})]，只包含有单元格的行
+        """
+        sheet_obj = self.workbook.ActiveSheet if sheet is None else self.workbook.Worksheets(sheet)
+        batch = []
+        with zipfile.ZipFile(self.workbook.FullName) as archive:
+            with archive.open(sheet_obj.part_name) as stream:
+                ns = None
+                sheet_data = None
+                # 共享公式主单元格: si -> (公式, 行, 列)，范围之前的行也要记录
+                masters = {}
+                next_row = 1
+                for event, element in iterparse(stream, events=('start', 'end')):
+                    if ns is None:
+                        # 按根元素的命名空间比较完整标签名
+                        ns = namespace(element.tag)
+                        sheet_data_tag, row_tag = f'{ns}sheetData', f'{ns}row'
+                    if event == 'start':
+                        if element.tag == sheet_data_tag:
+                            sheet_data = element
+                        continue
+                    if element.tag == sheet_data_tag:
+                        break
+                    if element.tag != row_tag or sheet_data is None:
+                        continue
+
+                    row = int(element.get('r', next_row))
+                    next_row = row + 1
+                    if last_row is not None and row > last_row:
+                        break
+                    if row < first_row:
+                        self._record_masters(element, ns, row, masters)
+                    else:
+                        cells = self._read_cells(element, ns, row, first_col, last_col, masters)
+                        if cells:
+                            batch.append((row, cells))
+                            if len(batch) >= batch_rows:
+                                yield batch
+                                batch = []
+                    # 已处理的行不再保留
+                    sheet_data.clear()
+        if batch:
+            yield batch
+
+    @staticmethod
+    def _iter_cells(row_element: Any, ns: str) -> Iterator[Tuple[int, Any]]:
+        """按列号返回一行中的单元格元素"""
+        next_col = 1
+        cell_tag = f'{ns}c'
+        for element in row_element:
+            if element.tag != cell_tag:
+                continue
+            ref = element.get('r')
+            col = parse_cell(ref)[1] if ref else next_col
+            next_col = col + 1
+            yield col, element
+
+    def _record_masters(self, row_element: Any, ns: str, row: int, masters: Dict):
+        """记录范围之前的行中的共享公式主单元格"""
+        formula_tag = f'{ns}f'
+        for col, element in self._iter_cells(row_element, ns):
+            child = element.find(formula_tag)
+            if child is not None:
+                self._read_formula(child, row, col, masters)
+
+    def _read_cells(self, row_element: Any, ns: str, row: int, first_col: int,
+                    last_col: Optional[int], masters: Dict) -> Dict[int, XlsxCell]:
+        """解析一行中范围内的单元格"""
+        cells = {}
+        formula_tag = f'{ns}f'
+        for col, element in self._iter_cells(row_element, ns):
+            if col < first_col or (last_col is not None and col > last_col):
+                # 范围外的共享公式主单元格也要记录
+                child = element.find(formula_tag)
+                if child is not None:
+                    self._read_formula(child, row, col, masters)
+                continue
+            value, formula = self._parse_cell(element, ns, row, col, masters)
+            if value is not None or formula:
+                cells[col] = XlsxCell(dict(element.attrib), value, formula)
+        return cells
+
+    @staticmethod
+    def _read_formula(element: Any, row: int, col: int, masters: Dict) -> Optional[str]:
+        """解析<f>，共享公式的从属单元格按主单元格的公式平移得到"""
+        text = element.text or None
+        si = element.get('si')
+        if element.get('t') == 'shared' and si is not None:
+            if text is not None:
+                masters[si] = (text, row, col)
+            elif si in masters:
+                master_text, master_row, master_col = masters[si]
+                text = translate_formula(master_text, row - master_row, col - master_col)
+        return '=' + text if text else None
+
+    def _parse_cell(self, element: Any, ns: str, row: int, col: int,
+                    masters: Dict) -> Tuple[Any, Optional[str]]:
+        """解析单元格内容，与XlsxSheet的规则相同
+        Returns:
+            (值, 公式)
+        """
+        formula = None
+        text = None
+        inline = None
+        for child in element:
+            name = child.tag[len(ns):]
+            if name == 'f':
+                formula = self._read_formula(child, row, col, masters)
+            elif name == 'v':
+                text = child.text or ''
+            elif name == 'is':
+                inline = child
+
+        cell_type = element.get('t', 'n')
+        if cell_type == 'inlineStr':
+            return (element_text(inline) if inline is not None else ''), formula
+        if text is None:
+            return None, formula
+        if cell_type == 's':
+            return self.shared_strings[int(text)], formula
+        if cell_type == 'b':
+            return text == '1', formula
+        if cell_type == 'e':
+            return XlsxError(text), formula
+        if cell_type == 'str':
+            return text, formula
+        try:
+            return float(text), formula
+        except ValueError:
+            return text, formula
+
+    def read_state(self, address: str, sheet: Any = None) -> Dict:
+        """读取区域的快照，格式与get_current_state相同
+        Args:
+            address: 区域地址
+            sheet: 工作表名称或序号，默认为活动工作表
+        Returns:
+            {'values', 'formulas', 'range', 'sheet', 'workbook'}
+        """
+        sheet_obj = self.workbook.ActiveSheet if sheet is None else self.workbook.Worksheets(sheet)
+        first_row, first_col, last_row, last_col = parse_range(address)
+        rows = {}
+        for batch in self.iter_rows(sheet_obj.Name, first_row=first_row, last_row=last_row,
+                                    first_col=first_col, last_col=last_col):
+            rows.update(batch)
+
+        values = []
+        formulas = []
+        for row in range(first_row, last_row + 1):
+            cells = rows.get(row, {})
+            values.append(tuple(
+                cells[col].value if col in cells else None
+                for col in range(first_col, last_col + 1)
+            ))
+            formulas.append(tuple(
+                XlsxRange._formula_text(cells.get(col))
+                for col in range(first_col, last_col + 1)
+            ))
+        if len(values) == 1 and len(values[0]) == 1:
+            values, formulas = values[0][0], formulas[0][0]
+        else:
+            values, formulas = tuple(values), tuple(formulas)
+        return {
+            'values': values,
+            'formulas': formulas,
+            'range': format_range(first_row, first_col, last_row, last_col),
+            'sheet': sheet_obj.Name,
+            'workbook': self.workbook.Name
+        }
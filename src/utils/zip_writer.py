@@ -0,0 +1,251 @@
+import os
+import struct
+import zipfile
+import zlib
+from typing import BinaryIO, List
+
+# 以下结构按zip格式规范(APPNOTE.TXT)定义，不依赖zipfile的内部常量
+# 本地文件头: 签名、所需版本、标志、压缩方法、时间、日期、CRC、压缩后大小、原始大小、文件名长度、扩展字段长度
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+LOCAL_HEADER_SIGNATURE = 0x04034b50
+# 中央目录项: 在本地文件头的字段之外还有创建版本、注释长度、起始磁盘、内部/外部属性和本地文件头偏移
+CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+CENTRAL_HEADER_SIGNATURE = 0x02014b50
+# 数据描述符(带签名，大小为32位)
+DATA_DESCRIPTOR = struct.Struct('<IIII')
+DATA_DESCRIPTOR_SIGNATURE = 0x08074b50
+# 中央目录结束记录
+END_RECORD = struct.Struct('<IHHHHIIH')
+END_RECORD_SIGNATURE = 0x06054b50
+# zip64中央目录结束记录及其定位器
+ZIP64_END_RECORD = struct.Struct('<IQHHIIQQQQ')
+ZIP64_END_RECORD_SIGNATURE = 0x06064b50
+ZIP64_LOCATOR = struct.Struct('<IIQI')
+ZIP64_LOCATOR_SIGNATURE = 0x07064b50
+# 扩展字段: 标识和长度
+EXTRA_HEADER = struct.Struct('<HH')
+ZIP64_EXTRA_ID = 0x0001
+
+# 达到这些值时改用zip64字段，原字段写入标记值
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+ZIP64_MARKER = 0xFFFFFFFF
+ZIP64_COUNT_MARKER = 0xFFFF
+# 解压所需版本: 默认、deflate、zip64
+VERSION_DEFAULT = 10
+VERSION_DEFLATED = 20
+VERSION_ZIP64 = 45
+
+# 通用标志：加密、大小写在数据之后的描述符中、文件名为UTF-8
+FLAG_ENCRYPTED = 0x1
+FLAG_DATA_DESCRIPTOR = 0x8
+FLAG_UTF8 = 0x800
+
+# 原样复制zip条目时每次读取的字节数
+COPY_CHUNK_SIZE = 1024 * 1024
+
+def strip_extra(extra: bytes, header_id: int) -> bytes:
+    """从扩展字段中去掉指定标识的字段"""
+    kept = []
+    position = 0
+    while position + EXTRA_HEADER.size <= len(extra):
+        field_id, size = EXTRA_HEADER.unpack_from(extra, position)
+        end = position + EXTRA_HEADER.size + size
+        if field_id != header_id:
+            kept.append(extra[position:end])
+        position = end
+    return b''.join(kept)
+
+def dos_datetime(date_time: tuple) -> tuple:
+    """把(年, 月, 日, 时, 分, 秒)转换为DOS格式的(时间, 日期)"""
+    year, month, day, hour, minute, second = date_time[:6]
+    if year < 1980:
+        year, month, day, hour, minute, second = 1980, 1, 1, 0, 0, 0
+    date = (year - 1980) << 9 | month << 5 | day
+    time = hour << 11 | minute << 5 | second // 2
+    return time, date
+
+class ZipEntry:
+    """写入目标zip的条目，关闭时用于生成中央目录"""
+    __slots__ = ('info', 'name', 'flag_bits', 'compress_type', 'crc',
+                 'compress_size', 'file_size', 'offset')
+
+    def __init__(self, info: zipfile.ZipInfo, compress_type: int, crc: int,
+                 compress_size: int, file_size: int, offset: int):
+        self.info = info
+        try:
+            self.name = info.filename.encode('ascii')
+            self.flag_bits = info.flag_bits & ~FLAG_UTF8
+        except UnicodeEncodeError:
+            self.name = info.filename.encode('utf-8')
+            self.flag_bits = info.flag_bits | FLAG_UTF8
+        self.compress_type = compress_type
+        self.crc = crc
+        self.compress_size = compress_size
+        self.file_size = file_size
+        self.offset = offset
+
+    @property
+    def version(self) -> int:
+        """解压所需版本"""
+        if self.file_size >= ZIP64_LIMIT or self.compress_size >= ZIP64_LIMIT \
+                or self.offset >= ZIP64_LIMIT:
+            return VERSION_ZIP64
+        if self.compress_type == zipfile.ZIP_DEFLATED:
+            return VERSION_DEFLATED
+        return max(VERSION_DEFAULT, self.info.extract_version)
+
+    def local_header(self) -> bytes:
+        """本地文件头，大小超出32位时写入zip64扩展字段"""
+        extra = strip_extra(self.info.extra, ZIP64_EXTRA_ID)
+        compress_size, file_size = self.compress_size, self.file_size
+        if file_size >= ZIP64_LIMIT or compress_size >= ZIP64_LIMIT:
+            extra = struct.pack('<HHQQ', ZIP64_EXTRA_ID, 16, file_size, compress_size) + extra
+            compress_size = file_size = ZIP64_MARKER
+        time, date = dos_datetime(self.info.date_time)
+        header = LOCAL_HEADER.pack(
+            LOCAL_HEADER_SIGNATURE, self.version, self.flag_bits, self.compress_type,
+            time, date, self.crc, compress_size, file_size, len(self.name), len(extra)
+        )
+        return header + self.name + extra
+
+    def central_header(self) -> bytes:
+        """中央目录项，超出32位的字段写入zip64扩展字段"""
+        values = []
+        compress_size, file_size, offset = self.compress_size, self.file_size, self.offset
+        if file_size >= ZIP64_LIMIT:
+            values.append(file_size)
+            file_size = ZIP64_MARKER
+        if compress_size >= ZIP64_LIMIT:
+            values.append(compress_size)
+            compress_size = ZIP64_MARKER
+        if offset >= ZIP64_LIMIT:
+            values.append(offset)
+            offset = ZIP64_MARKER
+
+        extra = strip_extra(self.info.extra, ZIP64_EXTRA_ID)
+        if values:
+            extra = EXTRA_HEADER.pack(ZIP64_EXTRA_ID, 8 * len(values)) \
+                + struct.pack(f'<{len(values)}Q', *values) + extra
+        version = self.version
+        comment = self.info.comment
+        time, date = dos_datetime(self.info.date_time)
+        header = CENTRAL_HEADER.pack(
+            CENTRAL_HEADER_SIGNATURE,
+            max(version, self.info.create_version) | self.info.create_system << 8,
+            version, self.flag_bits, self.compress_type, time, date, self.crc,
+            compress_size, file_size, len(self.name), len(extra), len(comment),
+            0, self.info.internal_attr, self.info.external_attr, offset
+        )
+        return header + self.name + extra + comment
+
+class RawZipWriter:
+    """按zip格式规范写入zip文件
+
+    可以把源zip中压缩后的数据原样复制过来(不解压也不重新压缩)，
+    也可以写入新内容；关闭时写入中央目录，需要时使用zip64记录。
+    """
+
+    def __init__(self, file_path: str, comment: bytes = b''):
+        """初始化
+        Args:
+            file_path: 目标zip文件路径
+            comment: zip注释
+        """
+        self.fp = open(file_path, 'wb')
+        self.comment = comment
+        self.entries: List[ZipEntry] = []
+
+    def __enter__(self) -> 'RawZipWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.fp.close()
+
+    def write(self, info: zipfile.ZipInfo, data: bytes):
+        """写入新内容，沿用info的压缩方法(只支持存储和deflate，其余改用deflate)
+        Args:
+            info: 条目信息(名称、时间、属性等)
+            data: 未压缩的内容
+        """
+        compress_type = info.compress_type
+        if compress_type == zipfile.ZIP_STORED:
+            payload = data
+        else:
+            compress_type = zipfile.ZIP_DEFLATED
+            compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+            payload = compressor.compress(data) + compressor.flush()
+
+        entry = ZipEntry(info, compress_type, zlib.crc32(data), len(payload), len(data), self.fp.tell())
+        # 新内容的大小和CRC已知，不需要加密标志和数据描述符
+        entry.flag_bits &= ~(FLAG_ENCRYPTED | FLAG_DATA_DESCRIPTOR)
+        self.fp.write(entry.local_header())
+        self.fp.write(payload)
+        self.entries.append(entry)
+
+    def copy(self, source: BinaryIO, info: zipfile.ZipInfo):
+        """把源zip条目压缩后的数据原样复制过来
+        Args:
+            source: 源zip文件(二进制方式打开)
+            info: 源zip中央目录中的条目信息，大小和CRC以它为准(已处理zip64)
+        """
+        source.seek(info.header_offset)
+        header = LOCAL_HEADER.unpack(source.read(LOCAL_HEADER.size))
+        if header[0] != LOCAL_HEADER_SIGNATURE:
+            raise ValueError(f"zip本地文件头无效: {info.filename}")
+        # 跳过文件名和扩展字段(本地扩展字段可能与中央目录中的不同)
+        source.seek(header[9] + header[10], os.SEEK_CUR)
+
+        entry = ZipEntry(info, info.compress_type, info.CRC, info.compress_size,
+                         info.file_size, self.fp.tell())
+        # 传统加密的校验字节与数据描述符标志有关，加密条目保留描述符；
+        # 其余条目的大小和CRC直接写在本地文件头中
+        keep_descriptor = bool(info.flag_bits & FLAG_ENCRYPTED and info.flag_bits & FLAG_DATA_DESCRIPTOR)
+        if not keep_descriptor:
+            entry.flag_bits &= ~FLAG_DATA_DESCRIPTOR
+        self.fp.write(entry.local_header())
+
+        remaining = info.compress_size
+        while remaining > 0:
+            chunk = source.read(min(remaining, COPY_CHUNK_SIZE))
+            if not chunk:
+                raise EOFError(f"zip条目不完整: {info.filename}")
+            self.fp.write(chunk)
+            remaining -= len(chunk)
+        if keep_descriptor:
+            self.fp.write(DATA_DESCRIPTOR.pack(
+                DATA_DESCRIPTOR_SIGNATURE, entry.crc,
+                min(entry.compress_size, ZIP64_MARKER), min(entry.file_size, ZIP64_MARKER)
+            ))
+        self.entries.append(entry)
+
+    def close(self):
+        """写入中央目录和结束记录"""
+        if self.fp.closed:
+            return
+        try:
+            start = self.fp.tell()
+            for entry in self.entries:
+                self.fp.write(entry.central_header())
+            size = self.fp.tell() - start
+
+            count = len(self.entries)
+            if count >= ZIP64_COUNT_LIMIT or start >= ZIP64_LIMIT or size >= ZIP64_LIMIT:
+                position = self.fp.tell()
+                self.fp.write(ZIP64_END_RECORD.pack(
+                    ZIP64_END_RECORD_SIGNATURE, ZIP64_END_RECORD.size - 12,
+                    VERSION_ZIP64, VERSION_ZIP64, 0, 0, count, count, size, start
+                ))
+                self.fp.write(ZIP64_LOCATOR.pack(ZIP64_LOCATOR_SIGNATURE, 0, position, 1))
+                count = min(count, ZIP64_COUNT_MARKER)
+                start = min(start, ZIP64_MARKER)
+                size = min(size, ZIP64_MARKER)
+            self.fp.write(END_RECORD.pack(
+                END_RECORD_SIGNATURE, 0, 0, count, count, size, start, len(self.comment)
+            ))
+            self.fp.write(self.comment)
+        finally:
+            self.fp.close()
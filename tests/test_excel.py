@@ -1,5 +1,18 @@
+import datetime
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
 import unittest
-from src.utils.excel_manager import ExcelManager
+from decimal import Decimal
+from types import SimpleNamespace
+from src.utils.excel_manager import ExcelManager, XL_CALCULATION_MANUAL
+from src.utils.com_worker import ComWorker
+from src.utils.com_profiler import ComProxy, ComStats, unwrap
+from src.utils.fake_excel import FakeApplication, XL_CALCULATION_AUTOMATIC
+from src.utils.formula_manager import FormulaManager
 
 class TestExcelManager(unittest.TestCase):
     def setUp(self):
@@ -115,5 +128,251 @@ class TestExcelManager(unittest.TestCase):
         except:
             pass
 
+class TestBulkOperation(unittest.TestCase):
+    def setUp(self):
+        """使用模拟的Application对象"""
+        self.excel_manager = ExcelManager()
+        self.excel_manager.app = SimpleNamespace(
+            ScreenUpdating=True,
+            Calculation=-4105,
+            EnableEvents=True
+        )
+        self.calculated = []
+
+    def make_range(self, address):
+        return SimpleNamespace(Address=address, Calculate=lambda: self.calculated.append(address))
+
+    def test_nested_scope(self):
+        """测试嵌套批量操作只在最外层恢复设置"""
+        app = self.excel_manager.app
+        with self.excel_manager.bulk_operation():
+            with self.excel_manager.bulk_operation():
+                self.assertFalse(app.ScreenUpdating)
+                self.assertFalse(app.EnableEvents)
+                self.assertEqual(app.Calculation, XL_CALCULATION_MANUAL)
+                self.excel_manager.mark_touched(self.make_range('$A$1'))
+            self.assertFalse(app.ScreenUpdating)
+            self.excel_manager.mark_touched(self.make_range('$B$1:$B$5'))
+
+        self.assertTrue(app.ScreenUpdating)
+        self.assertTrue(app.EnableEvents)
+        self.assertEqual(app.Calculation, -4105)
+        self.assertEqual(self.calculated, ['$A$1', '$B$1:$B$5'])
+
+    def test_restore_on_error(self):
+        """测试异常时也恢复设置"""
+        with self.assertRaises(RuntimeError):
+            with self.excel_manager.bulk_operation():
+                raise RuntimeError()
+        self.assertTrue(self.excel_manager.app.ScreenUpdating)
+
+    def test_suspend_failure(self):
+        """测试设置计算模式失败时不改动刷新和事件设置"""
+        class App:
+            ScreenUpdating = True
+            EnableEvents = True
+
+            @property
+            def Calculation(self):
+                return -4105
+
+            @Calculation.setter
+            def Calculation(self, value):
+                raise RuntimeError("没有打开的工作簿")
+
+        app = self.excel_manager.app = App()
+        with self.excel_manager.bulk_operation():
+            self.assertTrue(app.ScreenUpdating)
+            self.assertTrue(app.EnableEvents)
+        self.assertTrue(app.ScreenUpdating)
+        self.assertTrue(app.EnableEvents)
+
+    def tearDown(self):
+        """不需要断开真实的Excel连接"""
+        self.excel_manager.app = None
+
+class TestFakeExcel(unittest.TestCase):
+    def setUp(self):
+        """使用内存中的Excel对象模型"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'test.xlsx')
+        open(self.path, 'wb').close()
+        self.app = FakeApplication()
+        self.excel_manager = ExcelManager(app=self.app)
+        self.assertTrue(self.excel_manager.open_file(self.path))
+        self.sheet = self.excel_manager.active_sheet
+        self.sheet.Range('A1:C3').Value = ((1, 2, 3), (4, 5, 6), (7, 8, 9))
+
+    def test_file_operations(self):
+        """测试打开文件和工作簿列表"""
+        self.assertTrue(self.excel_manager.is_connected())
+        self.assertEqual(list(self.excel_manager.refresh_workbooks()), ['test.xlsx'])
+        # 再次打开同一文件时使用已打开的工作簿
+        self.assertTrue(self.excel_manager.open_file(self.path))
+        self.assertEqual(self.app.Workbooks.Count, 1)
+        self.assertTrue(self.excel_manager.activate_workbook('test.xlsx'))
+
+    def test_range(self):
+        """测试区域读写"""
+        self.assertEqual(self.sheet.UsedRange.Address, '$A$1:$C$3')
+        self.assertEqual(self.sheet.Range('B2').Value, 5)
+        self.assertEqual(self.sheet.Range('A1:B1').Formula, (('1', '2'),))
+        self.sheet.Range('D1:D3').FormulaR1C1 = '=SUM(RC[-3]:RC[-1])'
+        self.assertEqual(self.sheet.Range('D2').Formula, '=SUM(A2:C2)')
+        self.assertEqual(self.sheet.UsedRange.Address, '$A$1:$D$3')
+
+    def test_apply_and_restore(self):
+        """测试应用公式、快照和恢复"""
+        formula_manager = FormulaManager()
+        self.sheet.Range('A1:A3').Select()
+        input_range = self.excel_manager.select_range('input')
+        self.assertEqual(input_range.Address, '$A$1:$A$3')
+        output_range = self.excel_manager.select_range('output', 'E1:E3')
+
+        with self.excel_manager.bulk_operation():
+            self.assertEqual(self.app.Calculation, XL_CALCULATION_MANUAL)
+            before = self.excel_manager.get_current_state(output_range.Address)
+            self.assertTrue(formula_manager.apply_formula('求和', input_range, output_range))
+        self.assertEqual(self.app.Calculation, XL_CALCULATION_AUTOMATIC)
+        self.assertEqual(self.sheet.Range('E3').Formula, '=SUM($A$1:$A$3)')
+
+        self.assertTrue(self.excel_manager.restore_state(before))
+        self.assertEqual(self.sheet.Range('E3').Formula, '')
+
+    def test_restore_other_sheet(self):
+        """测试快照写回目标区域所在的工作表，而不是当前活动工作表"""
+        workbook = self.app.Workbooks.Add('多表.xlsx', sheets=2)
+        self.excel_manager.refresh_workbooks()
+        self.assertTrue(self.excel_manager.activate_workbook('多表.xlsx'))
+        first, second = workbook.Worksheets
+        second.Range('B1:B2').Value = ((1,), (2,))
+        output_range = second.Range('B1:B2')
+
+        before = self.excel_manager.get_current_state(output_range.Address, sheet=output_range.Worksheet)
+        self.assertEqual((before['workbook'], before['sheet']), ('多表.xlsx', 'Sheet2'))
+        output_range.Formula = '=1'
+        # 恢复前切换到另一个工作簿
+        self.assertTrue(self.excel_manager.activate_workbook('test.xlsx'))
+        self.assertTrue(self.excel_manager.restore_state(before))
+        self.assertEqual(second.Range('B1:B2').Value, ((1,), (2,)))
+        self.assertIsNone(first.Range('B1').Value)
+        self.assertEqual(self.sheet.Range('B1').Value, 2)
+
+        # 工作簿已关闭时不写到其他工作簿
+        workbook.Close()
+        self.excel_manager.refresh_workbooks()
+        self.assertFalse(self.excel_manager.restore_state(before))
+        self.assertEqual(self.sheet.Range('B1').Value, 2)
+
+    def test_latency(self):
+        """测试每次调用计数并模拟延迟"""
+        self.app.reset_calls()
+        self.app.latency = 0.002
+        start = time.perf_counter()
+        self.sheet.Range('A1:C3').Value
+        self.assertEqual(self.app.calls, 2)
+        self.assertEqual(self.app.call_counts['FakeRange.Value'], 1)
+        self.assertGreaterEqual(time.perf_counter() - start, 0.004)
+
+    def tearDown(self):
+        """断开连接并删除临时文件"""
+        self.excel_manager.disconnect()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+class TestComProfiler(unittest.TestCase):
+    def setUp(self):
+        """统计FakeApplication上的调用"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'test.xlsx')
+        open(self.path, 'wb').close()
+        self.app = FakeApplication()
+        self.stats = ComStats()
+        self.excel_manager = ExcelManager(app=self.app, com_stats=self.stats)
+        self.assertTrue(self.excel_manager.open_file(self.path))
+        self.sheet = self.excel_manager.active_sheet
+
+    def test_proxy(self):
+        """测试按成员路径统计次数和字节数，返回的COM对象同样被包装"""
+        self.assertIsInstance(self.excel_manager.app, ComProxy)
+        self.assertIs(unwrap(self.excel_manager.app), self.app)
+        self.assertIsInstance(self.sheet, ComProxy)
+
+        self.stats.reset()
+        self.sheet.Range('A1:B2').Formula = ((1, 'ab'), ('c', 'd'))
+        self.assertEqual(self.sheet.Range('A1:B2').Value, ((1, 'ab'), ('c', 'd')))
+        self.assertTrue(self.excel_manager.is_connected())
+
+        members = self.stats.snapshot()
+        self.assertEqual(members['ActiveSheet.Range()']['count'], 2)
+        self.assertEqual(members['Range.Formula=']['count'], 1)
+        self.assertEqual(members['Workbooks.Count']['count'], 1)
+        # 2x2的数组，字符串共4个字符
+        self.assertEqual(members['Range.Value']['bytes'], 16 * 7 + 2 * 4)
+
+        summary = self.stats.summary()
+        self.assertIn('Range.Formula=', summary)
+        self.assertIn('合计', summary)
+
+    def test_plain_values(self):
+        """测试日期和Decimal等单元格值原样返回，快照可以序列化"""
+        value = datetime.datetime(2024, 1, 2, 3, 4, 5)
+        self.sheet.Range('A1').Value = value
+        self.sheet.Range('A2').Value = Decimal('1.5')
+        self.assertIs(type(self.sheet.Range('A1').Value), datetime.datetime)
+        self.assertIs(type(self.sheet.Range('A2').Value), Decimal)
+
+        state = self.excel_manager.get_current_state('A1')
+        self.assertEqual(pickle.loads(pickle.dumps(state))['values'], value)
+
+    def test_apply_and_restore(self):
+        """测试通过代理应用公式和恢复"""
+        self.sheet.Range('A1:A3').Value = ((1,), (2,), (3,))
+        input_range = self.excel_manager.select_range('input', 'A1:A3')
+        output_range = self.excel_manager.select_range('output', 'B1:B3')
+        before = self.excel_manager.get_current_state(output_range.Address)
+        with self.excel_manager.bulk_operation():
+            self.assertTrue(FormulaManager().apply_formula('求和', input_range, output_range))
+        self.assertEqual(unwrap(self.sheet).get_cell(3, 2)[1], '=SUM($A$1:$A$3)')
+        self.assertTrue(self.excel_manager.restore_state(before))
+        self.assertEqual(unwrap(self.sheet).get_cell(3, 2), (None, None))
+        self.assertGreater(self.stats.snapshot()['Application.Calculation=']['count'], 0)
+
+    def tearDown(self):
+        """断开连接并删除临时文件"""
+        self.excel_manager.disconnect()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+class TestComWorker(unittest.TestCase):
+    def setUp(self):
+        """创建工作线程"""
+        self.worker = ComWorker()
+
+    def test_submit(self):
+        """测试操作在同一个工作线程中按顺序执行"""
+        calls = []
+        futures = [
+            self.worker.submit(lambda i=i: calls.append((i, threading.current_thread().name)) or i)
+            for i in range(5)
+        ]
+        self.assertEqual([future.result(5) for future in futures], list(range(5)))
+        self.assertEqual([i for i, _ in calls], list(range(5)))
+        self.assertEqual({name for _, name in calls}, {'excel-com'})
+
+    def test_error(self):
+        """测试异常通过Future返回，不影响之后的操作"""
+        future = self.worker.submit(lambda: 1 / 0)
+        with self.assertRaises(ZeroDivisionError):
+            future.result(5)
+        self.assertEqual(self.worker.call(lambda: 'ok', timeout=5), 'ok')
+
+    def test_call_in_worker(self):
+        """测试在工作线程中调用call时直接执行，不会死锁"""
+        result = self.worker.call(lambda: self.worker.call(lambda: 42), timeout=5)
+        self.assertEqual(result, 42)
+
+    def tearDown(self):
+        """停止工作线程"""
+        self.worker.shutdown(timeout=5)
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
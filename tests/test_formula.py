@@ -1,5 +1,13 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
+from unittest import mock
 from src.utils.formula_manager import FormulaManager
+from src.utils.sqlite_formula_manager import SqliteFormulaManager
 
 class TestFormulaManager(unittest.TestCase):
     def setUp(self):
@@ -28,5 +36,333 @@ class TestFormulaManager(unittest.TestCase):
         self.assertIsInstance(results, list)
         self.assertGreater(len(results), 0)
 
+    @mock.patch.object(FormulaManager, 'save_formulas', return_value=True)
+    def test_index(self, save_formulas):
+        """测试名称索引随增删改更新"""
+        self.assertEqual(self.formula_manager.get_formula_template("求和"), "=SUM({range})")
+
+        new_formula = {"name": "测试", "description": "测试公式", "template": "=ABS({range})"}
+        self.assertTrue(self.formula_manager.add_formula("基础运算", new_formula))
+        self.assertEqual(self.formula_manager.get_formula("测试"), new_formula)
+
+        # 删除后同分类中后面的公式位置前移
+        self.assertTrue(self.formula_manager.delete_formula("平均值"))
+        self.assertIsNone(self.formula_manager.get_formula("平均值"))
+        category, i, formula = self.formula_manager.index["测试"]
+        self.assertIs(self.formula_manager.formulas[category][i], formula)
+
+        renamed = dict(new_formula, name="测试2")
+        self.assertTrue(self.formula_manager.update_formula("测试", renamed))
+        self.assertIsNone(self.formula_manager.get_formula("测试"))
+        self.assertEqual(self.formula_manager.get_formula_description("测试2"), "测试公式")
+
+        # 多次修改合并为一次保存
+        self.assertTrue(self.formula_manager.dirty)
+        self.assertTrue(self.formula_manager.flush())
+        self.assertFalse(self.formula_manager.dirty)
+        self.assertEqual(save_formulas.call_count, 1)
+
+    @mock.patch.object(FormulaManager, 'save_formulas', return_value=True)
+    def test_search_index(self, save_formulas):
+        """测试全文索引搜索和增量更新"""
+        # 名称完全匹配排在前面
+        names = [formula['name'] for formula in self.formula_manager.search_formulas("求和")]
+        self.assertEqual(names[0], "求和")
+        self.assertIn("条件求和", names)
+
+        # 单字、描述和模板中的函数名
+        self.assertIn("方差", [f['name'] for f in self.formula_manager.search_formulas("差")])
+        self.assertIn("文本计数", [f['name'] for f in self.formula_manager.search_formulas("非空")])
+        names = [formula['name'] for formula in self.formula_manager.search_formulas("sumif")]
+        self.assertEqual(names, ["条件求和"])
+        self.assertEqual(self.formula_manager.search_formulas("条件 平均")[0]['name'], "条件平均")
+        self.assertEqual(self.formula_manager.search_formulas("不存在的公式"), [])
+
+        new_formula = {"name": "绝对值", "description": "返回数值的绝对值", "template": "=ABS({range})"}
+        self.formula_manager.add_formula("基础运算", new_formula)
+        self.assertEqual(self.formula_manager.search_formulas("abs")[0]['name'], "绝对值")
+
+        self.formula_manager.update_formula("绝对值", dict(new_formula, name="取绝对值"))
+        self.assertEqual(self.formula_manager.search_formulas("绝对")[0]['name'], "取绝对值")
+
+        self.formula_manager.delete_formula("取绝对值")
+        self.assertEqual(self.formula_manager.search_formulas("abs"), [])
+        self.formula_manager.flush()
+
+    def test_fuzzy_search(self):
+        """测试拼音和模糊搜索"""
+        self.assertEqual(self.formula_manager.search_formulas("tjqh")[0]['name'], "条件求和")
+        self.assertEqual(self.formula_manager.search_formulas("qiuhe")[0]['name'], "求和")
+        # 拼写错误按编辑距离匹配
+        self.assertEqual(self.formula_manager.search_formulas("sumfi")[0]['name'], "条件求和")
+        self.assertEqual(self.formula_manager.search_formulas("avreage")[0]['name'], "平均值")
+        self.assertEqual(self.formula_manager.search_formulas("xyzxyz"), [])
+
+    def test_short_pinyin_search(self):
+        """测试两个字母的全拼，直接搜索和逐字缩小范围的结果相同"""
+        for keyword in ("qi", "he", "um"):
+            direct = [formula['name'] for formula in self.formula_manager.search_formulas(keyword)]
+            previous = [formula['name'] for formula in self.formula_manager.search_formulas(keyword[0])]
+            narrowed = [formula['name'] for formula in self.formula_manager.search_formulas(keyword, previous)]
+            self.assertTrue(direct, keyword)
+            self.assertEqual(direct, narrowed, keyword)
+        self.assertIn("求和", [formula['name'] for formula in self.formula_manager.search_formulas("qi")])
+        self.assertIn("求和", [formula['name'] for formula in self.formula_manager.search_formulas("he")])
+
+    def test_narrow_search(self):
+        """测试在上次的结果中继续筛选"""
+        previous = self.formula_manager.search_formulas("条件")
+        names = [formula['name'] for formula in previous]
+        narrowed = self.formula_manager.search_formulas("条件求", names)
+        self.assertEqual(narrowed, self.formula_manager.search_formulas("条件求"))
+
+        # 只在给定的公式中搜索
+        self.assertEqual(self.formula_manager.search_formulas("求和", ["条件求和"])[0]['name'], "条件求和")
+        self.assertEqual(len(self.formula_manager.search_formulas("求和", ["条件求和"])), 1)
+
+    def test_write_behind(self):
+        """测试后台线程合并保存，并通过临时文件替换写入"""
+        temp_dir = tempfile.mkdtemp()
+        json_path = os.path.join(temp_dir, 'formulas.json')
+        try:
+            formula_manager = FormulaManager(save_delay=0.05)
+            with mock.patch.object(formula_manager, 'get_formulas_path', return_value=json_path):
+                for i in range(20):
+                    formula_manager.add_formula("测试", {"name": f"测试{i}", "description": "", "template": "=1"})
+                # 等待后台线程保存
+                deadline = time.time() + 5
+                while not os.path.exists(json_path) and time.time() < deadline:
+                    time.sleep(0.01)
+                formula_manager.flush()
+
+                with open(json_path, encoding='utf-8') as f:
+                    self.assertEqual(len(json.load(f)["测试"]), 20)
+                # 没有残留的临时文件
+                self.assertEqual(os.listdir(temp_dir), ['formulas.json'])
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def test_cache(self):
+        """测试解析结果缓存随formulas.json的修改失效"""
+        temp_dir = tempfile.mkdtemp()
+        json_path = os.path.join(temp_dir, 'formulas.json')
+        try:
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump({"测试": [{"name": "求和", "description": "", "template": "=SUM({range})"}]}, f)
+            formula_manager = FormulaManager()
+            formula_manager.load_formulas(json_path)
+            self.assertFalse(formula_manager.cache_hit)
+            self.assertTrue(os.path.exists(os.path.join(temp_dir, 'formulas.cache')))
+
+            formula_manager.load_formulas(json_path)
+            self.assertTrue(formula_manager.cache_hit)
+            formula = formula_manager.get_formula("求和")
+            self.assertIs(formula_manager.formulas["测试"][0], formula)
+            self.assertIs(formula_manager.search_index.documents["求和"].formula, formula)
+            self.assertEqual(formula_manager.search_formulas("sum")[0]['name'], "求和")
+
+            # 文件修改后重新解析
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump({"测试": [{"name": "平均值", "description": "", "template": "=AVERAGE({range})"}]}, f)
+            formula_manager.load_formulas(json_path)
+            self.assertFalse(formula_manager.cache_hit)
+            self.assertIsNone(formula_manager.get_formula("求和"))
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def test_reload(self):
+        """测试文件被外部修改后只更新变化的公式"""
+        temp_dir = tempfile.mkdtemp()
+        json_path = os.path.join(temp_dir, 'formulas.json')
+        formulas = {
+            "基础运算": [
+                {"name": "求和", "description": "求和", "template": "=SUM({range})"},
+                {"name": "平均值", "description": "平均", "template": "=AVERAGE({range})"}
+            ],
+            "统计函数": [{"name": "计数", "description": "计数", "template": "=COUNT({range})"}]
+        }
+        try:
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump(formulas, f)
+            formula_manager = FormulaManager()
+            formula_manager.load_formulas(json_path)
+            self.assertIsNone(formula_manager.check_for_changes())
+
+            formulas["基础运算"][1]["template"] = "=AVERAGEA({range})"
+            formulas["基础运算"].append({"name": "最大值", "description": "最大", "template": "=MAX({range})"})
+            del formulas["统计函数"]
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump(formulas, f)
+            os.utime(json_path, ns=(0, 0))
+
+            changes = formula_manager.check_for_changes()
+            self.assertEqual(changes['added'], ["最大值"])
+            self.assertEqual(changes['removed'], ["计数"])
+            self.assertEqual(changes['changed'], ["平均值"])
+            self.assertEqual(changes['categories'], ["基础运算", "统计函数"])
+            self.assertEqual(formula_manager.get_formula_template("平均值"), "=AVERAGEA({range})")
+            self.assertEqual(formula_manager.search_formulas("max")[0]['name'], "最大值")
+            self.assertEqual(formula_manager.search_formulas("count"), [])
+            self.assertIsNone(formula_manager.check_for_changes())
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def test_merge_external_changes(self):
+        """测试有未保存的修改时，外部修改与本地修改合并而不是被覆盖"""
+        temp_dir = tempfile.mkdtemp()
+        json_path = os.path.join(temp_dir, 'formulas.json')
+        formulas = {
+            "基础运算": [
+                {"name": "求和", "description": "求和", "template": "=SUM({range})"},
+                {"name": "平均值", "description": "平均", "template": "=AVERAGE({range})"},
+                {"name": "计数", "description": "计数", "template": "=COUNT({range})"}
+            ]
+        }
+        try:
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump(formulas, f)
+            formula_manager = FormulaManager(save_delay=60)
+            formula_manager.load_formulas(json_path)
+            with mock.patch.object(formula_manager, 'get_formulas_path', return_value=json_path):
+                formula_manager.update_formula("求和", {"name": "求和", "description": "本地", "template": "=SUM({range})"})
+                formula_manager.add_formula("基础运算", {"name": "本地", "description": "", "template": "=1"})
+
+                # 外部程序修改了同一个公式和其他公式
+                external = json.loads(json.dumps(formulas))
+                external["基础运算"][0]["description"] = "外部"
+                external["基础运算"][1]["template"] = "=AVERAGEA({range})"
+                del external["基础运算"][2]
+                external["外部"] = [{"name": "外部", "description": "", "template": "=2"}]
+                with open(json_path, 'w', encoding='utf-8') as f:
+                    json.dump(external, f)
+                os.utime(json_path, ns=(0, 0))
+
+                changes = formula_manager.check_for_changes()
+                self.assertEqual(changes['conflicts'], ["求和"])
+                self.assertEqual(sorted(changes['added']), ["外部"])
+                self.assertEqual(changes['removed'], ["计数"])
+                self.assertTrue(formula_manager.dirty)
+                self.assertEqual(formula_manager.get_formula_description("求和"), "本地")
+                self.assertEqual(formula_manager.get_formula_template("平均值"), "=AVERAGEA({range})")
+
+                # 保存前文件再次被修改，也先合并
+                external["外部"].append({"name": "外部2", "description": "", "template": "=3"})
+                with open(json_path, 'w', encoding='utf-8') as f:
+                    json.dump(external, f)
+                os.utime(json_path, ns=(1, 1))
+                self.assertTrue(formula_manager.flush())
+
+            with open(json_path, encoding='utf-8') as f:
+                saved = json.load(f)
+            self.assertEqual(
+                [formula['name'] for formula in saved["基础运算"]], ["求和", "平均值", "本地"]
+            )
+            self.assertEqual(saved["基础运算"][0]["description"], "本地")
+            self.assertEqual(saved["基础运算"][1]["template"], "=AVERAGEA({range})")
+            self.assertEqual([formula['name'] for formula in saved["外部"]], ["外部", "外部2"])
+            self.assertIsNone(formula_manager.check_for_changes())
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+class TestSqliteFormulaManager(unittest.TestCase):
+    def setUp(self):
+        """测试前准备：从formulas.json导入到临时数据库"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.formula_manager = SqliteFormulaManager(os.path.join(self.temp_dir, 'formulas.db'))
+
+    def tearDown(self):
+        """测试后清理"""
+        self.formula_manager.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_same_api(self):
+        """测试与FormulaManager的接口一致"""
+        json_manager = FormulaManager()
+        self.assertEqual(self.formula_manager.get_categories(), json_manager.get_categories())
+        for category in json_manager.get_categories():
+            self.assertEqual(self.formula_manager.get_formulas(category), json_manager.get_formulas(category))
+        self.assertEqual(self.formula_manager.get_formula("求和"), json_manager.get_formula("求和"))
+        self.assertEqual(self.formula_manager.get_all_formulas(), json_manager.get_all_formulas())
+
+    def test_search(self):
+        """测试全文索引搜索"""
+        names = [formula['name'] for formula in self.formula_manager.search_formulas("求和")]
+        self.assertEqual(names[0], "求和")
+        self.assertIn("条件求和", names)
+        self.assertEqual([f['name'] for f in self.formula_manager.search_formulas("sumif")], ["条件求和"])
+        self.assertEqual(self.formula_manager.search_formulas("tjqh")[0]['name'], "条件求和")
+        self.assertEqual(len(self.formula_manager.search_formulas("求和", ["条件求和"])), 1)
+
+    def test_fuzzy_search(self):
+        """测试拼写错误时与FormulaManager一样按编辑距离匹配"""
+        json_manager = FormulaManager()
+        for keyword in ("sumfi", "avreage", "xyzxyz", "条件 sumfi"):
+            self.assertEqual(
+                [f['name'] for f in self.formula_manager.search_formulas(keyword)][:1],
+                [f['name'] for f in json_manager.search_formulas(keyword)][:1],
+                keyword
+            )
+        self.assertEqual(
+            [f['name'] for f in self.formula_manager.search_formulas("avreage", ["求和", "平均值"])],
+            [f['name'] for f in json_manager.search_formulas("avreage", ["求和", "平均值"])]
+        )
+
+    def test_fuzzy_keys(self):
+        """测试模糊匹配的检索键随公式增删改更新，旧数据库打开时补建"""
+        search = lambda keyword: [f['name'] for f in self.formula_manager.search_formulas(keyword)]
+        self.assertTrue(self.formula_manager.add_formula("基础运算", {'name': "测试模糊", 'template': "=QWERTYX({range})"}))
+        self.assertIn("测试模糊", search("qwertzx"))
+        self.assertTrue(self.formula_manager.update_formula("测试模糊", {'name': "测试模糊", 'template': "=ZXCVBNX({range})"}))
+        self.assertNotIn("测试模糊", search("qwertzx"))
+        self.assertIn("测试模糊", search("zxcvbmx"))
+        self.assertTrue(self.formula_manager.delete_formula("测试模糊"))
+        self.assertEqual(search("zxcvbmx"), [])
+        with self.formula_manager.conn:
+            self.assertIsNone(self.formula_manager.conn.execute(
+                "SELECT 1 FROM key_trigrams WHERE key = 'zxcvbnx'"
+            ).fetchone())
+            self.formula_manager.conn.execute("DELETE FROM fuzzy_keys")
+        self.formula_manager.close()
+
+        self.formula_manager = SqliteFormulaManager(os.path.join(self.temp_dir, 'formulas.db'))
+        self.assertEqual(search("avreage")[:1], [f['name'] for f in FormulaManager().search_formulas("avreage")][:1])
+
+    def test_inherited_state(self):
+        """测试继承的方法可以使用，搜索线程和界面线程可以同时访问"""
+        self.assertEqual(self.formula_manager.formulas, {})
+        self.assertFalse(self.formula_manager.cache_hit)
+        self.assertTrue(self.formula_manager.save_formulas())
+        self.assertTrue(self.formula_manager.flush())
+        self.assertIsNone(self.formula_manager.prepare_formula("基础运算", "求和", "A1:A3"))
+
+        errors = []
+        def search():
+            try:
+                for _ in range(50):
+                    self.assertEqual(self.formula_manager.search_formulas("求和")[0]['name'], "求和")
+            except Exception as e:
+                errors.append(e)
+        thread = threading.Thread(target=search)
+        thread.start()
+        for _ in range(50):
+            self.assertTrue(self.formula_manager.get_categories())
+            self.assertIsNotNone(self.formula_manager.get_formula("求和"))
+        thread.join(10)
+        self.assertEqual(errors, [])
+
+    def test_modify(self):
+        """测试增删改后分页缓存和全文索引更新"""
+        self.assertNotIn("绝对值", self.formula_manager.get_formulas("基础运算"))
+        formula = {"name": "绝对值", "description": "返回数值的绝对值", "template": "=ABS({range})"}
+        self.assertTrue(self.formula_manager.add_formula("基础运算", formula))
+        self.assertEqual(self.formula_manager.get_formulas("基础运算")[-1], "绝对值")
+        self.assertEqual(self.formula_manager.search_formulas("abs")[0]['name'], "绝对值")
+
+        self.assertTrue(self.formula_manager.update_formula("绝对值", dict(formula, name="取绝对值")))
+        self.assertEqual(self.formula_manager.get_formula_template("取绝对值"), "=ABS({range})")
+        self.assertTrue(self.formula_manager.delete_formula("取绝对值"))
+        self.assertEqual(self.formula_manager.search_formulas("abs"), [])
+        self.assertNotIn("取绝对值", self.formula_manager.get_formulas("基础运算"))
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
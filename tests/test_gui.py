@@ -1,6 +1,9 @@
+import threading
+import time
 import unittest
 import tkinter as tk
 from src.gui.main_window import MainWindow
+from src.gui.search_worker import SearchWorker
 
 class TestGUI(unittest.TestCase):
     @classmethod
@@ -26,5 +29,56 @@ class TestGUI(unittest.TestCase):
         """测试后清理"""
         cls.root.destroy()
 
+class TestSearchWorker(unittest.TestCase):
+    def setUp(self):
+        """搜索函数等待started/release，用来控制后台线程的进度"""
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+        def search(query, candidates):
+            self.started.set()
+            self.release.wait(5)
+            return [{'name': query}]
+
+        self.worker = SearchWorker(search)
+
+    def tearDown(self):
+        """停止后台线程"""
+        self.release.set()
+        self.worker.close()
+
+    def wait_for_result(self):
+        """等待后台线程放入结果"""
+        deadline = time.time() + 5
+        while self.worker.results.empty() and time.time() < deadline:
+            time.sleep(0.001)
+
+    def test_result_after_empty_poll(self):
+        """测试poll为空之后、busy之前完成的结果不会丢失"""
+        self.worker.submit('求和')
+        self.assertTrue(self.started.wait(5))
+
+        # 界面线程poll时搜索尚未完成
+        self.assertIsNone(self.worker.poll())
+        # 后台线程在busy之前完成并放入结果
+        self.release.set()
+        self.wait_for_result()
+        self.assertTrue(self.worker.busy())
+        self.assertEqual(self.worker.poll(), ('求和', [{'name': '求和'}]))
+        self.assertFalse(self.worker.busy())
+
+    def test_stale_result(self):
+        """测试作废的请求结果被丢弃"""
+        self.worker.submit('旧')
+        self.assertTrue(self.started.wait(5))
+        self.worker.submit('新')
+        self.release.set()
+        deadline = time.time() + 5
+        result = None
+        while result is None and time.time() < deadline:
+            result = self.worker.poll()
+            time.sleep(0.001)
+        self.assertEqual(result, ('新', [{'name': '新'}]))
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
@@ -0,0 +1,186 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from src.utils.history_manager import HistoryEntry, HistoryManager
+
+def make_state(values, address='$A$1:$C$3'):
+    """生成状态字典"""
+    grid = tuple(tuple(row) for row in values)
+    return {
+        'values': grid,
+        'formulas': tuple(tuple('' if v is None else str(v) for v in row) for row in grid),
+        'range': address
+    }
+
+class TestHistoryManager(unittest.TestCase):
+    def setUp(self):
+        """测试前准备：6次操作，每次修改区域中的一个单元格"""
+        self.history_manager = HistoryManager()
+        self.states = []
+        values = [[row * 3 + col for col in range(3)] for row in range(3)]
+        self.states.append(make_state(values))
+        for step in range(6):
+            values = [list(row) for row in values]
+            values[step % 3][0] = f"step{step}"
+            self.states.append(make_state(values))
+
+    def save_all(self, history_manager):
+        for before, after in zip(self.states, self.states[1:]):
+            history_manager.save_command(before, after)
+
+    def test_undo_redo(self):
+        """测试撤销、重做和重置"""
+        self.save_all(self.history_manager)
+
+        self.assertEqual(self.history_manager.peek_undo(), self.states[5])
+        self.assertTrue(self.history_manager.undo())
+        self.assertEqual(self.history_manager.peek_undo(), self.states[4])
+        self.assertTrue(self.history_manager.undo())
+        self.assertEqual(self.history_manager.peek_redo(), self.states[5])
+        self.assertTrue(self.history_manager.redo())
+        states = self.history_manager.peek_reset()
+        self.assertEqual(states[-1], self.states[0])
+        self.assertEqual(len(states), 5)
+        self.assertTrue(self.history_manager.reset())
+        self.assertFalse(self.history_manager.can_undo())
+        self.assertFalse(self.history_manager.undo())
+        self.assertFalse(self.history_manager.redo())
+
+    def test_peek(self):
+        """测试预览要写回的状态时不修改历史记录"""
+        self.assertIsNone(self.history_manager.peek_undo())
+        self.save_all(self.history_manager)
+
+        self.assertEqual(self.history_manager.peek_undo(), self.states[5])
+        self.assertEqual(len(self.history_manager.history), 6)
+        self.assertTrue(self.history_manager.undo())
+        self.assertEqual(self.history_manager.peek_redo(), self.states[6])
+        self.assertTrue(self.history_manager.can_redo())
+        self.assertEqual(self.history_manager.peek_reset(), self.states[4::-1])
+        self.assertTrue(self.history_manager.can_reset())
+
+    def test_undo_region(self):
+        """测试撤销写回被弹出记录自己的区域和工作表"""
+        first = dict(make_state([[1]], '$A$1'), sheet='Sheet1', workbook='a.xlsx')
+        second = dict(make_state([[2, 3]], '$C$5:$D$5'), sheet='Sheet2', workbook='a.xlsx')
+        self.history_manager.save_command(first, dict(first, values=((9,),)))
+        self.history_manager.save_command(second, dict(second, values=((9, 9),)))
+
+        state = self.history_manager.peek_undo()
+        self.assertEqual(state, second)
+        self.assertEqual((state['range'], state['sheet']), ('$C$5:$D$5', 'Sheet2'))
+        self.history_manager.undo()
+        self.assertEqual(self.history_manager.peek_undo(), first)
+        self.history_manager.undo()
+        self.assertEqual(self.history_manager.peek_redo()['values'], ((9,),))
+
+    def test_commit_without_decode(self):
+        """测试撤销、重做和重置只移动记录，不再解码状态"""
+        self.save_all(self.history_manager)
+        with mock.patch.object(HistoryEntry, 'decode') as decode:
+            self.assertTrue(self.history_manager.undo())
+            self.assertTrue(self.history_manager.redo())
+            self.assertTrue(self.history_manager.reset())
+        decode.assert_not_called()
+
+    def test_delta_encoding(self):
+        """测试操作后的内容保存为差量"""
+        self.save_all(self.history_manager)
+
+        for command in self.history_manager.history:
+            self.assertTrue(command.before.is_keyframe)
+            self.assertFalse(command.after.is_keyframe)
+        self.assertGreater(self.history_manager.memory_usage(), 0)
+
+    def test_single_cell(self):
+        """测试单个单元格的操作"""
+        before = {'values': 1.0, 'formulas': '1', 'range': '$A$1'}
+        after = {'values': None, 'formulas': '=SUM($B$1:$B$3)', 'range': '$A$1'}
+        self.history_manager.save_command(before, after)
+        self.assertEqual(self.history_manager.peek_undo(), before)
+        self.history_manager.undo()
+        self.assertEqual(self.history_manager.peek_redo(), after)
+
+    def test_step_limit(self):
+        """测试超出步数上限时淘汰最早的记录"""
+        history_manager = HistoryManager({'excel.max_history': 3})
+        self.save_all(history_manager)
+
+        self.assertEqual(len(history_manager.history), 3)
+        self.assertEqual(history_manager.evicted_count, 3)
+        self.assertEqual(history_manager.peek_reset()[-1], self.states[3])
+
+    def test_byte_budget(self):
+        """测试超出内存上限时淘汰"""
+        history_manager = HistoryManager({'excel.history_budget': 1})
+        self.save_all(history_manager)
+
+        self.assertEqual(len(history_manager.history), 1)
+        self.assertEqual(history_manager.evicted_count, 5)
+        self.assertEqual(history_manager.peek_undo(), self.states[5])
+
+    def test_spill_to_disk(self):
+        """测试较早的记录转存到磁盘并在撤销时读回"""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            history_manager = HistoryManager({
+                'excel.history_spill': True,
+                'excel.history_spill_dir': temp_dir,
+                'excel.history_memory_states': 2
+            })
+            self.save_all(history_manager)
+
+            spilled = [command for command in history_manager.history
+                       if not command.before.in_memory]
+            self.assertEqual(len(spilled), 4)
+            self.assertGreater(history_manager.disk_usage(), 0)
+
+            for index in range(5, -1, -1):
+                self.assertEqual(history_manager.peek_undo(), self.states[index])
+                history_manager.undo()
+            self.assertEqual(history_manager.peek_redo(), self.states[1])
+
+            store_path = history_manager.store.path
+            history_manager.close()
+            self.assertFalse(os.path.exists(store_path))
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def test_spill_compaction(self):
+        """测试淘汰大量记录后磁盘文件被压缩，而不是一直增长"""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            history_manager = HistoryManager({
+                'excel.max_history': 5,
+                'excel.history_spill': True,
+                'excel.history_spill_dir': temp_dir,
+                'excel.history_memory_states': 1
+            })
+            # 随机内容不能压缩，每条记录约8KB
+            states = [
+                make_state([[os.urandom(1024).hex() for col in range(2)] for row in range(2)], '$A$1:$B$2')
+                for step in range(201)
+            ]
+            for before, after in zip(states, states[1:]):
+                history_manager.save_command(before, after)
+
+            self.assertEqual(history_manager.evicted_count, 195)
+            store = history_manager.store
+            # 不压缩时约为3MB
+            self.assertLess(history_manager.disk_usage(), 200 * 1024)
+            self.assertEqual(os.path.getsize(store.path), history_manager.disk_usage())
+
+            # 压缩后偏移量已更新，仍能读回
+            for index in range(199, 194, -1):
+                self.assertEqual(history_manager.peek_undo(), states[index])
+                history_manager.undo()
+            history_manager.reset()
+            self.assertEqual(history_manager.disk_usage(), 0)
+            history_manager.close()
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    unittest.main()
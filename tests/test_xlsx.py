@@ -0,0 +1,572 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+from src.utils import zip_writer
+from src.utils.workbook_backend import WorkbookBackend, write_formula
+from src.utils.xlsx_backend import XlsxManager, rewrite_parts
+from src.utils.xlsx_stream import SharedStringTable, XlsxStreamReader
+from src.utils.xlsx_inject import inject_formulas
+from src.utils.formula_manager import FormulaManager
+from src.utils.range_address import parse_range, shift_range, to_r1c1, r1c1_to_a1, a1_to_absolute_r1c1
+
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+    '<Override PartName="/xl/calcChain.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.calcChain+xml"/>'
+    '</Types>'
+)
+
+WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="数据" sheetId="1" r:id="rId1"/></sheets>'
+    '<calcPr calcId="191029"/></workbook>'
+)
+
+WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="sharedStrings.xml"/>'
+    '<Relationship Id="rId3" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/calcChain" Target="calcChain.xml"/>'
+    '</Relationships>'
+)
+
+SHARED_STRINGS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" count="1" uniqueCount="1">'
+    '<si><t>名称</t></si></sst>'
+)
+
+SHEET = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<dimension ref="A1:C3"/>'
+    '<sheetViews><sheetView workbookViewId="0"><selection activeCell="A2" sqref="A2:A3"/></sheetView></sheetViews>'
+    '<sheetData>'
+    '<row r="1" spans="1:3"><c r="A1" t="s"><v>0</v></c></row>'
+    '<row r="2" spans="1:3"><c r="A2"><v>1</v></c><c r="B2" s="1"><v>2</v></c><c r="C2"><v>3</v></c></row>'
+    '<row r="3" spans="1:3"><c r="A3"><v>4</v></c><c r="B3"><v>5</v></c><c r="C3"><f>SUM(A3:B3)</f><v>9</v></c></row>'
+    '</sheetData>'
+    '<pageMargins left="0.7" right="0.7" top="0.75" bottom="0.75" header="0.3" footer="0.3"/>'
+    '</worksheet>'
+)
+
+def build_workbook(path, sheet_xml=SHEET):
+    """生成测试用的最小xlsx文件"""
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', CONTENT_TYPES)
+        archive.writestr('xl/workbook.xml', WORKBOOK)
+        archive.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELS)
+        archive.writestr('xl/sharedStrings.xml', SHARED_STRINGS)
+        archive.writestr('xl/worksheets/sheet1.xml', sheet_xml)
+        archive.writestr('xl/calcChain.xml', '<calcChain/>')
+
+class TestXlsxManager(unittest.TestCase):
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'test.xlsx')
+        build_workbook(self.path)
+        self.manager = XlsxManager()
+        self.assertTrue(self.manager.open_file(self.path))
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_read(self):
+        """测试读取单元格"""
+        sheet = self.manager.active_sheet
+        self.assertEqual(sheet.Name, '数据')
+        self.assertEqual(sheet.Range('A1').Value, '名称')
+        self.assertEqual(sheet.Range('C3').Formula, '=SUM(A3:B3)')
+        self.assertEqual(sheet.UsedRange.Address, '$A$1:$C$3')
+        self.assertEqual(self.manager.select_range('input').Address, '$A$2:$A$3')
+
+    def test_backend_interface(self):
+        """测试后端基类是抽象类，子类必须实现全部抽象方法"""
+        with self.assertRaises(TypeError):
+            WorkbookBackend()
+
+        class Partial(WorkbookBackend):
+            def open_file(self, file_path):
+                return False
+
+            def is_connected(self):
+                return False
+
+        with self.assertRaises(TypeError):
+            Partial()
+        self.assertIsInstance(self.manager, WorkbookBackend)
+
+    def test_apply_and_save(self):
+        """测试应用公式并保存"""
+        input_range = self.manager.select_range('input', 'A2:C2')
+        output_range = self.manager.select_range('output', 'D2')
+        self.assertTrue(self.manager.apply_formula('=SUM({range})', input_range, output_range))
+        self.assertTrue(self.manager.save())
+
+        with zipfile.ZipFile(self.path) as archive:
+            names = archive.namelist()
+            sheet_xml = archive.read('xl/worksheets/sheet1.xml').decode('utf-8')
+            workbook_xml = archive.read('xl/workbook.xml').decode('utf-8')
+        self.assertNotIn('xl/calcChain.xml', names)
+        self.assertIn('<c r="D2"><f>SUM($A$2:$C$2)</f></c>', sheet_xml)
+        self.assertIn('fullCalcOnLoad="1"', workbook_xml)
+        # 未修改的行保持原样
+        self.assertIn('<row r="3" spans="1:3"><c r="A3"><v>4</v></c>', sheet_xml)
+        self.assertIn('<dimension ref="A1:D3"/>', sheet_xml)
+
+        reopened = XlsxManager()
+        self.assertTrue(reopened.open_file(self.path))
+        self.assertEqual(reopened.active_sheet.Range('D2').Formula, '=SUM($A$2:$C$2)')
+        self.assertEqual(reopened.active_sheet.Range('B2').Value, 2.0)
+
+    def test_formula_manager_apply(self):
+        """测试通过FormulaManager无界面应用公式"""
+        formula_manager = FormulaManager()
+        input_range = self.manager.select_range('input', 'A2:A3')
+        output_range = self.manager.select_range('output', 'A4')
+        self.assertTrue(formula_manager.apply_formula('求和', input_range, output_range))
+        self.assertEqual(self.manager.active_sheet.Range('A4').Formula, '=SUM($A$2:$A$3)')
+
+    def test_fill_formula(self):
+        """测试按相对位置填充公式"""
+        formula_manager = FormulaManager()
+        sheet = self.manager.active_sheet
+        input_range = sheet.Range('A2:C2')
+
+        self.assertTrue(formula_manager.apply_formula('求和', input_range, sheet.Range('D2:D3'), fill='block'))
+        self.assertEqual(sheet.Range('D2:D3').Formula, (('=SUM($A$2:$C$2)',), ('=SUM($A$3:$C$3)',)))
+
+        self.assertTrue(formula_manager.apply_formula('求和', input_range, sheet.Range('E2:E3'), fill='r1c1'))
+        self.assertEqual(sheet.Range('E2:E3').Formula, (('=SUM(A2:C2)',), ('=SUM(A3:C3)',)))
+
+    def test_fill_literal_refs(self):
+        """测试模板中写死的A1引用在R1C1填充时与block填充结果相同"""
+        sheet = self.manager.active_sheet
+        template = '=VLOOKUP({range},A:B,2,0)+SUM($B$1:C2,3:4)+COUNTIF({range},"A1")+{output}'
+        render = lambda input_address, output_address: template.format(range=input_address, output=output_address)
+
+        write_formula(sheet.Range('E2:F3'), render, '$A$2', fill='block')
+        write_formula(sheet.Range('G2:H3'), render, '$A$2', fill='r1c1')
+        self.assertEqual(
+            sheet.Range('G3').Formula,
+            '=VLOOKUP(A3,$A:$B,2,0)+SUM($B$1:$C$2,$3:$4)+COUNTIF(A3,"A1")+G3'
+        )
+        # 除输入区域和输出单元格相对平移外，block填充为绝对地址，其余部分一致
+        block = sheet.Range('E3').Formula.replace('$', '')
+        self.assertEqual(block, '=VLOOKUP(A3,A:B,2,0)+SUM(B1:C2,3:4)+COUNTIF(A3,"A1")+E3')
+
+    def test_fill_areas(self):
+        """测试整行、整列和多区域输入的填充，R1C1填充与block填充结果相同"""
+        sheet = self.manager.active_sheet
+        render = lambda input_address, output_address: f'=SUM({input_address})'
+        for input_address, expected in (
+            ('$A:$A', '=SUM(B:B)'),
+            ('$2:$2', '=SUM(3:3)'),
+            ('$A$2:$A$3,$C$2', '=SUM(B3:B4,D3)'),
+        ):
+            write_formula(sheet.Range('E2:F3'), render, input_address, fill='block')
+            write_formula(sheet.Range('G2:H3'), render, input_address, fill='r1c1')
+            self.assertEqual(sheet.Range('H3').Formula, expected)
+            block = tuple(tuple(text.replace('$', '') for text in row) for row in sheet.Range('E2:F3').Formula)
+            self.assertEqual(block, sheet.Range('G2:H3').Formula)
+
+    def test_state_operations(self):
+        """测试状态保存和恢复"""
+        state = self.manager.get_current_state()
+        self.manager.active_sheet.Range('B2:C3').Formula = '=1'
+        self.assertTrue(self.manager.restore_state(state))
+        self.assertEqual(self.manager.active_sheet.Range('B2').Value, 2.0)
+        self.assertEqual(self.manager.active_sheet.Range('C3').Formula, '=SUM(A3:B3)')
+
+    def test_region_state(self):
+        """测试只保存和恢复输出区域"""
+        state = self.manager.get_current_state('$C$3', margin=1)
+        self.assertEqual(state['range'], '$B$2:$D$4')
+
+        sheet = self.manager.active_sheet
+        sheet.Range('C3').Formula = '=1'
+        sheet.Range('A1').Value = 'changed'
+        self.assertTrue(self.manager.restore_state(state))
+        self.assertEqual(sheet.Range('C3').Formula, '=SUM(A3:B3)')
+        # 区域外的修改不受影响
+        self.assertEqual(sheet.Range('A1').Value, 'changed')
+
+    def build_formula_sheet(self):
+        """生成包含共享公式和数组公式的工作簿"""
+        rows = (
+            '<row r="2"><c r="A2"><v>1</v></c><c r="B2"><f t="shared" ref="B2:B4" si="0">A2*2</f><v>2</v></c>'
+            '<c r="C2"><f t="array" ref="C2:C3">A2:A3*3</f><v>3</v></c></row>'
+            '<row r="3"><c r="A3"><v>2</v></c><c r="B3"><f t="shared" si="0"/><v>4</v></c><c r="C3"><v>6</v></c></row>'
+            '<row r="4"><c r="A4"><v>3</v></c><c r="B4"><f t="shared" si="0"/><v>6</v></c></row>'
+        )
+        head, _, tail = SHEET.partition('<sheetData>')
+        build_workbook(self.path, f"{head}<sheetData>{rows}</sheetData>{tail.partition('</sheetData>')[2]}")
+        self.assertTrue(self.manager.open_file(self.path))
+        return self.manager.active_sheet
+
+    def read_sheet_xml(self):
+        with zipfile.ZipFile(self.path) as archive:
+            return archive.read('xl/worksheets/sheet1.xml').decode('utf-8')
+
+    def test_shared_formula_state(self):
+        """测试共享公式的从属单元格按主单元格展开，恢复快照后保留原始XML"""
+        sheet = self.build_formula_sheet()
+        self.assertEqual(sheet.Range('B2:B4').Formula, (('=A2*2',), ('=A3*2',), ('=A4*2',)))
+        self.assertEqual(XlsxStreamReader(self.path).read_state('B2:C4'), self.manager.get_current_state('B2:C4'))
+
+        state = self.manager.get_current_state('$A$3', margin=1)
+        sheet.Range('A3:B4').Value = 0
+        self.assertTrue(self.manager.restore_state(state))
+        self.assertEqual(sheet.Range('B4').Formula, '=A4*2')
+        self.assertTrue(self.manager.save())
+        self.assertIn('<c r="B4"><f t="shared" si="0"/><v>6</v></c>', self.read_sheet_xml())
+
+    def test_overwrite_shared_master(self):
+        """测试覆盖共享公式的主单元格后，下一个单元格成为主单元格"""
+        sheet = self.build_formula_sheet()
+        sheet.Range('B2').Formula = '=1'
+        self.assertTrue(self.manager.save())
+        self.assertIn(
+            '<c r="B3"><f t="shared" ref="B2:B4" si="0">A3*2</f><v>4</v></c>',
+            self.read_sheet_xml()
+        )
+
+        reopened = XlsxManager()
+        self.assertTrue(reopened.open_file(self.path))
+        self.assertEqual(
+            reopened.active_sheet.Range('B2:B4').Formula,
+            (('=1',), ('=A3*2',), ('=A4*2',))
+        )
+
+    def test_overwrite_array_formula(self):
+        """测试不能修改数组公式的一部分"""
+        sheet = self.build_formula_sheet()
+        with self.assertRaises(ValueError):
+            sheet.Range('C3').Formula = '=1'
+        # 写回相同内容不算修改
+        values, formulas = sheet.Range('C2:C3').Value, sheet.Range('C2:C3').Formula
+        sheet.Range('C2:C3').Value = values
+        sheet.Range('C2:C3').Formula = formulas
+        self.assertTrue(self.manager.save())
+
+        sheet.Range('C2').Formula = '=1'
+        self.assertFalse(self.manager.save())
+
+    def test_constant_literals(self):
+        """测试写入Formula的TRUE/FALSE和错误值按Excel的规则转换"""
+        sheet = self.manager.active_sheet
+        sheet.Range('A2:C2').Formula = (('true', '#N/A', 'FALSE1'),)
+        self.assertEqual(sheet.Range('A2:C2').Value, ((True, '#N/A', 'FALSE1'),))
+
+        state = self.manager.get_current_state('A2:C2')
+        sheet.Range('A2:C2').Value = 0
+        self.assertTrue(self.manager.restore_state(state))
+        self.assertIs(sheet.Range('A2').Value, True)
+        self.assertTrue(self.manager.save())
+        sheet_xml = self.read_sheet_xml()
+        self.assertIn('<c r="A2" t="b"><v>1</v></c>', sheet_xml)
+        self.assertIn('<c r="B2" s="1" t="e"><v>#N/A</v></c>', sheet_xml)
+
+    @mock.patch('src.utils.workbook_backend.CHUNK_START_CELLS', 3)
+    def test_chunked_apply(self):
+        """测试分块写入与一次写入的结果相同，并报告进度"""
+        formula_manager = FormulaManager()
+        sheet = self.manager.active_sheet
+        input_range = sheet.Range('A2:C2')
+
+        for fill, column in ((None, 'D'), ('block', 'E'), ('r1c1', 'F')):
+            reports = []
+            self.assertTrue(formula_manager.apply_formula(
+                '求和', input_range, sheet.Range(f'{column}2:{column}11'), fill=fill,
+                chunked=True, progress=lambda done, total, _: reports.append((done, total))
+            ))
+            formula_manager.apply_formula('求和', input_range, sheet.Range('G2:G11'), fill=fill)
+            self.assertEqual(
+                sheet.Range(f'{column}2:{column}11').Formula,
+                sheet.Range('G2:G11').Formula
+            )
+            self.assertGreater(len(reports), 1)
+            self.assertEqual(reports[-1], (10, 10))
+
+    @mock.patch('src.utils.workbook_backend.CHUNK_START_CELLS', 3)
+    def test_chunked_cancel(self):
+        """测试分块写入在下一块之前取消，恢复快照后区域保持原样"""
+        formula_manager = FormulaManager()
+        sheet = self.manager.active_sheet
+        state = self.manager.get_current_state('$D$2:$D$11')
+        reports = []
+        self.assertFalse(formula_manager.apply_formula(
+            '求和', sheet.Range('A2:C2'), sheet.Range('D2:D11'), fill='block',
+            chunked=True,
+            progress=lambda done, total, _: reports.append(done),
+            cancelled=lambda: bool(reports)
+        ))
+        self.assertEqual(reports, [3])
+        self.assertEqual(sheet.Range('D2').Formula, '=SUM($A$2:$C$2)')
+        self.assertEqual(sheet.Range('D5').Formula, '')
+
+        self.assertTrue(self.manager.restore_state(state))
+        self.assertEqual(sheet.Range('D2').Formula, '')
+
+class TestXlsxStreamReader(unittest.TestCase):
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'test.xlsx')
+        build_workbook(self.path)
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_shared_strings(self):
+        """测试共享字符串表，富文本合并且忽略拼音"""
+        xml = (
+            '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            '<si><t>名称</t></si><si><t/></si>'
+            '<si><r><t>富</t></r><r><t>文本</t></r><rPh><t>ふ</t></rPh></si></sst>'
+        )
+        table = SharedStringTable.load(io.BytesIO(xml.encode('utf-8')))
+        self.assertEqual([table[i] for i in range(len(table))], ['名称', '', '富文本'])
+
+        # 偏移量按字符计算，包括BMP以外的字符
+        strings = [f"{'😀' * (i % 3)}字符串{i}" for i in range(5000)]
+        xml = ''.join(f'<si><t>{text}</t></si>' for text in strings)
+        table = SharedStringTable.load(io.BytesIO(f'<sst>{xml}</sst>'.encode('utf-8')))
+        self.assertEqual(len(table), 5000)
+        self.assertEqual([table[i] for i in (0, 1, 2, 4999)], [strings[i] for i in (0, 1, 2, 4999)])
+
+    def test_read_state(self):
+        """测试区域快照与XlsxManager读取的结果一致"""
+        reader = XlsxStreamReader(self.path)
+        self.assertEqual(reader.sheet_names, ['数据'])
+        manager = XlsxManager()
+        self.assertTrue(manager.open_file(self.path))
+        for address in ('A1:C3', 'B2:D4', 'A1'):
+            self.assertEqual(reader.read_state(address), manager.get_current_state(address))
+
+    def test_batches(self):
+        """测试按批返回行，越过最后一行后停止"""
+        rows = ''.join(
+            f'<row r="{row}"><c r="A{row}"><v>{row}</v></c><c r="B{row}" t="s"><v>0</v></c></row>'
+            for row in range(1, 2501)
+        )
+        head, _, tail = SHEET.partition('<sheetData>')
+        build_workbook(self.path, f"{head}<sheetData>{rows}</sheetData>{tail.partition('</sheetData>')[2]}")
+        reader = XlsxStreamReader(self.path)
+
+        batches = list(reader.iter_rows(batch_rows=1000))
+        self.assertEqual([len(batch) for batch in batches], [1000, 1000, 500])
+        row, cells = batches[-1][-1]
+        self.assertEqual((row, cells[1].value, cells[2].value), (2500, 2500, '名称'))
+
+        batches = list(reader.iter_rows(sheet='数据', first_row=11, last_row=20, first_col=2))
+        self.assertEqual([row for row, _ in batches[0]], list(range(11, 21)))
+        self.assertEqual({col for _, cells in batches[0] for col in cells}, {2})
+
+class TestInjectFormulas(unittest.TestCase):
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'test.xlsx')
+        build_workbook(self.path)
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_inject(self):
+        """测试替换和插入公式单元格，其余条目原样复制"""
+        with zipfile.ZipFile(self.path) as archive:
+            before = {info.filename: info for info in archive.infolist()}
+
+        count = inject_formulas(self.path, {'C3': '=A3*B3', 'B2': '=A2+1', 'D2': '=1', '$E$6': '=A1&"x"'}, '数据')
+        self.assertEqual(count, 4)
+
+        with zipfile.ZipFile(self.path) as archive:
+            after = {info.filename: info for info in archive.infolist()}
+            sheet_xml = archive.read('xl/worksheets/sheet1.xml').decode('utf-8')
+            workbook_xml = archive.read('xl/workbook.xml').decode('utf-8')
+            self.assertIsNone(archive.testzip())
+        self.assertNotIn('xl/calcChain.xml', after)
+        self.assertIn('fullCalcOnLoad="1"', workbook_xml)
+        self.assertEqual(after['xl/sharedStrings.xml'].CRC, before['xl/sharedStrings.xml'].CRC)
+        self.assertEqual(after['xl/sharedStrings.xml'].compress_size, before['xl/sharedStrings.xml'].compress_size)
+
+        # 替换时保留样式并清除缓存值，未修改的行保持原样
+        self.assertIn('<c r="B2" s="1"><f>A2+1</f></c><c r="C2"><v>3</v></c><c r="D2"><f>1</f></c>', sheet_xml)
+        self.assertIn('<c r="C3"><f>A3*B3</f></c>', sheet_xml)
+        self.assertIn('<row r="1" spans="1:3"><c r="A1" t="s"><v>0</v></c></row>', sheet_xml)
+        self.assertIn('<row r="6"><c r="E6"><f>A1&amp;"x"</f></c></row></sheetData>', sheet_xml)
+        self.assertIn('<dimension ref="A1:E6"/>', sheet_xml)
+
+        manager = XlsxManager()
+        self.assertTrue(manager.open_file(self.path))
+        sheet = manager.active_sheet
+        self.assertEqual(sheet.Range('B2:E2').Formula, (('=A2+1', '3', '=1', ''),))
+        self.assertEqual(sheet.Range('E6').Formula, '=A1&"x"')
+        self.assertEqual(sheet.Range('A3').Value, 4.0)
+
+    def test_shared_formula(self):
+        """测试不覆盖共享公式的主单元格"""
+        build_workbook(self.path, SHEET.replace('<f>SUM(A3:B3)</f>', '<f t="shared" ref="C3:C4" si="0">SUM(A3:B3)</f>'))
+        with self.assertRaises(ValueError):
+            inject_formulas(self.path, {'C3': '=1'})
+
+    def test_array_formula(self):
+        """测试不向数组公式区域内的其余单元格写入公式"""
+        build_workbook(self.path, SHEET.replace(
+            '<c r="C3"><f>SUM(A3:B3)</f><v>9</v></c>',
+            '<c r="C3"><f t="array" ref="C3:D4">A3:B4*2</f><v>8</v></c><c r="D3"><v>10</v></c>'
+        ))
+        for address in ('D3', 'C4', '$D$4'):
+            with self.assertRaises(ValueError):
+                inject_formulas(self.path, {'E2': '=1', address: '=1'})
+        self.assertEqual(inject_formulas(self.path, {'E3': '=1', 'B4': '=2'}), 2)
+
+    def test_formula_manager_inject(self):
+        """测试通过FormulaManager按公式名称写入文件"""
+        formula_manager = FormulaManager()
+        self.assertTrue(formula_manager.inject_formula('求和', self.path, '$A$2:$A$3', 'A4'))
+        self.assertFalse(formula_manager.inject_formula('不存在', self.path, 'A1', 'A4'))
+        manager = XlsxManager()
+        self.assertTrue(manager.open_file(self.path))
+        self.assertEqual(manager.active_sheet.Range('A4').Formula, '=SUM($A$2:$A$3)')
+
+class Unseekable(io.RawIOBase):
+    """不能定位的输出流，zipfile会为每个条目写入数据描述符"""
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+class TestRewriteParts(unittest.TestCase):
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'test.xlsx')
+        self.parts = {
+            '[Content_Types].xml': CONTENT_TYPES,
+            'xl/workbook.xml': WORKBOOK,
+            'xl/_rels/workbook.xml.rels': WORKBOOK_RELS,
+            'xl/sharedStrings.xml': SHARED_STRINGS,
+            'xl/worksheets/sheet1.xml': SHEET,
+            '附件/说明.txt': '中文文件名'
+        }
+
+    def tearDown(self):
+        """测试后清理"""
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def check_rewrite(self):
+        """替换工作表部件，其余条目内容不变且压缩后的数据原样复制"""
+        with zipfile.ZipFile(self.path) as archive:
+            before = {info.filename: info for info in archive.infolist()}
+        rewrite_parts(self.path, {'xl/worksheets/sheet1.xml': b'<worksheet/>'})
+
+        with zipfile.ZipFile(self.path) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual([info.filename for info in archive.infolist()], list(self.parts))
+            for name, text in self.parts.items():
+                expected = b'<worksheet/>' if name == 'xl/worksheets/sheet1.xml' else text.encode('utf-8')
+                self.assertEqual(archive.read(name), expected)
+            for info in archive.infolist():
+                self.assertFalse(info.flag_bits & zip_writer.FLAG_DATA_DESCRIPTOR)
+                if info.filename != 'xl/worksheets/sheet1.xml':
+                    self.assertEqual(info.compress_size, before[info.filename].compress_size)
+                    self.assertEqual(info.CRC, before[info.filename].CRC)
+
+    def test_data_descriptor(self):
+        """测试复制带数据描述符的条目"""
+        stream = Unseekable()
+        with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name, text in self.parts.items():
+                archive.writestr(name, text)
+        with open(self.path, 'wb') as f:
+            f.write(stream.buffer.getvalue())
+        with zipfile.ZipFile(self.path) as archive:
+            self.assertTrue(all(info.flag_bits & zip_writer.FLAG_DATA_DESCRIPTOR for info in archive.infolist()))
+        self.check_rewrite()
+
+    def test_zip64_source(self):
+        """测试复制本地文件头带zip64扩展字段的条目"""
+        with zipfile.ZipFile(self.path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name, text in self.parts.items():
+                with archive.open(name, 'w', force_zip64=True) as f:
+                    f.write(text.encode('utf-8'))
+        self.check_rewrite()
+
+    def test_zip64_output(self):
+        """测试大小、偏移量和条目数超出限制时写入zip64字段和结束记录"""
+        build_workbook(self.path)
+        with zipfile.ZipFile(self.path, 'a') as archive:
+            archive.writestr('附件/说明.txt', self.parts['附件/说明.txt'])
+        with mock.patch.object(zip_writer, 'ZIP64_LIMIT', 1), \
+                mock.patch.object(zip_writer, 'ZIP64_COUNT_LIMIT', 1):
+            rewrite_parts(self.path, {'xl/worksheets/sheet1.xml': b'<worksheet/>'}, recalc=True)
+
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        self.assertIn(zip_writer.ZIP64_END_RECORD_SIGNATURE.to_bytes(4, 'little'), data)
+        with zipfile.ZipFile(self.path) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertNotIn('xl/calcChain.xml', archive.namelist())
+            self.assertEqual(archive.read('xl/worksheets/sheet1.xml'), b'<worksheet/>')
+            self.assertEqual(archive.read('附件/说明.txt').decode('utf-8'), '中文文件名')
+            self.assertIn(b'fullCalcOnLoad="1"', archive.read('xl/workbook.xml'))
+
+class TestRangeAddress(unittest.TestCase):
+    def test_parse(self):
+        """测试地址解析"""
+        self.assertEqual(parse_range('Sheet1!$B$2:$A$10'), (2, 1, 10, 2))
+        self.assertEqual(parse_range('AA3'), (3, 27, 3, 27))
+        self.assertEqual(parse_range('$A$1:$A$3,$C$5'), (1, 1, 5, 3))
+        self.assertEqual(parse_range('$B:$B'), (1, 2, 1048576, 2))
+
+    def test_shift(self):
+        """测试平移区域，整行/整列只平移一个方向，多区域分别平移"""
+        self.assertEqual(shift_range('$A$1:$B$2', 1, 2), '$C$2:$D$3')
+        self.assertEqual(shift_range('$A:$B', 1, 2), '$C:$D')
+        self.assertEqual(shift_range('$2:$3', 1, 2), '$3:$4')
+        self.assertEqual(shift_range('$A$1:$A$2,$C$1', 1, 0), '$A$2:$A$3,$C$2')
+        self.assertEqual(shift_range('Sheet1!$A$1', 0, 1), 'Sheet1!$B$1')
+        with self.assertRaises(ValueError):
+            shift_range('$A$1048576', 1, 0)
+        with self.assertRaises(ValueError):
+            shift_range('$A$1:3', 1, 0)
+
+    def test_r1c1(self):
+        """测试R1C1转换"""
+        self.assertEqual(to_r1c1('$A$2:$C$2', 2, 4), 'RC[-3]:RC[-1]')
+        self.assertEqual(to_r1c1('$A:$B', 2, 2), 'C[-1]:C')
+        self.assertEqual(to_r1c1('$3:$3', 2, 2), 'R[1]:R[1]')
+        self.assertEqual(to_r1c1('$A$1:$A$2,$C$1', 2, 2), 'R[-1]C[-1]:RC[-1],R[-1]C[1]')
+        self.assertEqual(r1c1_to_a1('=SUM(RC[-3]:RC[-1])', 5, 4), '=SUM(A5:C5)')
+        self.assertEqual(r1c1_to_a1('=SEARCH("RC",R1C1)', 5, 4), '=SEARCH("RC",$A$1)')
+        self.assertEqual(r1c1_to_a1('=SUM(C1:C[1],R[-1]:R3)', 5, 4), '=SUM($A:E,4:$3)')
+        self.assertEqual(
+            a1_to_absolute_r1c1('=VLOOKUP(A1,$A:B,2,0)+SUM(3:$4)+\'Q1\'!B2+LOG10(2)&"C3"'),
+            '=VLOOKUP(R1C1,C1:C2,2,0)+SUM(R3:R4)+\'Q1\'!R2C2+LOG10(2)&"C3"'
+        )
+
+if __name__ == '__main__':
+    unittest.main()